@@ -1,3 +1,4 @@
 from .geo import *
 from .tool import *
+from .batch import *
 from .live import *
@@ -2,6 +2,10 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from flood_tool.fetch import read_csv
+from flood_tool.httpcache import HTTPCache
+from flood_tool.archive import ReadingsArchive
+from flood_tool.rainfall import summarise_rainfall
 
 
 __all__  = []
@@ -16,11 +20,11 @@ ARCHIVE_URL = "http://environment.data.gov.uk/flood-monitoring/archive/"
 # DataF_history = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/archive/readings-2019-10-06.csv')
 
 date = input("Please input the date(YYYY-MM-DD):")
-DataF_history = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/archive/readings-full-'+date+'.csv')
-history = DataF_history.loc[DataF_history.parameter == 'rainfall']
-h_data = history.loc[:,['dateTime','stationReference','value']]
+cache = HTTPCache()
+# rainfall readings of the day, from the local archive, downloading the day if needed
+h_data = ReadingsArchive().read(date).astype({'stationReference': str})
 # h_data
-DataF_station = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations.csv?parameter=rainfall')
+DataF_station = read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations.csv?parameter=rainfall', cache=cache)
 station = DataF_station.loc[:, ['stationReference', 'lat', 'long','easting', 'northing']]#latitude longitude
 DataF_R4 = pd.merge(h_data, station, on = ['stationReference'])
 DataF_R4.value = pd.to_numeric(DataF_R4.value,errors='coerce')
@@ -90,43 +94,14 @@ if sel == '1' or sel == '2':
         print('Input not valid!!')
 
 elif sel == '3':
-    DataF_R4.dateTime = pd.to_datetime(DataF_R4.dateTime)
-    station_mean = DataF_R4.groupby('stationReference').value.mean()
-    # station_mean
-    DataF_mean1 = DataF_R4.sort_values("value",inplace=True,ascending=False)
-    DataF_mean1 = DataF_R4[0:5]
-    stationR = DataF_mean1.stationReference
-    data_mean = DataF_mean1.stationReference.iloc[0]
-    
-    print("The highest average rainfall occurred in "+data_mean+" station")
-    
-
-
-    DataF_R4.groupby('dateTime').value.mean()
-    DataF_R4.sort_values("value",inplace=True,ascending=False)
-    DataF_mean1 = DataF_R4[0:5]
-    dateT = DataF_mean1.dateTime
-    data_max = DataF_mean1.dateTime.iloc[0]
-    print("The highest average rainfall occurred in "+str(data_max))
-    
-
-    DataF_R4.groupby('stationReference').value.max()
-    DataF_R4.sort_values("value",inplace=True,ascending=False)
-    DataF_max = DataF_R4[0:5]
-    stationR = DataF_max.stationReference
-    data_max0 = DataF_max.stationReference.iloc[0]
-    print("The highest instantaneous rainfall occurred in "+data_max0+" station")
-
-    DataF_R4.groupby('dateTime').value.max()
-    DataF_R4.sort_values("value",inplace=True,ascending=False)
-    DataF_max1 = DataF_R4[0:5]
-    dateT1 = DataF_max1.dateTime
-    data_max1 = DataF_max1.dateTime.iloc[0]
-    print("The highest instantaneous rainfall occurred in "+str(data_max1))
-    
-    DataF_R4.groupby('stationReference').value.mean()
-    DataF_R4.sort_values("dateTime",inplace=True,ascending=True)
-    data = DataF_R4.loc[DataF_R4.stationReference==data_mean]
+    summary = summarise_rainfall(DataF_R4)
+    data_mean = summary['highest_mean_station']
+    print("The highest average rainfall occurred in "+str(data_mean)+" station")
+    print("The highest average rainfall occurred in "+str(summary['peak_time']))
+    print("The highest instantaneous rainfall occurred in "+str(summary['highest_station'])+" station")
+    print("The highest instantaneous rainfall occurred in "+str(summary['highest_time']))
+
+    data = DataF_R4.loc[DataF_R4.stationReference==data_mean].sort_values("dateTime")
     dateTime = data.dateTime
     value = data.value
     
@@ -1,15 +1,18 @@
 import numpy as np 
 import pandas as pd 
 import matplotlib.pyplot as plt
+from flood_tool.fetch import read_csv
+from flood_tool.httpcache import HTTPCache
+from flood_tool.archive import ReadingsArchive
 import os
 
 date = input("Please input the date (must be from 2019 to date) (YYYY-MM-DD):")
 print("Loading data...")
-DataF_history = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/archive/readings-full-'+str(date)+'.csv')
-history = DataF_history.loc[DataF_history.parameter == 'rainfall']
-h_data = history.loc[:,['dateTime','stationReference','value']]
+cache = HTTPCache()
+# rainfall readings of the day, from the local archive, downloading the day if needed
+h_data = ReadingsArchive().read(date).astype({'stationReference': str})
 
-DataF_station = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations.csv?parameter=rainfall')
+DataF_station = read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations.csv?parameter=rainfall', cache=cache)
 station = DataF_station.loc[:, ['stationReference', 'lat', 'long','easting', 'northing']]#latitude longitude
 DataF_R4 = pd.merge(h_data, station, on = ['stationReference'])
 DataF_R4.value = pd.to_numeric(DataF_R4.value,errors='coerce')
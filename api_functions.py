@@ -0,0 +1,135 @@
+"""Flood warnings for lists of postcodes, from live rainfall readings."""
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from . import geo
+from .fetch import Fetcher
+from .live import LIVE_URL, get_station_readings
+from .stations import StationCatalogue
+
+__all__ = ['get_flood_warning', 'get_flood_warning_async', 'rainfall_near', 'flood_warnings']
+
+# Rainfall in mm above which, with one of these probability bands, a postcode is warned
+WARNING_RAINFALL = 0.3
+WARNING_BANDS = ('Medium', 'High')
+
+
+def rainfall_near(catalogue, easting, northing, station_rainfall, radius=10000.):
+    """Get the highest rainfall of the stations near each of several locations.
+
+    Parameters
+    ----------
+
+    catalogue: stations.StationCatalogue
+        The rainfall stations.
+    easting, northing: numpy.ndarray of floats
+        OS eastings and northings of the locations.
+    station_rainfall: numpy.ndarray of floats
+        Rainfall of each station in the catalogue, NaN where unknown.
+    radius: float, optional
+        Distance in metres within which stations count.
+
+    Returns
+    -------
+
+    numpy.ndarray of floats
+        Highest rainfall of the stations within `radius` of each location, 0
+        where there are none with readings.
+    """
+    location, station, _ = catalogue.within(easting, northing, radius)
+    result = np.zeros(len(np.asarray(easting).reshape(-1)))
+    rain = np.asarray(station_rainfall, dtype=np.float64)[station]
+    known = ~np.isnan(rain)
+    np.maximum.at(result, location[known], rain[known])
+    return result
+
+
+def flood_warnings(rainfall, probability, threshold=WARNING_RAINFALL, bands=WARNING_BANDS):
+    """Warn of flooding where rainfall is over a threshold in the higher probability bands.
+
+    Returns
+    -------
+
+    numpy.ndarray of ints
+        1 for each location warned of flooding, 0 otherwise.
+    """
+    rainfall = np.asarray(rainfall, dtype=np.float64)
+    return ((rainfall > threshold) & np.isin(np.asarray(probability, dtype=object), bands)).astype(int)
+
+
+async def _station_rainfall(fetcher, catalogue, stations, url):
+    """Get the highest recent reading of some stations, fetching each one once."""
+    rainfall = np.full(len(catalogue), np.nan)
+    readings = await get_station_readings(fetcher, catalogue.references[stations], url,
+                                          return_exceptions=True)
+    for station, frame in zip(stations, readings):
+        if isinstance(frame, Exception) or 'value' not in frame or len(frame) == 0:
+            continue
+        rainfall[station] = pd.to_numeric(frame['value'], errors='coerce').max()
+    return rainfall
+
+
+async def get_flood_warning_async(data, fetcher, catalogue=None, radius=10000.,
+                                  threshold=WARNING_RAINFALL, url=LIVE_URL):
+    """Add recent rainfall and flood warnings to a table of postcodes.
+
+    See `get_flood_warning`, which runs this from code not already running asyncio.
+    """
+    if catalogue is None:
+        catalogue = await StationCatalogue.fetch_async(fetcher, 'rainfall', url)
+    if 'Easting' in data and 'Northing' in data:
+        easting, northing = np.asarray(data.Easting, float), np.asarray(data.Northing, float)
+    else:
+        easting, northing = geo.get_easting_northing_from_lat_long(np.asarray(data.Latitude, float),
+                                                                   np.asarray(data.Longitude, float))
+
+    # each station near any postcode is fetched once, however many postcodes it is near
+    _, station, _ = catalogue.within(easting, northing, radius)
+    station_rainfall = await _station_rainfall(fetcher, catalogue, np.unique(station), url)
+
+    data = data.copy()
+    data['Rainfall'] = rainfall_near(catalogue, easting, northing, station_rainfall, radius)
+    data['Flood_warning'] = flood_warnings(data['Rainfall'], data['Probability'], threshold)
+    return data
+
+
+def get_flood_warning(data, radius=10000., threshold=WARNING_RAINFALL, cache=None, catalogue=None,
+                      url=LIVE_URL, **options):
+    """Add recent rainfall and flood warnings to a table of postcodes.
+
+    The rainfall of a postcode is the highest recent reading of the rainfall
+    stations within `radius` of it. Postcodes with rainfall over `threshold`
+    in the 'Medium' or 'High' probability bands are warned. Readings are
+    fetched concurrently, once for each station near any of the postcodes.
+
+    Parameters
+    ----------
+
+    data: pandas.DataFrame
+        Postcodes, with `Probability` band and either `Easting` and `Northing`
+        or `Latitude` and `Longitude` columns.
+    radius: float, optional
+        Distance in metres within which stations count.
+    threshold: float, optional
+        Rainfall in mm over which to warn.
+    cache: httpcache.HTTPCache, optional
+        Cache of responses, so the station catalogue is downloaded once a day.
+    catalogue: stations.StationCatalogue, optional
+        Rainfall stations, by default fetched from the API.
+    url: str, optional
+        URL of the stations endpoint.
+    options:
+        Other options for the `fetch.Fetcher`, such as `concurrency`.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        A copy of `data` with `Rainfall` (mm) and `Flood_warning` (1 or 0) columns.
+    """
+    async def run():
+        async with Fetcher(cache=cache, **options) as fetcher:
+            return await get_flood_warning_async(data, fetcher, catalogue, radius, threshold, url)
+    return asyncio.run(run())
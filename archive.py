@@ -0,0 +1,274 @@
+"""Local date partitioned store of archived Environment Agency readings."""
+import asyncio
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .fetch import Fetcher
+from .live import ARCHIVE_URL
+from .store import CACHE_DIRECTORY, load_arrays, read_metadata, save_arrays
+
+__all__ = ['ReadingsArchive']
+
+# Columns of the readings-full files kept by the archive
+SOURCE_COLUMNS = ['dateTime', 'stationReference', 'parameter', 'value']
+
+
+def _date_range(start, end):
+    """List the dates from `start` to `end` inclusive, as `datetime.date`s."""
+    start, end = pd.Timestamp(start).date(), pd.Timestamp(end).date()
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class _Partition(object):
+    """Readings of one parameter on one day, gathered chunk by chunk."""
+
+    def __init__(self):
+        self.ids = {}
+        self.station, self.time, self.value = [], [], []
+
+    def add(self, references, seconds, values):
+        """Add readings, with station references as a categorical Series.
+
+        Readings without a station reference are dropped.
+        """
+        categories = references.cat.categories
+        lookup = np.array([self.ids.setdefault(c, len(self.ids)) for c in categories],
+                          dtype=np.int32)
+        codes = references.cat.codes.values
+        # a missing reference has code -1, which would index the last station
+        known = codes >= 0
+        if not known.all():
+            codes, seconds, values = codes[known], seconds[known], values[known]
+        self.station.append(lookup[codes])
+        self.time.append(seconds)
+        self.value.append(values)
+
+    def arrays(self):
+        """Get the columns, with stations coded by position in the sorted station references."""
+        stations = np.array(list(self.ids), dtype=str)
+        order = np.argsort(stations)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        return {'stations': stations[order],
+                'station': rank[np.concatenate(self.station or [np.empty(0, np.int32)])],
+                'time': np.concatenate(self.time or [np.empty(0, np.int32)]),
+                'value': np.concatenate(self.value or [np.empty(0, np.float32)])}
+
+
+class ReadingsArchive(object):
+    """Date partitioned local copy of the daily `readings-full` archive files.
+
+    Each daily file is downloaded once and read in chunks, keeping only the
+    readings of the chosen parameters. Each day and parameter is saved as a
+    partition of columns:
+
+    - `station`: int32 position of the station in `stations`, the sorted station references
+    - `time`: int32 seconds since the start of the day (UTC)
+    - `value`: float32 reading, NaN where the archive holds no single number
+
+    Partitions are memory mapped when read, so analyses only load the days
+    and columns they use. Partitions are saved atomically, so an interrupted
+    `backfill` resumes where it stopped.
+    """
+
+    def __init__(self, directory=None, parameters=('rainfall',), url=ARCHIVE_URL):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            Directory holding the archive, by default next to the `Tool` resource
+            files, in `flood_tool/resources/.flood_tool_cache/readings`.
+        parameters : sequence of strs, optional
+            Measured parameters to keep, such as 'rainfall' or 'level'.
+        url : str, optional
+            URL of the directory of archive files.
+        """
+        if directory is None:
+            directory = os.path.join(os.getcwd(), 'flood_tool', 'resources', CACHE_DIRECTORY, 'readings')
+        self.directory = directory
+        self.parameters = list(parameters)
+        self.url = url
+
+    def source_url(self, date):
+        """URL of the archive file of a day."""
+        return '%sreadings-full-%s.csv' % (self.url, pd.Timestamp(date).date().isoformat())
+
+    def path(self, date, parameter='rainfall'):
+        """Directory of the partition of a parameter on a day."""
+        return os.path.join(self.directory, parameter, pd.Timestamp(date).date().isoformat())
+
+    def has(self, date):
+        """Whether all parameters of a day are in the archive."""
+        return all(read_metadata(self.path(date, parameter)) is not None
+                   for parameter in self.parameters)
+
+    def dates(self, parameter='rainfall'):
+        """List the days of a parameter in the archive, in order, as `datetime.date`s."""
+        try:
+            names = os.listdir(os.path.join(self.directory, parameter))
+        except OSError:
+            return []
+        dates = []
+        for name in sorted(names):
+            if not name.startswith('.') and read_metadata(os.path.join(self.directory, parameter, name)):
+                dates.append(datetime.date.fromisoformat(name))
+        return dates
+
+    def ingest(self, date, source, chunk_size=2**20):
+        """Add a day to the archive from a `readings-full` .csv file.
+
+        The file is read `chunk_size` rows at a time, so memory use is bounded by
+        the chunk size and the readings kept, not the size of the file.
+
+        Parameters
+        ----------
+
+        date: str or date
+            The day the file holds readings for.
+        source: str or file
+            Filename, URL or open file of the .csv file.
+        chunk_size: int, optional
+            Number of rows to parse at a time.
+
+        Returns
+        -------
+
+        dict
+            Number of readings kept for each parameter.
+        """
+        day = pd.Timestamp(date).tz_localize('UTC')
+        partitions = {parameter: _Partition() for parameter in self.parameters}
+        chunks = pd.read_csv(source, usecols=SOURCE_COLUMNS, chunksize=chunk_size,
+                             dtype={'dateTime': str, 'stationReference': 'category',
+                                    'parameter': 'category', 'value': str})
+        for chunk in chunks:
+            for parameter, partition in partitions.items():
+                rows = chunk[(chunk.parameter == parameter).values]
+                if len(rows) == 0:
+                    continue
+                times = pd.to_datetime(rows.dateTime, utc=True, format='ISO8601')
+                seconds = ((times - day).dt.total_seconds()).values.astype(np.int32)
+                values = pd.to_numeric(rows.value, errors='coerce').values.astype(np.float32)
+                partition.add(rows.stationReference, seconds, values)
+        counts = {}
+        for parameter, partition in partitions.items():
+            arrays = partition.arrays()
+            counts[parameter] = len(arrays['value'])
+            save_arrays(arrays, self.path(date, parameter),
+                        {'date': day.date().isoformat(), 'parameter': parameter})
+        return counts
+
+    async def _fetch_day(self, fetcher, date, chunk_size):
+        """Download a day's file, then read it into the archive in a worker thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.csv', dir=self.directory)
+        os.close(fd)
+        try:
+            await fetcher.download(self.source_url(date), path)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.ingest, date, path, chunk_size)
+        finally:
+            os.remove(path)
+
+    async def backfill_async(self, fetcher, start, end, force=False, chunk_size=2**20,
+                             return_exceptions=False):
+        """Add the days from `start` to `end` inclusive to the archive, concurrently.
+
+        See `backfill`, which runs this from code not already running asyncio.
+        """
+        days = [date for date in _date_range(start, end) if force or not self.has(date)]
+        results = await asyncio.gather(*(self._fetch_day(fetcher, date, chunk_size) for date in days),
+                                       return_exceptions=return_exceptions)
+        return dict(zip(days, results))
+
+    def backfill(self, start, end, concurrency=4, force=False, chunk_size=2**20, **options):
+        """Add the days from `start` to `end` inclusive to the archive.
+
+        Days already in the archive are skipped, so an interrupted backfill
+        picks up where it stopped. Up to `concurrency` days are downloaded
+        and read at once. Days whose download fails are left out and
+        reported, and are tried again by the next backfill.
+
+        Parameters
+        ----------
+
+        start, end: str or date
+            First and last days to add.
+        concurrency: int, optional
+            Number of days to download at once.
+        force: bool, optional
+            Download and replace days already in the archive.
+        chunk_size: int, optional
+            Number of rows to parse at a time.
+        options:
+            Other options for the `fetch.Fetcher`, such as `timeout`.
+
+        Returns
+        -------
+
+        dict
+            For each day added or attempted, the number of readings kept for each
+            parameter, or the exception raised fetching it.
+        """
+        async def run():
+            async with Fetcher(concurrency=concurrency, **options) as fetcher:
+                return await self.backfill_async(fetcher, start, end, force, chunk_size,
+                                                 return_exceptions=True)
+        return asyncio.run(run())
+
+    def partition(self, date, parameter='rainfall', mmap=True):
+        """Load the columns of a partition, memory mapped, as a dict of arrays.
+
+        Raises `OSError` if the day isn't in the archive.
+        """
+        return load_arrays(self.path(date, parameter), mmap)
+
+    def partitions(self, start, end, parameter='rainfall', mmap=True):
+        """Iterate over (date, columns) for the days from `start` to `end` inclusive in the archive."""
+        for date in _date_range(start, end):
+            if read_metadata(self.path(date, parameter)) is not None:
+                yield date, self.partition(date, parameter, mmap)
+
+    def read(self, date, parameter='rainfall', columns=('dateTime', 'stationReference', 'value'),
+             fetch=True):
+        """Read the readings of a parameter on a day as a DataFrame.
+
+        Parameters
+        ----------
+
+        date: str or date
+            The day to read.
+        parameter: str, optional
+            The measured parameter.
+        columns: sequence of strs, optional
+            Columns to read, from `dateTime`, `stationReference` and `value`.
+        fetch: bool, optional
+            Add the day to the archive first if it isn't there yet.
+
+        Returns
+        -------
+
+        pandas.DataFrame
+            One row per reading, with `stationReference` as a categorical column.
+        """
+        if fetch and read_metadata(self.path(date, parameter)) is None:
+            result = self.backfill(date, date).get(pd.Timestamp(date).date())
+            if isinstance(result, Exception):
+                raise result
+        arrays = self.partition(date, parameter)
+        frame = {}
+        for column in columns:
+            if column == 'dateTime':
+                frame[column] = (pd.Timestamp(date).tz_localize('UTC')
+                                 + pd.to_timedelta(arrays['time'], unit='s'))
+            elif column == 'stationReference':
+                frame[column] = pd.Categorical.from_codes(arrays['station'], arrays['stations'])
+            elif column == 'value':
+                frame[column] = arrays['value']
+            else:
+                raise KeyError(column)
+        return pd.DataFrame(frame, columns=list(columns))
@@ -0,0 +1,176 @@
+"""Streaming scoring of postcode files too large to hold in memory."""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .store import save_arrays, load_arrays
+from .tool import PROBABILITY_BANDS
+
+__all__ = ['read_postcode_chunks', 'score_postcode_file']
+
+OUTPUT_COLUMNS = ['Postcode', 'Probability Band', 'Flood Risk']
+
+
+def read_postcode_chunks(input_file, postcode_column='Postcode', chunk_size=2**18):
+    """Read the postcode column of a .csv file in chunks.
+
+    Parameters
+    ----------
+
+    input_file: str or file-like
+        The .csv file to read, with a header row.
+    postcode_column: str, optional
+        Name of the column holding postcodes. Other columns are not parsed.
+    chunk_size: int, optional
+        Number of rows read at a time.
+
+    Returns
+    -------
+
+    iterator of numpy.ndarray of strs
+        Postcodes in file order, at most `chunk_size` at a time.
+    """
+    reader = pd.read_csv(input_file, usecols=[postcode_column], dtype=str,
+                         keep_default_na=False, chunksize=chunk_size)
+    for chunk in reader:
+        yield chunk[postcode_column].to_numpy(dtype=str)
+
+
+def _score_chunk(tool, postcodes, unique):
+    """Score one chunk of postcodes, dropping invalid postcodes and, if `unique`, duplicates."""
+    if unique:
+        postcodes, positions = tool._unique_valid_postcodes(postcodes)
+    else:
+        postcodes, positions = tool.lookup_postcodes(postcodes)
+        valid = positions >= 0
+        postcodes, positions = postcodes[valid], positions[valid]
+    ranks = tool._band_ranks(positions)
+    return postcodes, ranks, tool._flood_risk(positions, ranks)
+
+
+def _write_rows(f, postcodes, ranks, risk, header):
+    """Append scored rows to an open .csv file."""
+    pd.DataFrame({'Postcode': postcodes,
+                  'Probability Band': np.array(PROBABILITY_BANDS)[ranks],
+                  'Flood Risk': risk}, columns=OUTPUT_COLUMNS).to_csv(f, header=header, index=False)
+
+
+def _sort_run(postcodes, ranks, risk):
+    """Order scored rows by descending risk, then postcode."""
+    order = np.lexsort((postcodes, -risk))
+    return {'postcode': postcodes[order], 'rank': ranks[order], 'risk': risk[order]}
+
+
+def _merge_runs(runs, block_size):
+    """Merge runs sorted by `_sort_run` into sorted blocks, dropping repeated postcodes.
+
+    Each step reads the next `block_size` rows of every run and emits all rows
+    up to the smallest last key read from a run that isn't finished, since no
+    unread row can come before it.
+    """
+    offsets = [0]*len(runs)
+    last_postcode = None
+    while any(offset < len(run['risk']) for offset, run in zip(offsets, runs)):
+        windows = [{name: values[offset:offset+block_size] for name, values in run.items()}
+                   for offset, run in zip(offsets, runs)]
+
+        # smallest last key of the runs with rows left after their window
+        bound = None
+        for offset, run, window in zip(offsets, runs, windows):
+            if offset + block_size < len(run['risk']):
+                key = (-window['risk'][-1], window['postcode'][-1])
+                bound = key if bound is None or key < bound else bound
+
+        parts = []
+        for i, window in enumerate(windows):
+            if bound is None:
+                count = len(window['risk'])
+            else:
+                risk, postcode = -bound[0], bound[1]
+                count = np.count_nonzero((window['risk'] > risk)
+                                         | ((window['risk'] == risk) & (window['postcode'] <= postcode)))
+            offsets[i] += count
+            parts.append({name: values[:count] for name, values in window.items()})
+
+        block = _sort_run(*(np.concatenate([part[name] for part in parts])
+                            for name in ('postcode', 'rank', 'risk')))
+        # equal postcodes have equal risks, so repeats are adjacent
+        keep = np.ones(len(block['postcode']), dtype=bool)
+        keep[1:] = block['postcode'][1:] != block['postcode'][:-1]
+        if len(keep) and last_postcode is not None:
+            keep[0] = block['postcode'][0] != last_postcode
+        if len(keep):
+            last_postcode = block['postcode'][-1]
+        yield block['postcode'][keep], block['rank'][keep], block['risk'][keep]
+
+
+def score_postcode_file(tool, input_file, output_file, postcode_column='Postcode', sort=True,
+                        chunk_size=2**18, temp_directory=None):
+    """Score a .csv file of postcodes chunk by chunk, writing a .csv file of results.
+
+    Memory use is bounded by `chunk_size`, whatever the size of the file. Each
+    chunk is normalised, looked up and scored as in `Tool.get_sorted_annual_flood_risk`.
+
+    With `sort`, the output matches `Tool.get_sorted_annual_flood_risk` on the whole
+    file: invalid postcodes and duplicates are removed and rows are ordered by
+    flood risk, then postcode. Each chunk is sorted into a run kept in
+    `temp_directory`, and the runs are merged once the input is read. Without
+    `sort`, rows are written as they are scored, in input order, with invalid
+    postcodes removed but duplicates kept.
+
+    Parameters
+    ----------
+
+    tool: Tool
+        Tool holding the postcode, flood risk and property value data.
+    input_file: str or file-like
+        The .csv file of postcodes to score, with a header row.
+    output_file: str
+        Filename of the .csv file to write, with columns `Postcode`, `Probability Band`
+        and `Flood Risk`.
+    postcode_column: str, optional
+        Name of the input column holding postcodes.
+    sort: bool, optional
+        Deduplicate and sort the output, as `Tool.get_sorted_annual_flood_risk` does.
+    chunk_size: int, optional
+        Number of rows scored at a time.
+    temp_directory: str, optional
+        Directory to hold sorted runs, instead of the system temporary directory.
+
+    Returns
+    -------
+
+    int
+        Number of rows written.
+    """
+    chunks = read_postcode_chunks(input_file, postcode_column, chunk_size)
+    rows = 0
+    with open(output_file, 'w', newline='') as f:
+        if not sort:
+            _write_rows(f, [], np.zeros(0, dtype=np.intp), [], True)
+            for postcodes in chunks:
+                postcodes, ranks, risk = _score_chunk(tool, postcodes, unique=False)
+                _write_rows(f, postcodes, ranks, risk, False)
+                rows += len(postcodes)
+            return rows
+
+        directory = tempfile.mkdtemp(prefix='flood_tool_runs-', dir=temp_directory)
+        runs = []
+        try:
+            for i, postcodes in enumerate(chunks):
+                path = os.path.join(directory, '%d' % i)
+                save_arrays(_sort_run(*_score_chunk(tool, postcodes, unique=True)), path)
+                runs.append(load_arrays(path))
+
+            _write_rows(f, [], np.zeros(0, dtype=np.intp), [], True)
+            for postcodes, ranks, risk in _merge_runs(runs, max(chunk_size//max(len(runs), 1), 1)):
+                _write_rows(f, postcodes, ranks, risk, False)
+                rows += len(postcodes)
+        finally:
+            # drop the memory maps before removing their files
+            runs.clear()
+            shutil.rmtree(directory, ignore_errors=True)
+    return rows
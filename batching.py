@@ -0,0 +1,228 @@
+"""Coalescing of many small concurrent `Tool` queries into few vectorized ones."""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .tool import _sorted_probability_frame, _sorted_risk_frame, normalise_postcodes
+
+__all__ = ['BatchingTool']
+
+
+class _Request(object):
+    """A caller's query waiting to be answered as part of a batch."""
+
+    def __init__(self, kind, arrays):
+        self.kind = kind
+        self.arrays = [np.asarray(a).reshape(-1) for a in arrays]
+        self.size = len(self.arrays[0])
+        self.future = Future()
+
+
+def _split(result, requests):
+    """Split the rows of a batch result into each request's part."""
+    bounds = np.cumsum([request.size for request in requests])[:-1]
+    return np.split(result, bounds)
+
+
+class BatchingTool(object):
+    """Answers `Tool` queries from many threads or coroutines in shared batches.
+
+    Queries arriving within `max_delay` seconds of each other, up to
+    `max_batch` postcodes or locations, are concatenated and answered by one
+    vectorized call to the tool, then split back out to their callers. This
+    saves the fixed cost of each call (normalisation, lookups, building
+    DataFrames) when many callers each ask about one or two postcodes. A
+    longer delay or larger batch gives more throughput under load at the
+    cost of latency; with `max_delay=0` queries are batched only while the
+    previous batch is being answered.
+
+    Has the query methods of `Tool`, blocking until the answer is ready,
+    and `_async` versions of them to await from asyncio code. The tool is
+    only used from one background thread. Use as a context manager, or call
+    `close` when done.
+    """
+
+    def __init__(self, tool, max_batch=4096, max_delay=0.001):
+        """
+        Parameters
+        ----------
+        tool : Tool
+            Tool to answer queries with.
+        max_batch : int, optional
+            Largest number of postcodes or locations answered in one call.
+            A single larger query is answered on its own.
+        max_delay : float, optional
+            Seconds to wait for more queries after the first of a batch arrives.
+        """
+        self.tool = tool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.requests = 0
+
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='flood_tool_batching', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Answer the queries already submitted, then stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _submit(self, kind, *arrays):
+        """Queue a query, returning a `concurrent.futures.Future` of its answer.
+
+        Raises `ValueError` if the arrays differ in length, as their rows would
+        be split out of the batch wrongly, corrupting other callers' answers.
+        """
+        request = _Request(kind, arrays)
+        if any(len(a) != request.size for a in request.arrays[1:]):
+            raise ValueError('Size of input mismatch')
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('BatchingTool is closed')
+            self._pending.append(request)
+            self._condition.notify()
+        return request.future
+
+    def _take_batch(self):
+        """Wait for queries, then take a batch of them of one kind, or `None` once closed."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = time.monotonic() + self.max_delay
+            while not self._closed and sum(r.size for r in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            kind = self._pending[0].kind
+            batch, rest, size = [], [], 0
+            for request in self._pending:
+                if request.kind == kind and (not batch or size + request.size <= self.max_batch):
+                    batch.append(request)
+                    size += request.size
+                else:
+                    rest.append(request)
+            self._pending = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = getattr(self, '_answer_' + batch[0].kind)(batch)
+            except BaseException as e:
+                for request in batch:
+                    request.future.set_exception(e)
+            else:
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+
+    def _concatenate(self, batch, i=0):
+        return np.concatenate([request.arrays[i] for request in batch])
+
+    def _answer_lat_long(self, batch):
+        return _split(self.tool.get_lat_long(self._concatenate(batch)), batch)
+
+    def _answer_probability(self, batch):
+        return _split(self.tool.get_easting_northing_flood_probability(
+            self._concatenate(batch, 0).astype(float), self._concatenate(batch, 1).astype(float)), batch)
+
+    def _answer_flood_cost(self, batch):
+        return _split(self.tool.get_flood_cost(self._concatenate(batch)), batch)
+
+    def _answer_annual_risk(self, batch):
+        return _split(self.tool.get_annual_flood_risk(self._concatenate(batch, 0),
+                                                      self._concatenate(batch, 1)), batch)
+
+    def _score_batch(self, batch):
+        """Score the distinct valid postcodes of a batch once, giving each request its own."""
+        postcodes, ranks, risk = self.tool._score_postcodes(self._concatenate(batch))
+        for request in batch:
+            if len(postcodes) == 0:
+                yield postcodes, ranks, risk
+                continue
+            mine = np.unique(normalise_postcodes(request.arrays[0]))
+            found = np.minimum(np.searchsorted(postcodes, mine), len(postcodes) - 1)
+            found = found[postcodes[found] == mine]
+            yield postcodes[found], ranks[found], risk[found]
+
+    def _answer_sorted_probability(self, batch):
+        return [_sorted_probability_frame(postcodes, ranks)
+                for postcodes, ranks, _ in self._score_batch(batch)]
+
+    def _answer_sorted_risk(self, batch):
+        return [_sorted_risk_frame(postcodes, risk) for postcodes, _, risk in self._score_batch(batch)]
+
+    def get_lat_long(self, postcodes):
+        """As `Tool.get_lat_long`, batched with other callers' queries."""
+        return self._submit('lat_long', postcodes).result()
+
+    def get_easting_northing_flood_probability(self, easting, northing):
+        """As `Tool.get_easting_northing_flood_probability`, batched with other callers' queries."""
+        if len(easting) != len(northing):
+            return self.tool.get_easting_northing_flood_probability(easting, northing)
+        return self._submit('probability', easting, northing).result()
+
+    def get_flood_cost(self, postcodes):
+        """As `Tool.get_flood_cost`, batched with other callers' queries."""
+        return self._submit('flood_cost', postcodes).result()
+
+    def get_annual_flood_risk(self, postcodes, probability_bands):
+        """As `Tool.get_annual_flood_risk`, batched with other callers' queries."""
+        if len(postcodes) != len(probability_bands):
+            return self.tool.get_annual_flood_risk(postcodes, probability_bands)
+        return self._submit('annual_risk', postcodes, probability_bands).result()
+
+    def get_sorted_flood_probability(self, postcodes):
+        """As `Tool.get_sorted_flood_probability`, batched with other callers' queries."""
+        return self._submit('sorted_probability', postcodes).result()
+
+    def get_sorted_annual_flood_risk(self, postcodes):
+        """As `Tool.get_sorted_annual_flood_risk`, batched with other callers' queries."""
+        return self._submit('sorted_risk', postcodes).result()
+
+    async def get_lat_long_async(self, postcodes):
+        """As `get_lat_long`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('lat_long', postcodes))
+
+    async def get_easting_northing_flood_probability_async(self, easting, northing):
+        """As `get_easting_northing_flood_probability`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('probability', easting, northing))
+
+    async def get_flood_cost_async(self, postcodes):
+        """As `get_flood_cost`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('flood_cost', postcodes))
+
+    async def get_annual_flood_risk_async(self, postcodes, probability_bands):
+        """As `get_annual_flood_risk`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('annual_risk', postcodes, probability_bands))
+
+    async def get_sorted_flood_probability_async(self, postcodes):
+        """As `get_sorted_flood_probability`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('sorted_probability', postcodes))
+
+    async def get_sorted_annual_flood_risk_async(self, postcodes):
+        """As `get_sorted_annual_flood_risk`, for asyncio code."""
+        return await asyncio.wrap_future(self._submit('sorted_risk', postcodes))
@@ -0,0 +1 @@
+"""Benchmarks of the flood tool, runnable as `python -m flood_tool.benchmarks.<name>`."""
@@ -0,0 +1,53 @@
+"""Benchmark scaling of `ToolPool` over worker process counts.
+
+Run from the directory holding `flood_tool`, as for `Tool()`::
+
+    python -m flood_tool.benchmarks.parallel --size 2000000 --processes 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from flood_tool.geo import get_easting_northing_from_lat_long
+from flood_tool.tool import Tool
+from flood_tool.parallel import ToolPool
+
+
+def _time(function, *args):
+    """Time one call of a function, in seconds."""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1000000,
+                        help='number of postcodes and locations per query')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=sorted({1, 2, multiprocessing.cpu_count()}),
+                        help='worker process counts to try')
+    args = parser.parse_args(argv)
+
+    tool = Tool().warm()
+    rng = np.random.default_rng(0)
+    postcodes = rng.choice(np.asarray(tool.postcode_data.index, dtype=str), args.size)
+    lat_long = tool.get_lat_long(postcodes)
+    easting, northing = get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1])
+
+    queries = [('get_sorted_annual_flood_risk', (postcodes,)),
+               ('get_easting_northing_flood_probability', (easting, northing))]
+    print('%-40s %10s %10s %8s' % ('query', 'processes', 'seconds', 'speedup'))
+    for name, query_args in queries:
+        serial = _time(getattr(tool, name), *query_args)
+        print('%-40s %10s %10.3f %8.2f' % (name, 'serial', serial, 1.0))
+        for processes in args.processes:
+            with ToolPool(tool, processes) as pool:
+                elapsed = _time(getattr(pool, name), *query_args)
+            print('%-40s %10d %10.3f %8.2f' % (name, processes, elapsed, serial/elapsed))
+
+
+if __name__ == '__main__':
+    main()
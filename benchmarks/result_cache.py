@@ -0,0 +1,90 @@
+"""Benchmark `Tool` queries with the result cache off and on, cold and warm.
+
+Cold queries ask for postcodes not yet cached, so with the cache on they
+pay for filling it; warm queries repeat cached postcodes::
+
+    python -m flood_tool.benchmarks.result_cache --postcodes 1000000 --sizes 10 1000 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from flood_tool.tool import Tool
+from flood_tool.benchmarks import suite, synthetic
+
+QUERIES = ('get_lat_long', 'get_flood_cost', 'get_sorted_annual_flood_risk')
+
+
+def run(paths, sizes, cache_size, repeat=20, budget=2.0, seed=0):
+    """Time cold and warm queries with the result cache off and on.
+
+    Returns
+    -------
+
+    list of dicts
+        The measurements of `suite.measure` for each query, size, `cache`
+        (on or off) and `state` (cold or warm).
+    """
+    postcodes = pd.read_csv(paths['postcode_file'], usecols=['Postcode']).Postcode.to_numpy(dtype=str)
+    rng = np.random.default_rng(seed)
+    results = []
+    for cache in ('off', 'on'):
+        for size in sizes:
+            for name in QUERIES:
+                tool = Tool(**paths, result_cache_size=cache_size if cache == 'on' else 0).warm()
+                # each cold call takes the next postcodes of a shuffle, none of them cached yet
+                order = rng.permutation(len(postcodes))
+                calls = iter(range(0, len(postcodes) - size + 1, size))
+
+                def cold():
+                    start = next(calls, None)
+                    if start is None:
+                        tool.reload().warm()
+                        start = 0
+                    return getattr(tool, name)(postcodes[order[start:start + size]])
+
+                warm_batch = postcodes[order[:size]]
+                for state, function in (('cold', cold),
+                                        ('warm', lambda: getattr(tool, name)(warm_batch))):
+                    result = {'benchmark': name, 'size': size, 'cache': cache, 'state': state}
+                    result.update(suite.measure(function, repeat, budget))
+                    results.append(result)
+                    print('%-30s %10d %6s %6s %12.6f %12.6f' % (name, size, cache, state,
+                                                               result['p50'], result['p99']), flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help='directory of the files to load, generated there if missing; '
+                                       'by default synthetic files in a temporary directory')
+    parser.add_argument('--postcodes', type=int, default=1000000,
+                        help='number of postcodes of generated files')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000],
+                        help='batch sizes to query')
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                        help='result cache size when on')
+    parser.add_argument('--repeat', type=int, default=20, help='largest number of timed calls')
+    parser.add_argument('--budget', type=float, default=2.0,
+                        help='seconds to spend timing each case')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.data or temporary
+        paths = {argument: os.path.join(directory, name) for argument, name in synthetic.FILES.items()}
+        if not all(os.path.exists(path) for path in paths.values()):
+            paths = synthetic.generate(directory, args.postcodes)
+        print('%-30s %10s %6s %6s %12s %12s' % ('query', 'size', 'cache', 'state', 'p50 s', 'p99 s'))
+        results = run(paths, args.sizes, args.cache_size, args.repeat, args.budget)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""Benchmark `Tool` queries and coordinate conversion over a range of batch sizes.
+
+Runs on synthetic files from `benchmarks.synthetic`, or any directory holding
+`postcodes.csv`, `property_value.csv` and `flood_probability.csv`, and
+records throughput, latency percentiles and peak memory as JSON::
+
+    python -m flood_tool.benchmarks.suite --postcodes 2000000 --sizes 10 1000 100000 10000000 \\
+        --output after.json
+    python -m flood_tool.benchmarks.suite --compare before.json after.json
+
+Comparing exits with status 1 if any benchmark got slower by more than the
+threshold, so it can guard against regressions between versions.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from flood_tool import geo
+from flood_tool.tool import PROBABILITY_BANDS, Tool
+from flood_tool.benchmarks import synthetic
+
+__all__ = ['BENCHMARKS', 'measure', 'run', 'compare']
+
+# Queries benchmarked at each batch size, as functions of the tool and the inputs of the batch
+BENCHMARKS = {
+    'get_lat_long': lambda tool, q: tool.get_lat_long(q['postcodes']),
+    'get_flood_cost': lambda tool, q: tool.get_flood_cost(q['postcodes']),
+    'get_annual_flood_risk': lambda tool, q: tool.get_annual_flood_risk(q['postcodes'], q['bands']),
+    'get_easting_northing_flood_probability':
+        lambda tool, q: tool.get_easting_northing_flood_probability(q['easting'], q['northing']),
+    'get_sorted_flood_probability': lambda tool, q: tool.get_sorted_flood_probability(q['postcodes']),
+    'get_sorted_annual_flood_risk': lambda tool, q: tool.get_sorted_annual_flood_risk(q['postcodes']),
+    'get_easting_northing_from_lat_long':
+        lambda tool, q: geo.get_easting_northing_from_lat_long(q['latitude'], q['longitude']),
+    'get_lat_long_from_easting_northing':
+        lambda tool, q: geo.get_lat_long_from_easting_northing(q['easting'], q['northing']),
+}
+# Loading the files, benchmarked once at the size of the postcode file
+LOAD_BENCHMARKS = ('load_parsed', 'load_cached')
+
+
+def measure(function, repeat=20, budget=2.0):
+    """Measure the time and memory of calls to a function.
+
+    The function is first called once to measure the peak memory it allocates,
+    which also warms up any lazy loading, then timed repeatedly, at least
+    once and until `repeat` calls or `budget` seconds.
+
+    Returns
+    -------
+
+    dict
+        `repeats`, the `min`, `mean`, `p50`, `p90`, `p99` and `max` seconds
+        of a call, and `peak_bytes` allocated by a call.
+    """
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    started = time.perf_counter()
+    while not times or (len(times) < repeat and time.perf_counter() - started < budget):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times = np.array(times)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {'repeats': len(times), 'min': times.min(), 'mean': times.mean(), 'p50': p50,
+            'p90': p90, 'p99': p99, 'max': times.max(), 'peak_bytes': int(peak)}
+
+
+def _inputs(tool, postcodes, size, invalid, rng):
+    """Make the inputs of a batch: postcodes drawn from the file, some invalid, and their locations."""
+    batch = rng.choice(postcodes, size).astype(object)
+    batch[rng.random(size) < invalid] = 'INVALID'
+    lat_long = tool.get_lat_long(batch)
+    known = ~np.isnan(lat_long[:, 0])
+    # unknown postcodes are located at random points of the known ones
+    lat_long[~known] = lat_long[known][rng.integers(known.sum(), size=(~known).sum())] if known.any() else 0
+    easting, northing = geo.get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1])
+    return {'postcodes': batch, 'bands': rng.choice(PROBABILITY_BANDS, size),
+            'latitude': lat_long[:, 0], 'longitude': lat_long[:, 1],
+            'easting': easting, 'northing': northing}
+
+
+def _metadata(paths, sizes, options):
+    """Describe the code, machine and data a run measured."""
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(), 'files': paths,
+            'file_bytes': {name: os.path.getsize(path) for name, path in paths.items()},
+            'sizes': list(sizes), 'tool_options': options}
+
+
+def run(paths, sizes=(10, 1000, 100000), benchmarks=None, repeat=20, budget=2.0,
+        tool_options=None, invalid=0.01, seed=0, report=None):
+    """Run the benchmarks.
+
+    Parameters
+    ----------
+
+    paths: dict
+        Paths of the files by `Tool` argument, as returned by `synthetic.generate`.
+    sizes: sequence of ints, optional
+        Batch sizes to run each query at.
+    benchmarks: sequence of strs, optional
+        Names of the benchmarks to run, from `BENCHMARKS` and `LOAD_BENCHMARKS`,
+        by default all of them.
+    repeat, budget: optional
+        Largest number of timed calls, and seconds to spend on them, for each
+        benchmark and size, as for `measure`.
+    tool_options: dict, optional
+        Other arguments for `Tool`, such as `precompute`.
+    invalid: float, optional
+        Fraction of queried postcodes that are invalid.
+    seed: int, optional
+        Seed of the random queries.
+    report: callable, optional
+        Called with each result as it is measured, to show progress.
+
+    Returns
+    -------
+
+    dict
+        `metadata` describing the run, and `results`, a list of one dict per
+        benchmark and size with `benchmark`, `size`, `items_per_second` and
+        the measurements of `measure`.
+    """
+    tool_options = dict(tool_options or {})
+    benchmarks = list(benchmarks) if benchmarks is not None else list(LOAD_BENCHMARKS) + list(BENCHMARKS)
+    unknown = set(benchmarks) - set(BENCHMARKS) - set(LOAD_BENCHMARKS)
+    if unknown:
+        raise ValueError('Unknown benchmarks: ' + ', '.join(sorted(unknown)))
+    rng = np.random.default_rng(seed)
+    results = []
+
+    def record(name, size, measured):
+        result = {'benchmark': name, 'size': size, 'items_per_second': size/measured['p50']}
+        result.update(measured)
+        results.append(result)
+        if report is not None:
+            report(result)
+
+    postcodes = pd.read_csv(paths['postcode_file'], usecols=['Postcode']).Postcode.to_numpy(dtype=str)
+    options = dict(tool_options, cache=False)
+    if 'load_parsed' in benchmarks:
+        record('load_parsed', len(postcodes),
+               measure(lambda: Tool(**paths, **options).warm(), repeat, budget))
+    if 'load_cached' in benchmarks:
+        # the first call, measuring memory, builds the cache the timed calls load
+        record('load_cached', len(postcodes),
+               measure(lambda: Tool(**paths, **dict(tool_options, cache=True)).warm(), repeat, budget))
+
+    tool = Tool(**paths, **tool_options).warm()
+    for size in sizes:
+        inputs = _inputs(tool, postcodes, size, invalid, rng)
+        for name in benchmarks:
+            if name in BENCHMARKS:
+                record(name, size, measure(lambda: BENCHMARKS[name](tool, inputs), repeat, budget))
+    return {'metadata': _metadata(paths, sizes, tool_options), 'results': results}
+
+
+def compare(before, after, threshold=0.1):
+    """Compare the median times of two runs' benchmarks.
+
+    Parameters
+    ----------
+
+    before, after: dict
+        Runs, as returned by `run` or read from its JSON output.
+    threshold: float, optional
+        Fraction by which a benchmark must slow down to count as a regression.
+
+    Returns
+    -------
+
+    list of dicts
+        `benchmark`, `size`, `before` and `after` median seconds and their
+        `ratio`, for each benchmark and size in both runs, with `regression`
+        whether the ratio is over `1 + threshold`.
+    """
+    medians = {(r['benchmark'], r['size']): r['p50'] for r in before['results']}
+    comparison = []
+    for result in after['results']:
+        key = (result['benchmark'], result['size'])
+        if key in medians:
+            ratio = result['p50']/medians[key]
+            comparison.append({'benchmark': key[0], 'size': key[1], 'before': medians[key],
+                               'after': result['p50'], 'ratio': ratio, 'regression': ratio > 1 + threshold})
+    return comparison
+
+
+def _print_result(result):
+    print('%-40s %10d %8d %12.6f %12.6f %14.0f %12.1f' % (
+        result['benchmark'], result['size'], result['repeats'], result['p50'], result['p99'],
+        result['items_per_second'], result['peak_bytes']/2**20), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help='directory of the files to load, generated there if missing; '
+                                       'by default synthetic files in a temporary directory')
+    parser.add_argument('--postcodes', type=int, default=1000000,
+                        help='number of postcodes of generated files')
+    parser.add_argument('--circles', type=int, default=None,
+                        help='number of flood risk circles of generated files')
+    parser.add_argument('--spread', type=float, default=5000.,
+                        help='spread in metres of generated postcodes around their town')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000, 1000000],
+                        help='batch sizes to query')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(LOAD_BENCHMARKS) + list(BENCHMARKS),
+                        help='benchmarks to run, by default all')
+    parser.add_argument('--repeat', type=int, default=20, help='largest number of timed calls')
+    parser.add_argument('--budget', type=float, default=2.0,
+                        help='seconds to spend timing each benchmark and size')
+    parser.add_argument('--compact', action='store_true')
+    parser.add_argument('--precompute', action='store_true')
+    parser.add_argument('--raster-cell-size', type=float, default=None)
+    parser.add_argument('--result-cache-size', type=int, default=0)
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two JSON results instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown of the median time counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        runs = []
+        for path in args.compare:
+            with open(path) as f:
+                runs.append(json.load(f))
+        comparison = compare(*runs, threshold=args.threshold)
+        print('%-40s %10s %12s %12s %8s' % ('benchmark', 'size', 'before', 'after', 'ratio'))
+        for c in comparison:
+            print('%-40s %10d %12.6f %12.6f %8.2f%s' % (c['benchmark'], c['size'], c['before'], c['after'],
+                                                      c['ratio'], '  REGRESSION' if c['regression'] else ''))
+        return 1 if any(c['regression'] for c in comparison) else 0
+
+    options = {'compact': args.compact, 'precompute': args.precompute,
+               'raster_cell_size': args.raster_cell_size, 'result_cache_size': args.result_cache_size}
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.data or temporary
+        paths = {argument: os.path.join(directory, name) for argument, name in synthetic.FILES.items()}
+        if not all(os.path.exists(path) for path in paths.values()):
+            print('Generating %d postcodes in %s' % (args.postcodes, directory), flush=True)
+            paths = synthetic.generate(directory, args.postcodes, args.circles, spread=args.spread)
+
+        print('%-40s %10s %8s %12s %12s %14s %12s' % ('benchmark', 'size', 'repeats', 'p50 s', 'p99 s',
+                                                      'items/s', 'peak MiB'))
+        results = run(paths, args.sizes, args.benchmarks, args.repeat, args.budget, options,
+                      report=_print_result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Generate synthetic postcode, property value and flood risk files at national scale.
+
+The files have the layout of the ones `Tool` reads, so benchmarks can run
+offline at any scale::
+
+    python -m flood_tool.benchmarks.synthetic data --postcodes 2000000 --circles 500000
+
+then `Tool(postcode_file='data/postcodes.csv', risk_file='data/flood_probability.csv',
+values_file='data/property_value.csv')`.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from flood_tool.geo import get_lat_long_from_easting_northing
+
+__all__ = ['generate', 'synthetic_postcodes', 'FILES']
+
+FILES = {'postcode_file': 'postcodes.csv', 'values_file': 'property_value.csv',
+         'risk_file': 'flood_probability.csv'}
+
+# Letters of the inward part of real postcodes, used for every letter of synthetic ones
+LETTERS = np.array(list('ABDEFGHJLNPQRSTUWXYZ'))
+# Bounds of the area postcodes are spread over, as OS easting and northing in metres
+BOUNDS = (150000., 50000., 650000., 650000.)
+BANDS = ['Very Low', 'Low', 'Medium', 'High']
+RADII = [25., 50., 100., 250., 500., 1500.]
+RADIUS_WEIGHTS = [.3, .3, .2, .12, .06, .02]
+
+
+def synthetic_postcodes(count):
+    """Make distinct postcodes in the 7 character layout of `postcodes.csv`.
+
+    Postcode `i` is made from a scattering of `i`, so the postcodes of one
+    area aren't consecutive. Up to 158,400,000 postcodes can be made.
+    """
+    capacity = 400*99*4000
+    if count > capacity:
+        raise ValueError('At most %d postcodes can be made' % capacity)
+    # 7919 is prime and doesn't divide capacity, so the scattering is one to one
+    ids = np.arange(count, dtype=np.int64)*7919 % capacity
+    area, rest = np.divmod(ids, 99*4000)
+    district, rest = np.divmod(rest, 4000)
+    sector, unit = np.divmod(rest, 400)
+    outward = (LETTERS[area//20].astype(object) + LETTERS[area % 20].astype(object)
+               + (district + 1).astype(str).astype(object))
+    inward = (sector.astype(str).astype(object) + LETTERS[unit//20].astype(object)
+              + LETTERS[unit % 20].astype(object))
+    # outward parts of 3 characters are padded with a space, as in 'CT3 3EL'
+    outward = np.where(district < 9, outward + ' ', outward)
+    return (outward + inward).astype(str)
+
+
+def generate(directory, postcodes=1000000, circles=None, towns=None, spread=5000.,
+             valued=0.9, seed=0):
+    """Write synthetic `postcodes.csv`, `property_value.csv` and `flood_probability.csv` files.
+
+    Postcodes are clustered around towns scattered over England, and the
+    flood risk circles around postcodes, so a query meets a realistic mix
+    of crowded and empty areas.
+
+    Parameters
+    ----------
+
+    directory: str
+        Directory to write the files to, made if missing.
+    postcodes: int, optional
+        Number of postcodes.
+    circles: int, optional
+        Number of flood risk circles, by default a quarter of the postcodes.
+    towns: int, optional
+        Number of clusters of postcodes, by default one per 1000 postcodes.
+    spread: float, optional
+        Standard deviation in metres of the distance of postcodes from their town.
+        Smaller spreads pack postcodes, and circles, more densely.
+    valued: float, optional
+        Fraction of postcodes with a property value.
+    seed: int, optional
+        Seed of the random numbers, so the same arguments give the same files.
+
+    Returns
+    -------
+
+    dict
+        Paths of the files, by the `Tool` argument to pass them as.
+    """
+    rng = np.random.default_rng(seed)
+    circles = postcodes//4 if circles is None else circles
+    towns = max(postcodes//1000, 1) if towns is None else towns
+    os.makedirs(directory, exist_ok=True)
+    paths = {argument: os.path.join(directory, name) for argument, name in FILES.items()}
+
+    west, south, east, north = BOUNDS
+    centres = rng.uniform((west, south), (east, north), (towns, 2))
+    town = rng.integers(towns, size=postcodes)
+    easting = np.clip(centres[town, 0] + rng.normal(0, spread, postcodes), west, east)
+    northing = np.clip(centres[town, 1] + rng.normal(0, spread, postcodes), south, north)
+    latitude, longitude = get_lat_long_from_easting_northing(easting, northing)
+    codes = synthetic_postcodes(postcodes)
+    pd.DataFrame({'Postcode': codes, 'Latitude': latitude.round(6),
+                  'Longitude': longitude.round(6)}).to_csv(paths['postcode_file'], index=False)
+
+    # the values file writes postcodes with a space before the inward part, and leaves some blank
+    chars = codes.astype('U7').view('U1').reshape(postcodes, 7)
+    spaced = np.full((postcodes, 8), ' ', dtype='U1')
+    spaced[:, :4], spaced[:, 5:] = chars[:, :4], chars[:, 4:]
+    spaced = np.where(chars[:, 3] == ' ', codes, spaced.view('U8').reshape(-1))
+    values = rng.lognormal(12.5, 1., postcodes).round(2)
+    values[rng.random(postcodes) >= valued] = np.nan
+    pd.DataFrame({'Postcode': spaced, 'Lat': latitude.round(6), 'Long': longitude.round(6),
+                  'Total Value': values}).to_csv(paths['values_file'], index=False)
+
+    near = rng.integers(postcodes, size=circles)
+    radius = rng.choice(RADII, circles, p=RADIUS_WEIGHTS)
+    risk = pd.DataFrame({'X': (easting[near] + rng.normal(0, radius)).round(),
+                         'Y': (northing[near] + rng.normal(0, radius)).round(),
+                         'prob_4band': np.array(BANDS)[rng.integers(len(BANDS), size=circles)],
+                         'radius': radius})
+    # the risk file has an unnamed index column
+    risk.to_csv(paths['risk_file'])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='directory to write the files to')
+    parser.add_argument('--postcodes', type=int, default=1000000, help='number of postcodes')
+    parser.add_argument('--circles', type=int, default=None,
+                        help='number of flood risk circles, by default a quarter of the postcodes')
+    parser.add_argument('--towns', type=int, default=None,
+                        help='number of clusters of postcodes, by default one per 1000 postcodes')
+    parser.add_argument('--spread', type=float, default=5000.,
+                        help='spread in metres of postcodes around their town')
+    parser.add_argument('--valued', type=float, default=0.9,
+                        help='fraction of postcodes with a property value')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = generate(args.directory, args.postcodes, args.circles, args.towns, args.spread,
+                     args.valued, args.seed)
+    for path in paths.values():
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Concurrent HTTP fetching for asyncio code, over a pool of persistent connections."""
+import asyncio
+import gzip
+import http.client
+import io
+import threading
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+__all__ = ['FetchError', 'Fetcher', 'fetch_all', 'read_csv']
+
+# Responses worth retrying, as the server may answer differently later
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class FetchError(IOError):
+    """Raised when a URL can't be fetched, after any retries."""
+
+    def __init__(self, message, url, status=None):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+
+
+def _decode(body, encoding):
+    """Decompress a response body sent with a `Content-Encoding`."""
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        return zlib.decompress(body)
+    return body
+
+def _copy(response, sink, encoding, block_size=2**20):
+    """Copy a response body to a file in blocks, decompressing it as it arrives."""
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = None
+    while True:
+        block = response.read(block_size)
+        if not block:
+            break
+        sink.write(decompressor.decompress(block) if decompressor else block)
+    if decompressor:
+        sink.write(decompressor.flush())
+
+
+class Fetcher(object):
+    """Fetches URLs concurrently from asyncio code.
+
+    Requests run on a pool of `concurrency` threads, each blocking on one
+    request at a time, so at most `concurrency` requests are in flight.
+    Connections are kept open between requests to the same host and reused.
+    Connection errors, timeouts and the HTTP statuses in `RETRY_STATUSES` are
+    retried with exponential backoff; other error statuses raise `FetchError`
+    straight away. Redirects are followed.
+
+    Use as an async context manager, or call `close` when done::
+
+        async with Fetcher(concurrency=8) as fetcher:
+            frames = await asyncio.gather(*(fetcher.fetch_csv(url) for url in urls))
+    """
+
+    def __init__(self, concurrency=8, timeout=10.0, retries=3, backoff=0.5, headers=None, cache=None):
+        """
+        Parameters
+        ----------
+        concurrency : int, optional
+            Largest number of requests in flight, and of open connections per host.
+        timeout : float, optional
+            Seconds to wait to connect, and for each read from a connection.
+        retries : int, optional
+            Number of times to retry a failed request.
+        backoff : float, optional
+            Seconds to wait before the first retry, doubling for each later one.
+        headers : dict, optional
+            Extra headers sent with every request.
+        cache : httpcache.HTTPCache, optional
+            Cache to serve fresh responses from, revalidate stale ones with, and store
+            downloaded ones in.
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = {'Accept-Encoding': 'gzip, deflate'}
+        self.headers.update(headers or {})
+        self.cache = cache
+        self.requests = 0
+        self.retried = 0
+
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix='flood_tool_fetch')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # waiting for requests in flight blocks, so do it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        """Wait for requests in flight, then close all connections."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def _checkout(self, scheme, host):
+        """Get an idle connection to a host, or open a new one, with whether it was reused."""
+        with self._lock:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                return idle.pop(), True
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=self.timeout), False
+        if scheme == 'http':
+            return http.client.HTTPConnection(host, timeout=self.timeout), False
+        raise ValueError('Unsupported URL scheme: ' + scheme)
+
+    def _checkin(self, scheme, host, connection):
+        """Return a connection to the pool, closing it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.concurrency:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, url, headers, sink=None):
+        """Make one GET request on a pooled connection, returning (status, headers, body).
+
+        With a `sink` file, a successful response body is written to it rather than returned.
+        """
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        connection, reused = self._checkout(parts.scheme, parts.netloc)
+        try:
+            connection.request('GET', path, headers=dict(self.headers, **headers))
+            response = connection.getresponse()
+            encoding = response.getheader('Content-Encoding')
+            if sink is not None and response.status == 200:
+                _copy(response, sink, encoding)
+                body = b''
+            else:
+                body = _decode(response.read(), encoding)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # the server closed the idle connection, so try again on a new one
+            return self._request(url, headers, sink)
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(parts.scheme, parts.netloc, connection)
+        return response.status, response.headers, body
+
+    def _get(self, url, headers=None, sink=None):
+        """Fetch a URL in a worker thread, following redirects."""
+        requested = url
+        for _ in range(MAX_REDIRECTS + 1):
+            status, response_headers, body = self._request(url, headers or {}, sink)
+            location = response_headers.get('Location')
+            if status not in REDIRECT_STATUSES or not location:
+                return status, response_headers, body
+            url = urllib.parse.urljoin(url, location)
+        raise FetchError('Too many redirects fetching ' + requested, requested, status)
+
+    def _get_cached(self, url):
+        """Fetch a URL in a worker thread through the cache, if there is one."""
+        if self.cache is None:
+            return self._get(url)
+        body, conditional = self.cache.lookup(url)
+        if body is not None:
+            return 200, {}, body
+        status, headers, body = self._get(url, conditional)
+        if status == 304:
+            body = self.cache.revalidate(url)
+            if body is not None:
+                return 200, headers, body
+            # the cached copy went missing, so download it
+            status, headers, body = self._get(url)
+        if status == 200:
+            self.cache.store(url, headers, body)
+        return status, headers, body
+
+    def _download(self, url, path):
+        """Download a URL to a file in a worker thread, replacing anything already there."""
+        with open(path, 'wb') as sink:
+            return self._get(url, sink=sink)
+
+    async def _retry(self, url, function, *args):
+        """Run a request function in a worker thread, retrying failures with backoff."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self.backoff*2**(attempt - 1))
+            self.requests += 1
+            try:
+                status, headers, body = await loop.run_in_executor(self._executor, function, *args)
+            except (OSError, http.client.HTTPException) as e:
+                if isinstance(e, FetchError):
+                    raise
+                error = FetchError('Failed to fetch %s: %s' % (url, e), url)
+                continue
+            if status < 400:
+                return body
+            error = FetchError('Fetching %s returned HTTP status %d' % (url, status), url, status)
+            if status not in RETRY_STATUSES:
+                raise error
+        raise error
+
+    async def fetch(self, url):
+        """Fetch the body of a URL.
+
+        Parameters
+        ----------
+
+        url: str
+            The http or https URL to get.
+
+        Returns
+        -------
+
+        bytes
+            The response body, decompressed.
+
+        Raises
+        ------
+
+        FetchError
+            If the server returns an error status, or after the last retry fails.
+        """
+        return await self._retry(url, self._get_cached, url)
+
+    async def download(self, url, path):
+        """Download a URL to a file, without holding the whole body in memory.
+
+        The body is decompressed as it arrives and written to `path` in blocks.
+        Responses aren't cached. Raises `FetchError` as `fetch`.
+        """
+        await self._retry(url, self._download, url, path)
+
+    async def fetch_csv(self, url, **kwargs):
+        """Fetch a .csv file as a DataFrame, passing `kwargs` to `pandas.read_csv`."""
+        return pd.read_csv(io.BytesIO(await self.fetch(url)), **kwargs)
+
+    async def fetch_all(self, urls, return_exceptions=False):
+        """Fetch the bodies of several URLs concurrently, in the order given.
+
+        With `return_exceptions`, a `FetchError` is returned in place of the
+        body of each URL that fails, rather than raised.
+        """
+        return await asyncio.gather(*(self.fetch(url) for url in urls),
+                                    return_exceptions=return_exceptions)
+
+
+def fetch_all(urls, **options):
+    """Fetch the bodies of several URLs concurrently, from code not already running asyncio.
+
+    Parameters
+    ----------
+
+    urls: sequence of strs
+        The URLs to get.
+    options:
+        Options for the `Fetcher`, such as `concurrency` or `timeout`.
+
+    Returns
+    -------
+
+    list of bytes
+        The response bodies, in the order of `urls`.
+    """
+    async def run():
+        async with Fetcher(**options) as fetcher:
+            return await fetcher.fetch_all(urls)
+    return asyncio.run(run())
+
+
+def read_csv(url, cache=None, **kwargs):
+    """Read a .csv file from a URL into a DataFrame, from code not already running asyncio.
+
+    A drop in replacement for `pandas.read_csv(url)`, with retries and an optional cache.
+
+    Parameters
+    ----------
+
+    url: str
+        The URL of the .csv file.
+    cache: httpcache.HTTPCache, optional
+        Cache to serve, revalidate or store the response with.
+    kwargs:
+        Passed to `pandas.read_csv`.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        The parsed file.
+    """
+    async def run():
+        async with Fetcher(concurrency=1, cache=cache) as fetcher:
+            return await fetcher.fetch_csv(url, **kwargs)
+    return asyncio.run(run())
@@ -1,34 +1,39 @@
 """Live and historical flood monitoring data from the Environment Agency API"""
-import argparse
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import asyncio
 import flood_tool.tool as tool
 import flood_tool.geo as geo
+import flood_tool.live as live
+from flood_tool.fetch import Fetcher
+from flood_tool.httpcache import HTTPCache
+from flood_tool.stations import StationCatalogue
 
 import sys
 
+
+async def get_max_rainfall(easting, northing, dist):
+    """Highest rainfall reading of the stations within `dist` km of a location, fetched concurrently."""
+    async with Fetcher(cache=HTTPCache()) as fetcher:
+        catalogue = await StationCatalogue.fetch_async(fetcher, 'rainfall')
+        _, station, _ = catalogue.within(easting, northing, dist*1000)
+        station_ref = catalogue.references[station]
+        readings = await live.get_station_readings(fetcher, station_ref)
+    max_val = 0.0
+    for testt in readings:
+        temp_max = testt.loc[:,'value'].max()
+        if temp_max > max_val:
+            max_val = temp_max
+    return max_val
+
+
 arg_str = ' '.join(sys.argv[1:]) 
 post_code = arg_str
 
 #requirement3 
 tl = tool.Tool()
-r = str(10)
+r = 10
 lat_long = tl.get_lat_long([post_code])
-latitude = lat_long[0,0]
-longitude = lat_long[0,1]
-DataF_value = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/id/measures.csv?parameter=rainfall')
-value = DataF_value.loc[:, ['dateTime', 'stationReference', 'value']]
-DataF_station = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations.csv?parameter=rainfall&lat='+str(latitude)+'&long='+str(longitude)+'&dist='+r)
-station = DataF_station.loc[:, ['stationReference', 'lat', 'long','easting', 'northing']]
-station_ref = DataF_station.loc[:, 'stationReference'].values
-ref = station_ref[0]
-max_val = 0.0
-for ref in station_ref:
-    testt = pd.read_csv('http://environment.data.gov.uk/flood-monitoring/id/stations/'+str(ref)+'/readings.csv')
-    temp_max = testt.loc[:,'value'].max()
-    if temp_max > max_val:
-        max_val = temp_max 
+easting, northing = geo.get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1])
+max_val = asyncio.run(get_max_rainfall(easting, northing, r))
 
 print("Maximum rain in your desired location over last 24hrs: "+ str(max_val) + " inches of rainfall")
 if max_val <= 0.0:
@@ -41,10 +46,6 @@ if max_val > 0.3:
     print("There has been heavy rainfall in your desired location!, please wait to see the" 
           "chance of flooding in this area...")
 
-lat = [latitude]
-longit = [longitude]
-
-easting, northing = geo.get_easting_northing_from_lat_long(lat, longit)
 probability = tl.get_easting_northing_flood_probability(easting, northing)
 print("Your location has a "+ probability[0]+" chance of flooding")
 
@@ -2,9 +2,12 @@
 import numpy as np
 from numpy import array, sin, cos, tan, sqrt, pi, arctan2, floor
 import numpy as np
+from .instrument import timed
 
 __all__ = ['get_easting_northing_from_lat_long',
-		   'WGS84toOSGB36']
+		   'get_lat_long_from_easting_northing',
+		   'WGS84toOSGB36',
+		   'OSGB36toWGS84']
 
 class Ellipsoid(object):
 	"""Class acting as container for properties describing a terrestrial ellipsoid."""
@@ -156,6 +159,10 @@ class HelmertTransform(object):
 		""" Transform a point or point set using the Helmert Transform."""
 		return self.T + self.M.dot(X.reshape((3,-1)))
 
+	def inverse(self, X):
+		""" Transform a point or point set back through the inverse of the Helmert Transform."""
+		return np.linalg.inv(self.M).dot(X.reshape((3,-1)) - self.T)
+
 WGS84toOSGB36transform = HelmertTransform(20.4894e-6,
 							 -rad(0,0,0.1502),
 							 -rad(0,0,0.2470),
@@ -176,10 +183,118 @@ def WGS84toOSGB36(latitude, longitude, radians=False):
     
     latitude_os,longitude_os = xyz_to_lat_long(osgb_xyz[0], osgb_xyz[1], osgb_xyz[2], True, datum=osgb36)
     return np.array((latitude_os,longitude_os))
-   
 
+def OSGB36toWGS84(latitude, longitude, radians=False):
+    """ Wrapper to transform (latitude, longitude) pairs
+    from OS to GPS datum."""
+    if not radians:
+        latitude = rad(latitude)
+        longitude = rad(longitude)
 
-def get_easting_northing_from_lat_long(latitude, longitude, radians=False):
+    latitude_gps, longitude_gps = _osgb36_to_wgs84(np.asarray(latitude, dtype=float).reshape(-1),
+                                                   np.asarray(longitude, dtype=float).reshape(-1))
+    return np.array((latitude_gps, longitude_gps))
+
+
+def _meridional_arc(latitude, datum):
+    """Meridional arc M from the true origin latitude, as used by the OS projection."""
+    n = datum.n
+    dphi = latitude - datum.phi_0
+    sphi = latitude + datum.phi_0
+    return datum.b*datum.F_0*((1+n+(5/4)*n**2+(5/4)*n**3)*dphi
+                              -(3*n+3*n**2+(21/8)*n**3)*sin(dphi)*cos(sphi)
+                              +(15/8*n**2+15/8*n**3)*sin(2*dphi)*cos(2*sphi)
+                              -(35/24*n**3)*sin(3*dphi)*cos(3*sphi))
+
+
+def _check_out(out, shape, dtype):
+    """Check preallocated output arrays can be written through flat views, as the chunk loops do."""
+    for array_ in out:
+        if not isinstance(array_, np.ndarray) or array_.shape != shape or array_.dtype != dtype:
+            raise ValueError('out arrays must be numpy arrays of shape %s and dtype %s'
+                             % (shape, np.dtype(dtype)))
+        if not array_.flags.c_contiguous or not array_.flags.writeable:
+            raise ValueError('out arrays must be writeable and C contiguous')
+    return out
+
+
+def _newton_latitude(z, p, datum, iterations=6):
+    """Solve for the latitude, in radians, of body Cartesian coordinates with `p = sqrt(x**2 + y**2)`.
+
+    Newton iterations on `(z + e2*nu*sin(lat))/p - tan(lat) = 0`, from the
+    spherical first guess. Works in the precision of the input arrays.
+    """
+    one = z.dtype.type(1)
+    latitude = arctan2(z, p*(one - datum.e2))
+    for _ in range(iterations):
+        sin_lat = sin(latitude)
+        cos_lat = cos(latitude)
+        w = one - datum.e2*sin_lat**2
+        nu = datum.a*datum.F_0/sqrt(w)
+        dnu = datum.e2*nu*cos_lat*sin_lat/w
+        f0 = (z + datum.e2*nu*sin_lat)/p - sin_lat/cos_lat
+        f1 = datum.e2*(nu*cos_lat + dnu*sin_lat)/p - one/cos_lat**2
+        latitude -= f0/f1
+    return latitude
+
+
+def _easting_northing_chunk(latitude, longitude, easting, northing):
+    """Convert one chunk of GPS (latitude, longitude) in radians to OS (easting, northing).
+
+    Fused form of `WGS84toOSGB36` followed by the OS transverse Mercator projection:
+    each trigonometric term is evaluated once and the results written into `easting`
+    and `northing`. Works in the precision of the input arrays.
+    """
+    one = latitude.dtype.type(1)
+
+    # GPS latitude and longitude to body Cartesian coordinates, on the WGS84 ellipsoid
+    sin_lat = sin(latitude)
+    cos_lat = cos(latitude)
+    nu = wgs84.a*wgs84.F_0/sqrt(one - wgs84.e2*sin_lat**2)
+    xyz = np.empty((3, len(latitude)), dtype=latitude.dtype)
+    np.multiply((nu + wgs84.H)*cos_lat, cos(longitude), out=xyz[0])
+    np.multiply((nu + wgs84.H)*cos_lat, sin(longitude), out=xyz[1])
+    np.multiply((one - wgs84.e2)*nu + wgs84.H, sin_lat, out=xyz[2])
+
+    # Helmert transform to the OSGB36 datum
+    transform = WGS84toOSGB36transform
+    x, y, z = (transform.M.astype(latitude.dtype).dot(xyz)
+               + transform.T.astype(latitude.dtype))
+
+    # back to latitude and longitude, on the Airy ellipsoid
+    p = sqrt(x**2 + y**2)
+    longitude_os = arctan2(y, x)
+    latitude_os = _newton_latitude(z, p, osgb36)
+
+    # transverse Mercator projection, with the longitude series in Horner form
+    sin_lat = sin(latitude_os)
+    cos_lat = cos(latitude_os)
+    tan2 = (sin_lat/cos_lat)**2
+    w = one - osgb36.e2*sin_lat**2
+    nu = osgb36.a*osgb36.F_0/sqrt(w)
+    nu_rho = w/(one - osgb36.e2)
+    eta2 = nu_rho - one
+    cos2 = cos_lat**2
+    nu_sin_cos = nu*sin_lat*cos_lat
+
+    ii = nu_sin_cos/2
+    iii = nu_sin_cos*cos2/24*(5 - tan2 + 9*eta2)
+    iiia = nu_sin_cos*cos2**2/720*(61 - 58*tan2 + tan2**2)
+    iv = nu*cos_lat
+    v = iv*cos2/6*(nu_rho - tan2)
+    vi = iv*cos2**2/120*(5 - 18*tan2 + tan2**2 + 14*eta2 - 58*tan2*eta2)
+
+    dlam = longitude_os - osgb36.lam_0
+    dlam2 = dlam**2
+    np.multiply(dlam, iv + dlam2*(v + dlam2*vi), out=easting)
+    easting += osgb36.E_0
+    np.multiply(dlam2, ii + dlam2*(iii + dlam2*iiia), out=northing)
+    northing += _meridional_arc(latitude_os, osgb36) + osgb36.N_0
+
+
+@timed('geo.get_easting_northing_from_lat_long')
+def get_easting_northing_from_lat_long(latitude, longitude, radians=False, out=None,
+                                       dtype=np.float64, chunk_size=65536):
     """ Convert GPS (latitude, longitude) to OS (easting, northing).
     
     Parameters
@@ -190,6 +305,13 @@ def get_easting_northing_from_lat_long(latitude, longitude, radians=False):
                 Lonitudes to convert.
     radians : bool, optional
               Set to `True` if input is in radians. Otherwise degrees are assumed
+    out : tuple of two ndarrays, optional
+          Preallocated (easting, northing) arrays of the input shape and `dtype`, C contiguous, to write into.
+    dtype : numpy dtype, optional
+            Precision to work in. `numpy.float32` halves memory use, at the cost of
+            errors of up to a few metres.
+    chunk_size : int, optional
+                 Number of points converted at a time, bounding temporary memory.
     
     Returns
     -------
@@ -199,43 +321,164 @@ def get_easting_northing_from_lat_long(latitude, longitude, radians=False):
     northing : ndarray of floats
               OS Northings of input
 
+    Both have the shape of the input, or one element for scalar input.
+
     References
     ----------
 
     A guide to coordinate systems in Great Britain 
     (https://webarchive.nationalarchives.gov.uk/20081023180830/http://www.ordnancesurvey.co.uk/oswebsite/gps/information/coordinatesystemsinfo/guidecontents/index.html)
     """ 
-    latitude_gps = np.array(latitude)
-    longitude_gps = np.array(longitude)
-    
-    if not radians:
-        latitude_gps = rad(latitude_gps)
-        longitude_gps = rad(longitude_gps)
+    # scalars give 1 element arrays, as the unchunked transform did
+    latitude = np.atleast_1d(np.asarray(latitude, dtype=dtype))
+    longitude = np.atleast_1d(np.asarray(longitude, dtype=dtype))
+    if out is None:
+        out = (np.empty(latitude.shape, dtype=dtype), np.empty(latitude.shape, dtype=dtype))
+    easting, northing = _check_out(out, latitude.shape, dtype)
+
+    flat_latitude = latitude.reshape(-1)
+    flat_longitude = longitude.reshape(-1)
+    flat_easting = easting.reshape(-1)
+    flat_northing = northing.reshape(-1)
+    for lo in range(0, flat_latitude.size, chunk_size):
+        chunk = slice(lo, lo + chunk_size)
+        lat, lon = flat_latitude[chunk], flat_longitude[chunk]
+        if not radians:
+            lat, lon = rad(lat).astype(dtype), rad(lon).astype(dtype)
+        _easting_northing_chunk(lat, lon, flat_easting[chunk], flat_northing[chunk])
+
+    return easting, northing
+
+
+def _osgb36_to_wgs84(latitude, longitude):
+    """Inverse of `WGS84toOSGB36` for arrays of (latitude, longitude) in radians.
+
+    Points are placed on the Airy ellipsoid, moved through the inverse Helmert
+    transform and projected back onto the WGS84 ellipsoid. The height above the
+    Airy ellipsoid is then corrected so the point lands on the WGS84 ellipsoid,
+    as `WGS84toOSGB36` assumes.
+    """
+    one = latitude.dtype.type(1)
+    sin_lat = sin(latitude)
+    cos_lat = cos(latitude)
+    nu = osgb36.a*osgb36.F_0/sqrt(one - osgb36.e2*sin_lat**2)
+    height = np.zeros_like(latitude)
+    xyz = np.empty((3, len(latitude)), dtype=latitude.dtype)
+
+    for _ in range(2):
+        np.multiply((nu + height)*cos_lat, cos(longitude), out=xyz[0])
+        np.multiply((nu + height)*cos_lat, sin(longitude), out=xyz[1])
+        np.multiply((one - osgb36.e2)*nu + height, sin_lat, out=xyz[2])
+        x, y, z = WGS84toOSGB36transform.inverse(xyz).astype(latitude.dtype)
+
+        # fixed point iteration for latitude, gaining a factor of about e2 in accuracy each time
+        p = sqrt(x**2 + y**2)
+        latitude_gps = arctan2(z, p*(one - wgs84.e2))
+        for _ in range(6):
+            nu_gps = wgs84.a*wgs84.F_0/sqrt(one - wgs84.e2*sin(latitude_gps)**2)
+            latitude_gps = arctan2(z + wgs84.e2*nu_gps*sin(latitude_gps), p)
+        height -= p/cos(latitude_gps) - nu_gps
+
+    return latitude_gps, arctan2(y, x)
+
+
+def _lat_long_chunk(easting, northing, latitude, longitude):
+    """Convert one chunk of OS (easting, northing) to GPS (latitude, longitude) in radians.
+
+    Inverts the OS transverse Mercator projection, then `WGS84toOSGB36`, writing
+    the results into `latitude` and `longitude`. The easting series is evaluated
+    in Horner form in (easting - E_0)/nu, which keeps it in single precision range.
+    Works in the precision of the input arrays.
+    """
+    one = easting.dtype.type(1)
+
+    # latitude with the meridional arc of the northing, to within 0.01mm
+    arc = northing - osgb36.N_0
+    latitude_os = arc/(osgb36.a*osgb36.F_0) + osgb36.phi_0
+    for _ in range(10):
+        residual = arc - _meridional_arc(latitude_os, osgb36)
+        if not np.any(np.abs(residual) >= 1.0e-5):
+            break
+        latitude_os += residual/(osgb36.a*osgb36.F_0)
+
+    sin_lat = sin(latitude_os)
+    cos_lat = cos(latitude_os)
+    tan_lat = sin_lat/cos_lat
+    tan2 = tan_lat**2
+    w = one - osgb36.e2*sin_lat**2
+    nu = osgb36.a*osgb36.F_0/sqrt(w)
+    nu_rho = w/(one - osgb36.e2)
+    eta2 = nu_rho - one
+
+    q = (easting - osgb36.E_0)/nu
+    q2 = q**2
+    latitude_os -= tan_lat*nu_rho/2*q2*(1 - q2/12*(5 + 3*tan2 + eta2 - 9*tan2*eta2
+                                                    - q2/30*(61 + 90*tan2 + 45*tan2**2)))
+    longitude_os = osgb36.lam_0 + q/cos_lat*(1 - q2/6*(nu_rho + 2*tan2
+                                                       - q2/20*(5 + 28*tan2 + 24*tan2**2
+                                                                - q2/42*(61 + 662*tan2 + 1320*tan2**2
+                                                                         + 720*tan2**3))))
+
+    latitude[:], longitude[:] = _osgb36_to_wgs84(latitude_os, longitude_os)
+
+
+@timed('geo.get_lat_long_from_easting_northing')
+def get_lat_long_from_easting_northing(easting, northing, radians=False, out=None,
+                                       dtype=np.float64, chunk_size=65536):
+    """ Convert OS (easting, northing) to GPS (latitude, longitude).
+
+    Inverse of `get_easting_northing_from_lat_long`.
+
+    Parameters
+    ----------
 
-    latitude_os,longitude_os = WGS84toOSGB36(latitude_gps, longitude_gps, True)
+    easting : sequence of floats
+              OS Eastings to convert.
+    northing : sequence of floats
+               OS Northings to convert.
+    radians : bool, optional
+              Set to `True` for output in radians. Otherwise degrees are returned
+    out : tuple of two ndarrays, optional
+          Preallocated (latitude, longitude) arrays of the input shape and `dtype`, C contiguous, to write into.
+    dtype : numpy dtype, optional
+            Precision to work in. `numpy.float32` halves memory use, at the cost of
+            errors of up to a few metres.
+    chunk_size : int, optional
+                 Number of points converted at a time, bounding temporary memory.
 
-    nu = osgb36.a*osgb36.F_0/sqrt(1-osgb36.e2*sin(latitude_os)**2)
-    rho = osgb36.a*osgb36.F_0*(1-osgb36.e2)/(((1-osgb36.e2*(sin(latitude_os))**2))**(3/2))   
-    eta = sqrt(nu/rho-1)
+    Returns
+    -------
 
-    n = osgb36.n
-    m = osgb36.b*osgb36.F_0*((1+n+(5/4)*((n)**2)+(5/4)*((n)**3))*(latitude_os-osgb36.phi_0)
-                             -(3*n+3*(n)**2+(21/8)*(n)**3)*sin(latitude_os-osgb36.phi_0)*cos(latitude_os+osgb36.phi_0)
-                             +(15/8*(n)**2+15/8*(n)**3)*sin(2*(latitude_os-osgb36.phi_0))*cos(2*latitude_os+2*osgb36.phi_0)
-                             -(35/24*(n)**3)*sin(3*(latitude_os-osgb36.phi_0))*cos(3*(latitude_os+osgb36.phi_0)))
-    
-    one_rn = m+osgb36.N_0
-    two_rn = (nu/2)*sin(latitude_os)*cos(latitude_os)
-    three_rn = (nu/24)*sin(latitude_os)*(cos(latitude_os)**3)*(5-tan(latitude_os)**2+9*(eta**2))
-    three_a_rn = (nu/720)*sin(latitude_os)*(cos(latitude_os)**5)*(61-58*tan(latitude_os)**2+(tan(latitude_os)**4))
-    four_rn = nu*cos(latitude_os)
-    five_rn = (nu/6)*(cos(latitude_os)**3)*((nu/rho)-tan(latitude_os)**2)
-    sive_rn = (nu/120)*(cos(latitude_os)**5)*(5-18*(tan(latitude_os)**2)+(tan(latitude_os)**4)+14*(eta**2)-58*(tan(latitude_os)**2)*(eta**2))
-
-    easting = osgb36.E_0 + four_rn*(longitude_os - osgb36.lam_0) + five_rn*(longitude_os - osgb36.lam_0)**3 + sive_rn*(longitude_os - osgb36.lam_0)**5
-    northing = one_rn + two_rn*(longitude_os - osgb36.lam_0)**2 + three_rn*(longitude_os - osgb36.lam_0)**4 + three_a_rn*(longitude_os - osgb36.lam_0)**6
-
-    return  easting, northing
-    
+    latitude : ndarray of floats
+               GPS latitudes of input
+    longitude : ndarray of floats
+                GPS longitudes of input
 
+    Both have the shape of the input, or one element for scalar input.
 
+    References
+    ----------
+
+    A guide to coordinate systems in Great Britain
+    (https://webarchive.nationalarchives.gov.uk/20081023180830/http://www.ordnancesurvey.co.uk/oswebsite/gps/information/coordinatesystemsinfo/guidecontents/index.html)
+    """
+    # scalars give 1 element arrays, as the unchunked transform did
+    easting = np.atleast_1d(np.asarray(easting, dtype=dtype))
+    northing = np.atleast_1d(np.asarray(northing, dtype=dtype))
+    if out is None:
+        out = (np.empty(easting.shape, dtype=dtype), np.empty(easting.shape, dtype=dtype))
+    latitude, longitude = _check_out(out, easting.shape, dtype)
+
+    flat_easting = easting.reshape(-1)
+    flat_northing = northing.reshape(-1)
+    flat_latitude = latitude.reshape(-1)
+    flat_longitude = longitude.reshape(-1)
+    for lo in range(0, flat_easting.size, chunk_size):
+        chunk = slice(lo, lo + chunk_size)
+        _lat_long_chunk(flat_easting[chunk], flat_northing[chunk],
+                        flat_latitude[chunk], flat_longitude[chunk])
+        if not radians:
+            flat_latitude[chunk] = deg(flat_latitude[chunk])
+            flat_longitude[chunk] = deg(flat_longitude[chunk])
+
+    return latitude, longitude
@@ -0,0 +1,259 @@
+"""On-disk cache of HTTP responses, with expiry times set per endpoint."""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+import weakref
+
+from .store import CACHE_DIRECTORY
+
+__all__ = ['HTTPCache', 'DEFAULT_TTLS']
+
+# Seconds a response stays fresh, by the first pattern matching the URL path.
+# Archives never change once published, station and measure lists rarely do.
+DEFAULT_TTLS = [(r'/archive/', 30*24*3600),
+                (r'/id/stations(\.csv|\.json)?$', 24*3600),
+                (r'/id/measures(\.csv|\.json)?$', 24*3600),
+                (r'/readings', 60)]
+
+
+def _write(path, data):
+    """Write a file atomically, so concurrent readers never see part of it."""
+    tmp = '%s.tmp-%s' % (path, uuid.uuid4().hex)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _flush(directory, entries, dirty, lock):
+    """Write the metadata of the entries whose access times changed since last written."""
+    with lock:
+        data = {key: json.dumps(entries[key]).encode() for key in dirty if key in entries}
+        dirty.clear()
+    for key, value in data.items():
+        try:
+            _write(os.path.join(directory, key + '.json'), value)
+        except OSError:
+            pass
+
+
+class HTTPCache(object):
+    """Cache of HTTP response bodies in a directory, evicting the least recently used.
+
+    A response younger than the time to live (TTL) of its endpoint is served
+    from the cache without a request. An older one is revalidated with the
+    `ETag` and `Last-Modified` headers it was sent with, so an unchanged
+    resource costs a `304 Not Modified` response rather than a download.
+    Responses without either header are downloaded again once stale.
+
+    The cache is safe to share between threads. Counts of `hits` (served
+    fresh), `revalidated` (stale but unchanged), `misses` (downloaded) and
+    `evictions` are kept on the instance, see `stats`.
+
+    Access times, which decide what is evicted, are kept in memory and written
+    to disk at most every `flush_interval` seconds, on `store`, and on `close`
+    or exit, so that cache hits don't each cost a disk write.
+    """
+
+    def __init__(self, directory=None, max_bytes=512*2**20, ttls=None, default_ttl=0,
+                 flush_interval=60.0):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            Directory holding the cache, by default next to the `Tool` resource
+            files, in `flood_tool/resources/.flood_tool_cache/http`.
+        max_bytes : int, optional
+            Largest total size of cached bodies. Larger single responses aren't cached.
+        ttls : sequence of (str, float) pairs, optional
+            Regular expressions searched for in URL paths, with the seconds a
+            matching response stays fresh, by default `DEFAULT_TTLS`.
+        default_ttl : float, optional
+            Seconds responses to other URLs stay fresh. With 0 they are always revalidated.
+        flush_interval : float, optional
+            Longest time in seconds that access times of cache hits are held
+            in memory before being written to disk.
+        """
+        if directory is None:
+            directory = os.path.join(os.getcwd(), 'flood_tool', 'resources', CACHE_DIRECTORY, 'http')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (DEFAULT_TTLS if ttls is None else ttls)]
+        self.default_ttl = default_ttl
+        self.flush_interval = flush_interval
+        self.hits = self.revalidated = self.misses = self.evictions = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._entries = {}
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(directory, name)) as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self._entries[name[:-5]] = entry
+        self._size = sum(entry['size'] for entry in self._entries.values())
+        # keys of entries accessed since their metadata was last written
+        self._dirty = set()
+        self._flushed = time.monotonic()
+        self._finalizer = weakref.finalize(self, _flush, directory, self._entries, self._dirty, self._lock)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Get the cache counters, with the number and total size of cached responses."""
+        with self._lock:
+            return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._size}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def flush(self):
+        """Write the access times of entries used since they were last written."""
+        self._flushed = time.monotonic()
+        _flush(self.directory, self._entries, self._dirty, self._lock)
+
+    def close(self):
+        """Write the access times held in memory. The cache can still be used afterwards."""
+        self.flush()
+
+    def ttl(self, url):
+        """Get the seconds a response from a URL stays fresh."""
+        path = urllib.parse.urlsplit(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def _read_body(self, key):
+        try:
+            with open(self._path(key, '.body'), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _remove(self, key):
+        """Forget an entry and delete its files. Call with the lock held."""
+        entry = self._entries.pop(key, None)
+        self._dirty.discard(key)
+        if entry is not None:
+            self._size -= entry['size']
+        for extension in ('.json', '.body'):
+            try:
+                os.remove(self._path(key, extension))
+            except OSError:
+                pass
+
+    def lookup(self, url):
+        """Look up a cached response to a URL.
+
+        Returns
+        -------
+
+        body: bytes or None
+            Body of the response if it is fresh, to be used without a request.
+        headers: dict
+            Conditional request headers to revalidate a stale response with, if any.
+        """
+        key = self._key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['url'] != url:
+                return None, {}
+            entry['accessed'] = time.time()
+            self._dirty.add(key)
+            fresh = time.time() - entry['stored'] < self.ttl(url)
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+        if fresh:
+            body = self._read_body(key)
+            if body is not None:
+                with self._lock:
+                    self.hits += 1
+                return body, {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return None, headers
+
+    def revalidate(self, url):
+        """Mark a cached response as fresh again after a `304 Not Modified`, returning its body.
+
+        Returns `None` if the response is no longer cached.
+        """
+        key = self._key(url)
+        body = self._read_body(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or body is None:
+                return None
+            entry['stored'] = time.time()
+            self.revalidated += 1
+            self._dirty.discard(key)
+            data = json.dumps(entry).encode()
+        _write(self._path(key, '.json'), data)
+        return body
+
+    def store(self, url, headers, body):
+        """Cache a downloaded response, evicting the least recently used to stay within `max_bytes`.
+
+        Parameters
+        ----------
+
+        url: str
+            The URL requested.
+        headers: mapping
+            The response headers.
+        body: bytes
+            The response body.
+        """
+        key = self._key(url)
+        with self._lock:
+            self.misses += 1
+        if 'no-store' in (headers.get('Cache-Control') or '') or len(body) > self.max_bytes:
+            return
+        now = time.time()
+        entry = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+                 'stored': now, 'accessed': now, 'size': len(body)}
+        _write(self._path(key, '.body'), body)
+        _write(self._path(key, '.json'), json.dumps(entry).encode())
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._size -= old['size']
+            self._entries[key] = entry
+            self._size += len(body)
+            if self._size > self.max_bytes:
+                for victim in sorted(self._entries, key=lambda k: self._entries[k]['accessed']):
+                    if self._size <= self.max_bytes:
+                        break
+                    if victim != key:
+                        self._remove(victim)
+                        self.evictions += 1
+        # keep the access times of other entries for eviction in later runs
+        self.flush()
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
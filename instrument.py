@@ -0,0 +1,185 @@
+"""Low overhead timing of the stages of `Tool` queries and `geo` conversions.
+
+Recording is off by default, when each instrumented call costs a flag
+check. Turn it on to see where a slow job spends its time::
+
+    from flood_tool import instrument
+    instrument.enable()
+    tool.get_sorted_annual_flood_risk(postcodes)
+    instrument.stats()['tool.band_search']
+    # {'calls': 1, 'seconds': 0.91, 'rows': 100000, 'max_rows': 100000}
+
+or set the environment variable `FLOOD_TOOL_STATS=1` before starting Python,
+or `FLOOD_TOOL_STATS=log` to also log each stage as JSON to the
+`flood_tool.stats` logger.
+
+Stages are named by module and step:
+
+- `tool.load.<name>`: loading a file or building an index, with its rows
+- `tool.normalise`: normalising postcodes
+- `tool.lookup`: finding postcodes in the postcode table
+- `tool.band_search`: finding the risk circles containing locations
+- `tool.sorted_frame`: building the DataFrames of the sorted queries
+- `tool.<method>`: each query method of `Tool`, including the stages above
+- `geo.<function>`: coordinate conversions
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+__all__ = ['enable', 'disable', 'enabled', 'reset', 'stats', 'stage', 'timed']
+
+logger = logging.getLogger('flood_tool.stats')
+
+_enabled = False
+_log = False
+_lock = threading.Lock()
+# calls, seconds, rows and largest rows of each stage, by name
+_stages = {}
+
+
+def enable(log=False):
+    """Start recording stages.
+
+    Parameters
+    ----------
+
+    log: bool, optional
+        Also log each stage as it ends, as a JSON object with `stage`,
+        `seconds` and `rows`, at INFO level to the `flood_tool.stats` logger.
+    """
+    global _enabled, _log
+    _log = log
+    _enabled = True
+
+
+def disable():
+    """Stop recording stages, keeping those recorded so far."""
+    global _enabled, _log
+    _enabled = _log = False
+
+
+def enabled():
+    """Whether stages are being recorded."""
+    return _enabled
+
+
+def reset():
+    """Forget the stages recorded so far."""
+    with _lock:
+        _stages.clear()
+
+
+def stats():
+    """Get the recorded stages.
+
+    Returns
+    -------
+
+    dict
+        For each stage by name, the number of `calls`, total wall time in
+        `seconds` (including that of stages within it), total `rows` given to
+        it and the most `max_rows` in one call. Rows are 0 for stages that
+        don't count any.
+    """
+    with _lock:
+        return {name: {'calls': calls, 'seconds': seconds, 'rows': rows, 'max_rows': max_rows}
+                for name, (calls, seconds, rows, max_rows) in sorted(_stages.items())}
+
+
+def _record(name, seconds, rows):
+    with _lock:
+        recorded = _stages.get(name)
+        if recorded is None:
+            recorded = _stages[name] = [0, 0., 0, 0]
+        recorded[0] += 1
+        recorded[1] += seconds
+        if rows is not None:
+            recorded[2] += rows
+            recorded[3] = max(recorded[3], rows)
+    if _log:
+        fields = {'stage': name, 'seconds': seconds, 'rows': rows}
+        logger.info(json.dumps(fields), extra=fields)
+
+
+class _Stage(object):
+    """Times a block as a stage, see `stage`."""
+
+    __slots__ = ('name', 'rows', 'start')
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, time.perf_counter() - self.start, self.rows)
+
+
+class _NullStage(object):
+    """Stands in for `_Stage` while recording is off, ignoring everything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None):
+    """Time a block of code as a stage::
+
+        with stage('tool.lookup', len(postcodes)):
+            ...
+
+    Rows can also be set once known, with `with stage(name) as s: ... s.rows = n`.
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, rows)
+
+
+def _length(values):
+    try:
+        return len(values)
+    except TypeError:
+        return None
+
+
+def timed(name, argument=0):
+    """Decorate a function to time its calls as a stage.
+
+    Parameters
+    ----------
+
+    name: str
+        Name of the stage.
+    argument: int, optional
+        Position of the argument whose length is counted as the rows of a call,
+        1 for the first argument of a method.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Stage(name, _length(args[argument]) if len(args) > argument else None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+if os.environ.get('FLOOD_TOOL_STATS', '0') != '0':
+    enable(log=os.environ['FLOOD_TOOL_STATS'].lower() == 'log')
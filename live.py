@@ -1,6 +1,64 @@
 """Live and historical flood monitoring data from the Environment Agency API"""
+import asyncio
+import urllib.parse
 
-__all__  = []
+__all__  = ['get_stations', 'get_station_readings']
 
 LIVE_URL = "http://environment.data.gov.uk/flood-monitoring/id/stations"
-ARCHIVE_URL = "http://environment.data.gov.uk/flood-monitoring/archive/"
\ No newline at end of file
+ARCHIVE_URL = "http://environment.data.gov.uk/flood-monitoring/archive/"
+
+
+def station_readings_url(reference, url=LIVE_URL):
+    """URL of the .csv file of readings of a monitoring station."""
+    return url + '/' + urllib.parse.quote(str(reference)) + '/readings.csv'
+
+
+async def get_stations(fetcher, url=LIVE_URL, **query):
+    """Get monitoring stations from the Environment Agency API.
+
+    Parameters
+    ----------
+
+    fetcher: fetch.Fetcher
+        Fetcher to make the request with.
+    url: str, optional
+        URL of the stations endpoint, without the `.csv` extension.
+    query:
+        Query parameters filtering the stations, e.g. `parameter='rainfall'`, or
+        `lat`, `long` and `dist` for stations within `dist` km of a location.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        One row per station, including `stationReference`, `lat` and `long` columns.
+    """
+    return await fetcher.fetch_csv(url + '.csv?' + urllib.parse.urlencode(query))
+
+
+async def get_station_readings(fetcher, references, url=LIVE_URL, return_exceptions=False):
+    """Get the latest readings of several monitoring stations concurrently.
+
+    Parameters
+    ----------
+
+    fetcher: fetch.Fetcher
+        Fetcher to make the requests with, which bounds how many run at once.
+    references: sequence of strs
+        Station references, as in the `stationReference` column of `get_stations`.
+    url: str, optional
+        URL of the stations endpoint.
+    return_exceptions: bool, optional
+        Return the exception for a station that fails in place of its readings,
+        rather than raising it.
+
+    Returns
+    -------
+
+    list of pandas.DataFrame
+        Readings of each station, in the order of `references`, with `dateTime`
+        and `value` columns.
+    """
+    return list(await asyncio.gather(*(fetcher.fetch_csv(station_readings_url(reference, url))
+                                       for reference in references),
+                                     return_exceptions=return_exceptions))
@@ -0,0 +1,124 @@
+"""Parallel execution of `Tool` queries across a process pool."""
+import multiprocessing
+
+import numpy as np
+
+from .tool import Tool, _sorted_probability_frame, _sorted_risk_frame
+
+__all__ = ['ToolPool']
+
+# The tool each worker process answers queries with, set by _init_worker
+_worker_tool = None
+
+
+def _init_worker(tool):
+    global _worker_tool
+    _worker_tool = tool
+
+
+def _score_positions(tool, positions):
+    ranks = tool._band_ranks(positions)
+    return ranks, tool._flood_risk(positions, ranks)
+
+
+def _run(task):
+    """Apply `function(tool, *args)` with the worker's tool."""
+    function, args = task
+    return function(_worker_tool, *args)
+
+
+class ToolPool(object):
+    """Process pool answering `Tool` queries in parallel, merging results in input order.
+
+    Batches larger than `chunk_size` are split into chunks, scored by the worker
+    processes and merged back in input order. Smaller batches are answered by
+    the tool in this process, as the pool would only add overhead.
+
+    Workers don't re-read the .csv files. With the `fork` start method (the
+    default where available) the tool is loaded before the workers start, and
+    they share its tables copy-on-write. With other start methods each worker
+    attaches to the tool's tables if it has published them (see `Tool.publish`),
+    or else loads its binary cache, which is memory mapped and so shared through
+    the page cache.
+
+    The pool can be used as a context manager, closing it on exit.
+    """
+
+    def __init__(self, tool, processes=None, chunk_size=2**16, start_method=None):
+        """
+        Parameters
+        ----------
+        tool : Tool
+            Tool to answer queries with.
+        processes : int, optional
+            Number of worker processes, by default the number of CPUs.
+        chunk_size : int, optional
+            Number of postcodes or locations sent to a worker at a time.
+        start_method : str, optional
+            `multiprocessing` start method for the workers.
+        """
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        if start_method == 'fork':
+            tool.warm()
+        self.tool = tool
+        self.chunk_size = chunk_size
+        self.processes = processes or multiprocessing.cpu_count()
+        self._pool = multiprocessing.get_context(start_method).Pool(self.processes, _init_worker, (tool,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes once they finish their work."""
+        self._pool.close()
+        self._pool.join()
+
+    def _map(self, function, *arrays):
+        """Apply `function(tool, *chunks)` to matching chunks of arrays, returning a list of results."""
+        arrays = [np.asarray(a) for a in arrays]
+        if len(arrays[0]) <= self.chunk_size:
+            return [function(self.tool, *arrays)]
+        bounds = range(0, len(arrays[0]), self.chunk_size)
+        tasks = [(function, [a[lo:lo+self.chunk_size] for a in arrays]) for lo in bounds]
+        return self._pool.map(_run, tasks, chunksize=1)
+
+    def get_lat_long(self, postcodes):
+        """As `Tool.get_lat_long`, in parallel."""
+        return np.concatenate(self._map(Tool.get_lat_long, postcodes))
+
+    def get_easting_northing_flood_probability(self, easting, northing):
+        """As `Tool.get_easting_northing_flood_probability`, in parallel."""
+        if len(easting) != len(northing):
+            return self.tool.get_easting_northing_flood_probability(easting, northing)
+        return np.concatenate(self._map(Tool.get_easting_northing_flood_probability,
+                                        np.asarray(easting, dtype=float),
+                                        np.asarray(northing, dtype=float)))
+
+    def get_flood_cost(self, postcodes):
+        """As `Tool.get_flood_cost`, in parallel."""
+        return np.concatenate(self._map(Tool.get_flood_cost, postcodes))
+
+    def get_annual_flood_risk(self, postcodes, probability_bands):
+        """As `Tool.get_annual_flood_risk`, in parallel."""
+        return np.concatenate(self._map(Tool.get_annual_flood_risk, postcodes, probability_bands))
+
+    def _score_unique(self, postcodes):
+        """Score valid postcodes in parallel, returning unique postcodes, band ranks and flood risks."""
+        postcodes, positions = self.tool._unique_valid_postcodes(postcodes)
+        parts = self._map(_score_positions, positions)
+        return (postcodes, np.concatenate([part[0] for part in parts]),
+                np.concatenate([part[1] for part in parts]))
+
+    def get_sorted_flood_probability(self, postcodes):
+        """As `Tool.get_sorted_flood_probability`, in parallel."""
+        postcodes, ranks, _ = self._score_unique(postcodes)
+        return _sorted_probability_frame(postcodes, ranks)
+
+    def get_sorted_annual_flood_risk(self, postcodes):
+        """As `Tool.get_sorted_annual_flood_risk`, in parallel."""
+        postcodes, _, risk = self._score_unique(postcodes)
+        return _sorted_risk_frame(postcodes, risk)
@@ -0,0 +1,253 @@
+"""Rainfall statistics of stations over ranges of days, from the local readings archive."""
+import numpy as np
+import pandas as pd
+
+__all__ = ['RainfallAggregator', 'aggregate_rainfall', 'summarise_rainfall']
+
+DAY = 24*3600
+# Spacing of stations in the combined sort key, far wider than any time span
+_STATION_STRIDE = 2**40
+
+
+def _window_name(window):
+    """Column name of the largest total over a rolling window, such as 'max_24h_total'."""
+    hours = window/3600
+    return 'max_%sh_total' % (int(hours) if hours == int(hours) else hours)
+
+
+class RainfallAggregator(object):
+    """Per-station rainfall statistics, built up one day at a time.
+
+    Each day's readings are read once, in a single pass, and combined with the
+    partial results of the days before, so memory use depends on the number
+    of stations, not the number of days. Statistics are the number of
+    readings, their total, largest and mean, and the largest total over each
+    rolling window, such as the wettest 24 hours. Windows span day boundaries,
+    carrying the last readings of each day over to the next.
+
+    Days must be added in order. Readings that aren't numbers (NaN) count as
+    no rain in totals and are left out of the number of readings, the largest
+    and the mean.
+    """
+
+    def __init__(self, windows=('1h', '24h')):
+        """
+        Parameters
+        ----------
+        windows : sequence of str or timedeltas, optional
+            Lengths of the rolling windows to find the largest totals over.
+        """
+        self.windows = [int(pd.Timedelta(window).total_seconds()) for window in windows]
+        self.days = 0
+        self._origin = None
+        self._last = None
+        self._ids = {}
+        self._count = np.zeros(0, np.int64)
+        self._total = np.zeros(0, np.float64)
+        self._max = np.zeros(0, np.float64)
+        self._window_max = np.zeros((len(self.windows), 0), np.float64)
+        # readings of the last day still inside the longest window, in absolute seconds
+        self._carry = (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float64))
+
+    def _station_ids(self, stations):
+        """Map station references of a day to ids across all days, growing the statistics."""
+        ids = np.array([self._ids.setdefault(s, len(self._ids)) for s in stations.tolist()],
+                       dtype=np.int64)
+        grow = len(self._ids) - len(self._count)
+        if grow:
+            self._count = np.concatenate([self._count, np.zeros(grow, np.int64)])
+            self._total = np.concatenate([self._total, np.zeros(grow)])
+            self._max = np.concatenate([self._max, np.full(grow, np.nan)])
+            self._window_max = np.concatenate([self._window_max,
+                                               np.full((len(self.windows), grow), np.nan)], axis=1)
+        return ids
+
+    def update(self, date, arrays):
+        """Add the readings of a day.
+
+        Parameters
+        ----------
+
+        date: str or date
+            The day, after any added before.
+        arrays: dict
+            Columns of the day's partition in a `archive.ReadingsArchive`, with
+            `stations`, `station`, `time` and `value` arrays.
+        """
+        date = pd.Timestamp(date).normalize()
+        if self._origin is None:
+            self._origin = date
+        if self._last is not None and date <= self._last:
+            raise ValueError('Days must be added in order, %s follows %s'
+                             % (date.date(), self._last.date()))
+        self._last = date
+        self.days += 1
+
+        station = self._station_ids(np.asarray(arrays['stations']))[np.asarray(arrays['station'])]
+        offset = (date - self._origin).days*DAY
+        time = np.asarray(arrays['time'], dtype=np.int64) + offset
+        value = np.asarray(arrays['value'], dtype=np.float64)
+
+        valid = ~np.isnan(value)
+        n = len(self._count)
+        self._count += np.bincount(station[valid], minlength=n)
+        rain = np.where(valid, value, 0.0)
+        self._total += np.bincount(station, rain, minlength=n)
+        day_max = np.full(n, -np.inf)
+        np.maximum.at(day_max, station[valid], value[valid])
+        self._max = np.fmax(self._max, np.where(np.isinf(day_max), np.nan, day_max))
+
+        if self.windows:
+            self._update_windows(station, time, rain, offset)
+
+    def _update_windows(self, station, time, rain, offset):
+        """Update the largest rolling totals with the windows ending on this day."""
+        carry_station, carry_time, carry_rain = self._carry
+        new = len(station)
+        station = np.concatenate([station, carry_station])
+        time = np.concatenate([time, carry_time])
+        rain = np.concatenate([rain, carry_rain])
+        is_new = np.arange(len(station)) < new
+
+        key = station*_STATION_STRIDE + time
+        order = np.argsort(key, kind='stable')
+        key, station, time, rain, is_new = (key[order], station[order], time[order],
+                                            rain[order], is_new[order])
+        cumulative = np.concatenate([[0.0], np.cumsum(rain)])
+        end = np.arange(1, len(key) + 1)
+        for i, window in enumerate(self.windows):
+            # each reading closes the window (time - window, time] of its own station
+            start = np.searchsorted(key, key - window, side='right')
+            totals = cumulative[end] - cumulative[start]
+            np.fmax.at(self._window_max[i], station[is_new], totals[is_new])
+
+        keep = time > offset + DAY - max(self.windows)
+        self._carry = (station[keep], time[keep], rain[keep])
+
+    def result(self):
+        """Get the statistics so far as a DataFrame indexed by station reference.
+
+        Has columns `readings`, `total`, `max` and `mean`, and a `max_<hours>h_total`
+        column for each rolling window, in order of station reference.
+        """
+        stations = np.array(list(self._ids), dtype=str)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self._total/self._count
+        frame = pd.DataFrame({'readings': self._count, 'total': self._total,
+                              'max': self._max, 'mean': np.where(self._count > 0, mean, np.nan)},
+                             index=pd.Index(stations, name='stationReference'))
+        for window, maxima in zip(self.windows, self._window_max):
+            frame[_window_name(window)] = maxima
+        return frame.sort_index()
+
+
+def aggregate_rainfall(archive, start, end, windows=('1h', '24h'), parameter='rainfall'):
+    """Get per-station rainfall statistics over a range of days in a readings archive.
+
+    Each day is memory mapped from the archive and read once, so a year of
+    readings can be summarised without loading it all. Days missing from the
+    archive are skipped; use `archive.backfill(start, end)` first to fetch them.
+
+    Parameters
+    ----------
+
+    archive: archive.ReadingsArchive
+        The archive to read.
+    start, end: str or date
+        First and last days to include.
+    windows: sequence of str or timedeltas, optional
+        Lengths of the rolling windows to find the largest totals over.
+    parameter: str, optional
+        The measured parameter to summarise.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        Statistics as given by `RainfallAggregator.result`.
+    """
+    aggregator = RainfallAggregator(windows)
+    for date, arrays in archive.partitions(start, end, parameter):
+        aggregator.update(date, arrays)
+    return aggregator.result()
+
+
+def _top(values, k):
+    """Positions of the `k` largest values, largest first, without sorting the rest.
+
+    Ties are broken by position, as a stable sort would. NaN values are never among the largest.
+    """
+    values = np.where(np.isnan(values), -np.inf, values)
+    k = min(k, int(np.isfinite(values).sum()))
+    if k == 0:
+        return np.zeros(0, np.intp)
+    # the k-th largest value, then the earliest of any values tied with it
+    threshold = values[np.argpartition(values, len(values) - k)[len(values) - k]]
+    greater = np.flatnonzero(values > threshold)
+    top = np.concatenate([greater, np.flatnonzero(values == threshold)[:k - len(greater)]])
+    return top[np.lexsort((top, -values[top]))]
+
+
+def summarise_rainfall(readings, k=5):
+    """Find the wettest stations and times of a set of readings in one pass.
+
+    Readings are grouped by station and by time once, and the largest are
+    picked out with a partial selection rather than sorting all readings.
+
+    Parameters
+    ----------
+
+    readings: pandas.DataFrame
+        Readings with `stationReference`, `dateTime` and numeric `value`
+        columns, such as from `archive.ReadingsArchive.read`.
+    k: int, optional
+        Number of stations and readings in the top lists.
+
+    Returns
+    -------
+
+    dict
+        With keys
+
+        - `highest_mean_station`: station with the highest mean reading
+        - `highest_mean`: its mean reading
+        - `highest_station`, `highest_time`, `highest_value`: station, time
+          and value of the highest single reading
+        - `peak_time`: time with the highest mean reading across stations
+        - `top_means`: Series of the `k` highest station means, highest first
+        - `top_readings`: DataFrame of the `k` highest readings, highest first
+
+        Stations and times are `None` and values NaN if there are no numeric readings.
+    """
+    value = np.asarray(readings['value'], dtype=np.float64)
+    valid = ~np.isnan(value)
+    rain = np.where(valid, value, 0.0)
+
+    station, stations = pd.factorize(readings['stationReference'])
+    time, times = pd.factorize(readings['dateTime'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        station_mean = (np.bincount(station, rain, len(stations))
+                        /np.bincount(station, valid, len(stations)))
+        time_mean = np.bincount(time, rain, len(times))/np.bincount(time, valid, len(times))
+
+    top_stations = _top(station_mean, k)
+    top_readings = _top(value, k)
+    top_times = _top(time_mean, 1)
+    summary = {'top_means': pd.Series(station_mean[top_stations], name='value',
+                                      index=pd.Index(np.asarray(stations)[top_stations],
+                                                     name='stationReference')),
+               'top_readings': readings.iloc[top_readings],
+               'peak_time': times[top_times[0]] if len(top_times) else None}
+    if len(top_stations):
+        summary['highest_mean_station'] = summary['top_means'].index[0]
+        summary['highest_mean'] = summary['top_means'].iloc[0]
+    else:
+        summary['highest_mean_station'], summary['highest_mean'] = None, np.nan
+    if len(top_readings):
+        first = readings.iloc[top_readings[0]]
+        summary['highest_station'] = first['stationReference']
+        summary['highest_time'] = first['dateTime']
+        summary['highest_value'] = value[top_readings[0]]
+    else:
+        summary['highest_station'], summary['highest_time'], summary['highest_value'] = None, None, np.nan
+    return summary
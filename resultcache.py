@@ -0,0 +1,115 @@
+"""Bounded least recently used cache of per-postcode query results."""
+import collections
+import threading
+
+import numpy as np
+
+__all__ = ['ResultCache']
+
+
+class ResultCache(object):
+    """Least recently used cache of fixed size records, keyed by string.
+
+    Records are rows of preallocated numpy columns, so memory is bounded by
+    `max_size` and batches of results are read and written with array
+    indexing; only the key bookkeeping is per key. Safe to share between threads.
+    """
+
+    def __init__(self, max_size, fields):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Largest number of records kept. Least recently used records are
+            evicted to make room for new ones.
+        fields : dict
+            numpy dtype of each field of a record, by name.
+        """
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.max_size = int(max_size)
+        self.columns = {name: np.empty(self.max_size, dtype) for name, dtype in fields.items()}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # row of each key, least recently used first
+        self._rows = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, keys):
+        """Look up records, marking the ones found as recently used.
+
+        Parameters
+        ----------
+
+        keys: sequence of strs
+            Keys to look up.
+
+        Returns
+        -------
+
+        found: numpy.ndarray of bools
+            Whether each key has a record.
+        records: dict
+            Field values of the records found, as arrays in order of `keys`.
+        """
+        keys = list(keys)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is not None:
+                    self._rows.move_to_end(key)
+                    rows[i] = row
+            found = rows >= 0
+            records = {name: column[rows[found]] for name, column in self.columns.items()}
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found, records
+
+    def put(self, keys, records):
+        """Store records, evicting the least recently used ones beyond `max_size`.
+
+        Parameters
+        ----------
+
+        keys: sequence of strs
+            Distinct keys to store.
+        records: dict
+            Array of values of each field, in order of `keys`.
+        """
+        keys = list(keys)
+        # of more keys than fit, the earlier ones would only be evicted by the later ones
+        start = max(len(keys) - self.max_size, 0)
+        rows = np.empty(len(keys) - start, dtype=np.int64)
+        with self._lock:
+            for i, key in enumerate(keys[start:]):
+                row = self._rows.get(key)
+                if row is not None:
+                    self._rows.move_to_end(key)
+                elif len(self._rows) < self.max_size:
+                    row = len(self._rows)
+                    self._rows[key] = row
+                else:
+                    _, row = self._rows.popitem(last=False)
+                    self._rows[key] = row
+                    self.evictions += 1
+                rows[i] = row
+            for name, column in self.columns.items():
+                column[rows] = np.asarray(records[name])[start:]
+
+    def clear(self):
+        """Remove every record, keeping the counters."""
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self):
+        """Get the cache counters, with the number of records held."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._rows), 'max_size': self.max_size}
@@ -0,0 +1,331 @@
+"""HTTP service answering `Tool` queries, with the tool's data loaded once.
+
+Run with::
+
+    python -m flood_tool.service --port 8000
+
+then, for example::
+
+    curl 'http://localhost:8000/annual_risk?postcode=DA1+1PT'
+    curl -d '{"postcodes": ["DA1 1PT", "CT14 7NW"]}' http://localhost:8000/probability
+    curl -H 'Content-Type: text/csv' -H 'Accept: text/csv' --data-binary @postcodes.csv \
+        http://localhost:8000/flood_cost
+"""
+import argparse
+import http.server
+import io
+import json
+import socket
+import threading
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from .geo import get_easting_northing_from_lat_long
+from .tool import Tool, normalise_postcodes
+
+__all__ = ['ScoringService']
+
+
+class RequestError(ValueError):
+    """Raised for a request the service can't answer, with the HTTP status to reply with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_value(value):
+    """Convert a numpy value to JSON, with NaN as null."""
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+class ScoringService(object):
+    """Answers batches of `Tool` queries, for the HTTP handler or direct use.
+
+    Endpoints each take postcodes and return a table with a `Postcode` column:
+
+    - `lat_long`: `Latitude` and `Longitude`
+    - `probability`: `Probability Band`, or for `easting` and `northing`
+      inputs, the band of each location
+    - `flood_cost`: `Flood Cost`
+    - `annual_risk`: `Probability Band` and `Flood Risk`, from the bands
+      given with the postcodes or else the bands of the postcodes
+    - `sorted_probability`, `sorted_risk`: as `Tool.get_sorted_flood_probability`
+      and `Tool.get_sorted_annual_flood_risk`
+
+    Postcodes are normalised and unknown ones give empty values. Batches of
+    `heavy_size` or more postcodes are heavy: at most `heavy_concurrency` of them run at once,
+    on a `parallel.ToolPool` when given one, while smaller batches are
+    answered straight away by the tool in this process. So large batches
+    queue behind each other rather than slowing single postcode queries.
+    With a `batching.BatchingTool`, concurrent small batches are answered
+    together in one call to the tool.
+    """
+
+    ENDPOINTS = ('lat_long', 'probability', 'flood_cost', 'annual_risk',
+                 'sorted_probability', 'sorted_risk')
+
+    def __init__(self, tool=None, pool=None, heavy_size=1000, heavy_concurrency=1, batching=None):
+        """
+        Parameters
+        ----------
+        tool : Tool, optional
+            Tool to answer queries with, by default a new `Tool()`. It is loaded
+            in full before the service starts answering.
+        pool : parallel.ToolPool, optional
+            Pool of worker processes to answer heavy batches with.
+        heavy_size : int, optional
+            Number of postcodes from which a batch counts as heavy.
+        heavy_concurrency : int, optional
+            Number of heavy batches answered at once.
+        batching : batching.BatchingTool, optional
+            Coalescer of `tool`'s queries to answer small batches with.
+        """
+        self.tool = (tool if tool is not None else Tool()).warm()
+        self.pool = pool
+        self.heavy_size = heavy_size
+        self.batching = batching
+        self._heavy = threading.BoundedSemaphore(heavy_concurrency)
+
+    def score(self, endpoint, postcodes=None, probability_bands=None, easting=None, northing=None):
+        """Answer a query.
+
+        Parameters
+        ----------
+
+        endpoint: str
+            One of `ENDPOINTS`.
+        postcodes: sequence of strs, optional
+            Postcodes to query.
+        probability_bands: sequence of strs, optional
+            Bands of the postcodes, for `annual_risk`.
+        easting, northing: sequences of floats, optional
+            Locations to query, for `probability`.
+
+        Returns
+        -------
+
+        pandas.DataFrame
+            The answer, one row per postcode or location.
+        """
+        if endpoint not in self.ENDPOINTS:
+            raise RequestError('Unknown endpoint: ' + endpoint, 404)
+        locations = endpoint == 'probability' and easting is not None
+        if locations:
+            if northing is None or len(easting) != len(northing):
+                raise RequestError('easting and northing must be the same length')
+            size = len(easting)
+        else:
+            if postcodes is None:
+                raise RequestError('No postcodes given')
+            postcodes = normalise_postcodes(postcodes)
+            size = len(postcodes)
+        if probability_bands is not None and len(probability_bands) != size:
+            raise RequestError('probability_bands must be the same length as postcodes')
+
+        if size < self.heavy_size:
+            engine = self.batching if self.batching is not None else self.tool
+            return self._score(engine, endpoint, postcodes, probability_bands, easting, northing)
+        with self._heavy:
+            engine = self.pool if self.pool is not None else self.tool
+            return self._score(engine, endpoint, postcodes, probability_bands, easting, northing)
+
+    def _score(self, engine, endpoint, postcodes, probability_bands, easting, northing):
+        """Answer a query with a `Tool` or `ToolPool`."""
+        if endpoint == 'probability' and easting is not None:
+            easting = np.asarray(easting, dtype=float)
+            northing = np.asarray(northing, dtype=float)
+            return pd.DataFrame({'Easting': easting, 'Northing': northing,
+                                 'Probability Band': engine.get_easting_northing_flood_probability(
+                                     easting, northing)})
+        if endpoint == 'sorted_probability':
+            return engine.get_sorted_flood_probability(postcodes).reset_index()
+        if endpoint == 'sorted_risk':
+            return engine.get_sorted_annual_flood_risk(postcodes).reset_index()
+
+        frame = pd.DataFrame({'Postcode': postcodes})
+        if endpoint == 'flood_cost':
+            frame['Flood Cost'] = engine.get_flood_cost(postcodes)
+            return frame
+
+        lat_long = engine.get_lat_long(postcodes)
+        if endpoint == 'lat_long':
+            frame['Latitude'], frame['Longitude'] = lat_long[:, 0], lat_long[:, 1]
+            return frame
+
+        if probability_bands is None:
+            known = ~np.isnan(lat_long[:, 0])
+            probability_bands = np.full(len(postcodes), None, dtype=object)
+            if known.any():
+                easting, northing = get_easting_northing_from_lat_long(lat_long[known, 0],
+                                                                       lat_long[known, 1])
+                probability_bands[known] = engine.get_easting_northing_flood_probability(easting, northing)
+        frame['Probability Band'] = probability_bands
+        if endpoint == 'annual_risk':
+            bands = np.where(pd.isnull(frame['Probability Band']), 'Zero', frame['Probability Band'])
+            risk = engine.get_annual_flood_risk(postcodes, bands)
+            frame['Flood Risk'] = np.where(pd.isnull(frame['Probability Band']), np.nan, risk)
+        return frame
+
+    def make_server(self, host='127.0.0.1', port=8000):
+        """Create a threaded HTTP server answering queries with this service.
+
+        Call `serve_forever` on the server to start it, and `shutdown` to stop it.
+        """
+        server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        server.service = self
+        return server
+
+
+def _parse_request(query, content_type, body):
+    """Get the query arguments from a URL query string and a JSON or .csv body."""
+    arguments = {}
+    query = urllib.parse.parse_qs(query)
+    for name, key in (('postcode', 'postcodes'), ('probability_band', 'probability_bands'),
+                      ('easting', 'easting'), ('northing', 'northing')):
+        if name in query or key in query:
+            arguments[key] = query.get(name, []) + query.get(key, [])
+
+    if body:
+        if content_type == 'text/csv':
+            try:
+                frame = pd.read_csv(io.BytesIO(body), dtype=str)
+            except (ValueError, pd.errors.ParserError) as e:
+                raise RequestError('Invalid .csv body: %s' % e)
+            columns = {column.lower().replace(' ', '_'): column for column in frame.columns}
+            for name, key in (('postcode', 'postcodes'), ('probability_band', 'probability_bands'),
+                              ('easting', 'easting'), ('northing', 'northing')):
+                if name in columns:
+                    arguments[key] = frame[columns[name]].tolist()
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError as e:
+                raise RequestError('Invalid JSON body: %s' % e)
+            if isinstance(data, list):
+                data = {'postcodes': data}
+            if not isinstance(data, dict):
+                raise RequestError('JSON body must be an object or a list of postcodes')
+            for key in ('postcodes', 'probability_bands', 'easting', 'northing'):
+                if key in data:
+                    arguments[key] = data[key]
+
+    for key in ('easting', 'northing'):
+        if key in arguments:
+            try:
+                arguments[key] = np.asarray(arguments[key], dtype=float)
+            except (TypeError, ValueError):
+                raise RequestError(key + ' must be numbers')
+    return arguments
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Handler for `ScoringService.make_server`, with persistent connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # headers and body are written separately, so don't let Nagle's algorithm hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._reply(status, json.dumps({'error': message}).encode(), 'application/json')
+
+    def _handle(self, body):
+        url = urllib.parse.urlsplit(self.path)
+        endpoint = url.path.strip('/')
+        if endpoint == 'health':
+            self._reply(200, b'{"status": "ok"}', 'application/json')
+            return
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        try:
+            arguments = _parse_request(url.query, content_type, body)
+            frame = self.server.service.score(endpoint, **arguments)
+        except RequestError as e:
+            self._error(e.status, str(e))
+            return
+        except Exception as e:
+            self._error(500, '%s: %s' % (type(e).__name__, e))
+            return
+
+        if 'text/csv' in (self.headers.get('Accept') or ''):
+            self._reply(200, frame.to_csv(index=False).encode(), 'text/csv')
+        else:
+            result = {column: [_json_value(v) for v in frame[column].tolist()] for column in frame.columns}
+            self._reply(200, json.dumps(result).encode(), 'application/json')
+
+    def do_GET(self):
+        self._handle(b'')
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # where the body ends is unknown, so the connection can't be reused
+            self.close_connection = True
+            self._error(400, 'Bad Content-Length')
+            return
+        self._handle(self.rfile.read(length))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve flood risk queries over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--processes', type=int, default=0,
+                        help='worker processes for heavy batches, 0 to answer them in this process')
+    parser.add_argument('--heavy-size', type=int, default=1000,
+                        help='number of postcodes from which a batch counts as heavy')
+    parser.add_argument('--batch-delay', type=float, default=None,
+                        help='seconds to wait to answer concurrent small batches together, '
+                             'by default answered separately')
+    parser.add_argument('--result-cache-size', type=int, default=0,
+                        help='number of recently queried postcodes to keep the answers of')
+    args = parser.parse_args(argv)
+
+    tool = Tool(result_cache_size=args.result_cache_size).warm()
+    pool = None
+    if args.processes:
+        from .parallel import ToolPool
+        pool = ToolPool(tool, args.processes)
+    batching = None
+    if args.batch_delay is not None:
+        from .batching import BatchingTool
+        batching = BatchingTool(tool, max_delay=args.batch_delay)
+    server = ScoringService(tool, pool, args.heavy_size,
+                            batching=batching).make_server(args.host, args.port)
+    print('Serving on http://%s:%d' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if pool is not None:
+            pool.close()
+        if batching is not None:
+            batching.close()
+
+
+if __name__ == '__main__':
+    main()
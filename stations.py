@@ -0,0 +1,163 @@
+"""Local catalogue of monitoring stations, with nearest station queries."""
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from . import geo
+from .fetch import Fetcher
+from .live import LIVE_URL, get_stations
+from .spatial import PointIndex
+
+__all__ = ['StationCatalogue']
+
+COLUMNS = ['stationReference', 'lat', 'long', 'easting', 'northing']
+
+
+def _numeric(column):
+    """Parse a coordinate column, taking the first of any '|' separated values."""
+    if column.dtype == object or pd.api.types.is_string_dtype(column):
+        column = column.astype(str).str.split('|').str[0]
+    return pd.to_numeric(column, errors='coerce').values.astype(np.float64)
+
+
+class StationCatalogue(object):
+    """Monitoring stations, with a spatial index for batched nearest station queries.
+
+    Stations are indexed by OS easting and northing, so the stations near
+    many postcodes are found at once, without a request per postcode::
+
+        catalogue = StationCatalogue.fetch('rainfall', cache=HTTPCache())
+        postcode, station, distance = catalogue.postcodes_within(tool, postcodes, 10000)
+    """
+
+    def __init__(self, stations):
+        """
+        Parameters
+        ----------
+        stations : pandas.DataFrame
+            Stations with a `stationReference` column and either `lat` and `long`
+            (WGS84) or `easting` and `northing` (OSGB36) columns, as in the
+            `stations.csv` of the flood monitoring API. Missing eastings and
+            northings are computed from latitude and longitude; stations with
+            neither are left out.
+        """
+        frame = pd.DataFrame({'stationReference': np.asarray(stations['stationReference'], dtype=str)})
+        for column in COLUMNS[1:]:
+            frame[column] = (_numeric(stations[column]) if column in stations
+                             else np.full(len(stations), np.nan))
+        missing = (np.isnan(frame.easting.values) | np.isnan(frame.northing.values)).nonzero()[0]
+        if len(missing):
+            easting, northing = geo.get_easting_northing_from_lat_long(frame.lat.values[missing],
+                                                                       frame.long.values[missing])
+            frame.loc[missing, 'easting'] = easting
+            frame.loc[missing, 'northing'] = northing
+        located = np.isfinite(frame.easting.values) & np.isfinite(frame.northing.values)
+        self.stations = frame[located].reset_index(drop=True)
+        self.index = PointIndex(self.stations.easting.values, self.stations.northing.values)
+
+    def __len__(self):
+        return len(self.stations)
+
+    @property
+    def references(self):
+        """Station references, by position in the catalogue."""
+        return self.stations.stationReference.values
+
+    @classmethod
+    async def fetch_async(cls, fetcher, parameter='rainfall', url=LIVE_URL):
+        """Get the catalogue of stations measuring a parameter from the flood monitoring API."""
+        return cls(await get_stations(fetcher, url, parameter=parameter))
+
+    @classmethod
+    def fetch(cls, parameter='rainfall', cache=None, url=LIVE_URL):
+        """Get the catalogue of stations measuring a parameter from the flood monitoring API.
+
+        Parameters
+        ----------
+
+        parameter: str, optional
+            Measured parameter, such as 'rainfall' or 'level'.
+        cache: httpcache.HTTPCache, optional
+            Cache of responses, so later calls within a day don't download the stations again.
+        url: str, optional
+            URL of the stations endpoint.
+
+        Returns
+        -------
+
+        StationCatalogue
+            The stations.
+        """
+        async def run():
+            async with Fetcher(cache=cache) as fetcher:
+                return await cls.fetch_async(fetcher, parameter, url)
+        return asyncio.run(run())
+
+    def within(self, easting, northing, radius):
+        """Find the stations within a distance of each of several locations.
+
+        Parameters
+        ----------
+
+        easting: numpy.ndarray of floats
+            OS eastings of the locations.
+        northing: numpy.ndarray of floats
+            OS northings of the locations.
+        radius: float
+            Largest distance in metres.
+
+        Returns
+        -------
+
+        location: numpy.ndarray of ints
+            Position of the location of each match.
+        station: numpy.ndarray of ints
+            Position in the catalogue of the station of each match.
+        distance: numpy.ndarray of floats
+            Distance in metres of each match, ordered by location, then distance.
+        """
+        return self.index.within(easting, northing, radius)
+
+    def nearest(self, easting, northing, k=1):
+        """Find the `k` nearest stations to each of several locations.
+
+        Returns
+        -------
+
+        station: numpy.ndarray of ints
+            Shape (n, k) positions in the catalogue of the nearest stations,
+            nearest first, -1 where there is none.
+        distance: numpy.ndarray of floats
+            Shape (n, k) distances in metres, inf where there is no station.
+        """
+        return self.index.nearest(easting, northing, k)
+
+    def locate(self, tool, postcodes):
+        """Get the OS easting and northing of postcodes, NaN for unknown postcodes."""
+        lat_long = tool.get_lat_long(postcodes)
+        return geo.get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1])
+
+    def postcodes_within(self, tool, postcodes, radius):
+        """Find the stations within a distance of each of several postcodes.
+
+        Parameters
+        ----------
+
+        tool: tool.Tool
+            Tool to look up postcode locations with.
+        postcodes: sequence of strs
+            Postcodes to find stations near.
+        radius: float
+            Largest distance in metres.
+
+        Returns
+        -------
+
+        As `within`, with `location` the position of each postcode in `postcodes`.
+        """
+        return self.within(*self.locate(tool, postcodes), radius)
+
+    def postcodes_nearest(self, tool, postcodes, k=1):
+        """Find the `k` nearest stations to each of several postcodes, as `nearest`."""
+        return self.nearest(*self.locate(tool, postcodes), k)
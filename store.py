@@ -0,0 +1,223 @@
+"""Binary columnar storage of tables, used to cache parsed resource files."""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['save_arrays', 'load_arrays', 'save_table', 'load_table',
+           'cached_arrays', 'cached_table']
+
+FORMAT_VERSION = 2
+CACHE_DIRECTORY = '.flood_tool_cache'
+
+
+def _column_array(values):
+    """Convert a column to an array that can be saved without pickling."""
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
+
+def save_arrays(arrays, directory, metadata=None):
+    """Save named numpy arrays as a directory of `.npy` files, one per array.
+
+    The arrays are written to a temporary directory first and moved into place,
+    so readers never see a partly written directory.
+
+    Parameters
+    ----------
+
+    arrays: dict
+        Arrays to save, by name. Names may be any JSON serialisable value.
+    directory: str
+        Directory to write the arrays to. Anything already saved there is replaced.
+    metadata: dict, optional
+        Extra JSON serialisable information stored alongside the arrays.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = os.path.join(parent, '.tmp-' + uuid.uuid4().hex)
+    os.makedirs(tmp)
+    try:
+        for i, values in enumerate(arrays.values()):
+            np.save(os.path.join(tmp, '%d.npy' % i), _column_array(values), allow_pickle=False)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'version': FORMAT_VERSION, 'columns': list(arrays),
+                       'metadata': metadata or {}}, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(tmp, directory)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def save_table(frame, directory, metadata=None):
+    """Save a DataFrame as a directory of `.npy` files, one per column.
+
+    String columns are stored as fixed width unicode arrays.
+
+    Parameters
+    ----------
+
+    frame: pandas.DataFrame
+        Table to save. The index is saved as the first column.
+    directory: str
+        Directory to write the table to. Any existing table is replaced.
+    metadata: dict, optional
+        Extra JSON serialisable information stored alongside the table.
+    """
+    metadata = dict(metadata or {}, index=frame.index.name, columns=list(frame.columns))
+    arrays = [frame.index.values] + [frame[c].values for c in frame.columns]
+    save_arrays(dict(enumerate(arrays)), directory, metadata)
+
+def read_metadata(directory):
+    """Read the metadata stored with a table, or return `None` if there is no readable table."""
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != FORMAT_VERSION:
+        return None
+    return meta
+
+def load_arrays(directory, mmap=True):
+    """Load arrays saved by `save_arrays`.
+
+    Parameters
+    ----------
+
+    directory: str
+        Directory the arrays were saved to.
+    mmap: bool, optional
+        Memory map the arrays rather than reading them into memory.
+
+    Returns
+    -------
+
+    dict
+        The saved arrays, by name, in the order they were saved.
+    """
+    meta = read_metadata(directory)
+    if meta is None:
+        raise OSError('No arrays saved in ' + directory)
+    return {name: np.load(os.path.join(directory, '%d.npy' % i),
+                          mmap_mode='r' if mmap else None, allow_pickle=False)
+            for i, name in enumerate(meta['columns'])}
+
+def load_table(directory, mmap=True):
+    """Load a table saved by `save_table`.
+
+    Parameters
+    ----------
+
+    directory: str
+        Directory the table was saved to.
+    mmap: bool, optional
+        Memory map numeric columns rather than reading them into memory.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        The saved table, with its original index and columns.
+    """
+    meta = read_metadata(directory)['metadata']
+    arrays = list(load_arrays(directory, mmap).values())
+    # string columns become python objects, so there is no point mapping them
+    arrays = [np.array(a) if a.dtype.kind == 'U' else a for a in arrays]
+    index = pd.Index(arrays[0], name=meta['index'])
+    return pd.DataFrame(dict(zip(meta['columns'], arrays[1:])), index=index,
+                        columns=meta['columns'], copy=False)
+
+
+def _fingerprint(sources):
+    """Identify the current state of source files by path, size and modification time."""
+    fingerprint = []
+    for source in sources:
+        stat = os.stat(source)
+        fingerprint.append([os.path.abspath(source), stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+def _cached(name, sources, build, directory, save, load):
+    """Load data derived from source files from the cache, building and saving it if stale."""
+    fingerprint = _fingerprint(sources)
+    if directory is None:
+        directory = os.path.join(os.path.dirname(fingerprint[0][0]), CACHE_DIRECTORY)
+    key = hashlib.sha1(json.dumps([name] + [f[0] for f in fingerprint]).encode()).hexdigest()
+    path = os.path.join(directory, '%s-%s' % (name, key[:12]))
+
+    meta = read_metadata(path)
+    if meta is not None and meta['metadata'].get('sources') == fingerprint:
+        try:
+            return load(path)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    data = build()
+    try:
+        save(data, path, {'sources': fingerprint})
+    except OSError:
+        pass
+    return data
+
+def cached_table(name, sources, build, directory=None, mmap=True):
+    """Load a table derived from source files from its cache, building it if needed.
+
+    The cache lives next to the first source file and is keyed on the paths,
+    sizes and modification times of all sources, so it is rebuilt whenever
+    one of them changes. If the cache can't be written the built table is
+    still returned.
+
+    Parameters
+    ----------
+
+    name: str
+        Name of the derived table.
+    sources: sequence of strs
+        Filenames of the files the table is built from.
+    build: callable
+        Function with no arguments returning the table as a pandas.DataFrame.
+    directory: str, optional
+        Directory to hold the cache, instead of next to the sources.
+    mmap: bool, optional
+        Memory map numeric columns of cached tables.
+
+    Returns
+    -------
+
+    pandas.DataFrame
+        The derived table.
+    """
+    return _cached(name, sources, build, directory, save_table,
+                   lambda path: load_table(path, mmap))
+
+def cached_arrays(name, sources, build, directory=None, mmap=True):
+    """Load named arrays derived from source files from their cache, building them if needed.
+
+    Works as `cached_table`, for data that isn't a table.
+
+    Parameters
+    ----------
+
+    name: str
+        Name of the derived arrays.
+    sources: sequence of strs
+        Filenames of the files the arrays are built from.
+    build: callable
+        Function with no arguments returning a dict of numpy arrays by name.
+    directory: str, optional
+        Directory to hold the cache, instead of next to the sources.
+    mmap: bool, optional
+        Memory map cached arrays.
+
+    Returns
+    -------
+
+    dict
+        The derived arrays, by name.
+    """
+    return _cached(name, sources, build, directory, save_arrays,
+                   lambda path: load_arrays(path, mmap))
@@ -0,0 +1,254 @@
+"""In-memory layouts of the postcode table, looked up by normalised postcode."""
+import numpy as np
+import pandas as pd
+
+__all__ = ['PostcodeTable', 'CompactPostcodeTable', 'SharedPostcodeTable']
+
+
+def _take(values, positions):
+    """Gather rows of `values` at `positions` as floats, returning `numpy.nan` rows for -1."""
+    result = np.asarray(values[positions], dtype=np.float64)
+    result[positions < 0] = np.nan
+    return result
+
+
+def _search_sorted(keys, postcodes):
+    """Find normalised postcodes in sorted ASCII byte keys, returning key positions or -1."""
+    chars = np.ascontiguousarray(postcodes, dtype=str).reshape(-1)
+    chars = chars.view(np.uint32).reshape(len(chars), chars.dtype.itemsize//4)
+    width = keys.dtype.itemsize
+    common = min(width, chars.shape[1])
+
+    # postcodes with non-ASCII characters, or longer than any key, can't match
+    valid = (chars < 128).all(axis=1) & (chars[:, width:] == 0).all(axis=1)
+    encoded = np.zeros((len(chars), width), dtype=np.uint8)
+    encoded[:, :common] = chars[:, :common]
+    encoded = encoded.view('S%d' % width).reshape(-1)
+
+    if len(keys) == 0:
+        return np.full(len(encoded), -1, dtype=np.intp)
+    positions = np.searchsorted(keys, encoded)
+    positions[positions == len(keys)] = 0
+    return np.where(valid & (keys[positions] == encoded), positions, -1)
+
+
+class PostcodeTable(object):
+    """Postcode table held as a DataFrame indexed by postcode, with a hash table index.
+
+    This is the default layout. Every `Tool` lookup goes through `get_indexer`,
+    then gathers the columns it needs by row position. Columns loaded from
+    other files, such as property values, are aligned to the table rows with
+    `align_values` and read back with `gather_values`.
+    """
+
+    def __init__(self, frame):
+        """
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            Table indexed by normalised postcode, with `Latitude` and `Longitude` columns.
+        """
+        self.frame = frame
+        # Checking uniqueness builds the postcode hash table up front
+        if not frame.index.is_unique:
+            raise ValueError('Postcode table index must be unique')
+        self._lat_long = frame[['Latitude', 'Longitude']].to_numpy(dtype=float)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def postcodes(self):
+        """numpy.ndarray of strs: Postcodes in row order."""
+        return np.asarray(self.frame.index, dtype=str)
+
+    @property
+    def nbytes(self):
+        """int: Approximate memory held by the table, in bytes."""
+        return int(self.frame.memory_usage(index=True, deep=True).sum() + self._lat_long.nbytes)
+
+    def get_indexer(self, postcodes):
+        """Get row positions of normalised postcodes, with -1 for postcodes not in the table."""
+        return self.frame.index.get_indexer(postcodes)
+
+    def lat_long(self, positions):
+        """Get Nx2 (latitude, longitude) pairs at row positions, `numpy.nan` for -1."""
+        return _take(self._lat_long, positions)
+
+    def align_values(self, values):
+        """Align property values in pounds sterling to the table rows.
+
+        Parameters
+        ----------
+        values : pandas.Series
+            Values indexed by normalised postcode. Postcodes not in the table are ignored.
+
+        Returns
+        -------
+        numpy.ndarray
+            One value per table row, zero for postcodes without a value.
+        """
+        positions = self.get_indexer(np.asarray(values.index, dtype=str))
+        found = positions >= 0
+        aligned = np.zeros(len(self), dtype=float)
+        aligned[positions[found]] = values.to_numpy(dtype=float)[found]
+        return aligned
+
+    def gather_values(self, values, positions):
+        """Get values aligned by `align_values` at row positions, `numpy.nan` for -1."""
+        return _take(values, positions)
+
+    def to_frame(self):
+        """Get the table as a DataFrame indexed by postcode."""
+        return self.frame
+
+    def to_arrays(self):
+        """Get the table as a dict of numpy arrays, to be published with `store.save_arrays`."""
+        keys = self.postcodes.astype(bytes)
+        order = np.argsort(keys, kind='stable')
+        return {'keys': keys[order], 'order': order, 'lat_long': self._lat_long}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Attach to arrays from `to_arrays`, without copying them.
+
+        Returns
+        -------
+        SharedPostcodeTable
+            Table with the same rows, looked up by binary search.
+        """
+        return SharedPostcodeTable(arrays['keys'], arrays['order'], arrays['lat_long'])
+
+
+class CompactPostcodeTable(PostcodeTable):
+    """Postcode table held as sorted fixed width arrays, looked up by binary search.
+
+    Postcodes are stored as ASCII bytes, coordinates as float32 (to within 2e-6
+    degrees, about 0.2m) and aligned property values as integer pence, about
+    a sixth of the memory of the default layout, at the cost of slower
+    lookups. Columns other than `Latitude` and `Longitude` are dropped.
+
+    The rounded coordinates can move a postcode lying within about 0.2m of the
+    edge of a risk circle across it, changing its probability band and flood
+    risk from those of the default layout: 2 of the 20103 postcodes shipped
+    in `resources/postcodes.csv` change band.
+    """
+
+    def __init__(self, frame):
+        """
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            Table indexed by normalised postcode, with `Latitude` and `Longitude` columns.
+        """
+        keys = np.asarray(frame.index, dtype=str).astype(bytes)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        if np.any(self.keys[1:] == self.keys[:-1]):
+            raise ValueError('Postcode table index must be unique')
+        self.latitude = frame['Latitude'].to_numpy(dtype=np.float32)[order]
+        self.longitude = frame['Longitude'].to_numpy(dtype=np.float32)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def postcodes(self):
+        """numpy.ndarray of strs: Postcodes in row order."""
+        return self.keys.astype(str)
+
+    @property
+    def nbytes(self):
+        """int: Memory held by the table, in bytes."""
+        return int(self.keys.nbytes + self.latitude.nbytes + self.longitude.nbytes)
+
+    def get_indexer(self, postcodes):
+        """Get row positions of normalised postcodes, with -1 for postcodes not in the table."""
+        return _search_sorted(self.keys, postcodes)
+
+    def lat_long(self, positions):
+        """Get Nx2 (latitude, longitude) pairs at row positions, `numpy.nan` for -1."""
+        return np.column_stack([_take(self.latitude, positions), _take(self.longitude, positions)])
+
+    def align_values(self, values):
+        """Align property values in pounds sterling to the table rows, as integer pence."""
+        return np.round(super().align_values(values)*100).astype(np.int64)
+
+    def gather_values(self, values, positions):
+        """Get values aligned by `align_values` at row positions in pounds, `numpy.nan` for -1."""
+        return _take(values, positions)/100
+
+    def to_frame(self):
+        """Get the table as a DataFrame indexed by postcode, in the default layout."""
+        return pd.DataFrame({'Latitude': self.latitude.astype(float),
+                             'Longitude': self.longitude.astype(float)},
+                            index=pd.Index(self.postcodes, name='Postcode'))
+
+    def to_arrays(self):
+        """Get the table as a dict of numpy arrays, to be published with `store.save_arrays`."""
+        return {'keys': self.keys, 'latitude': self.latitude, 'longitude': self.longitude}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Attach to arrays from `to_arrays`, without copying them."""
+        table = cls.__new__(cls)
+        table.keys = arrays['keys']
+        table.latitude = arrays['latitude']
+        table.longitude = arrays['longitude']
+        return table
+
+
+class SharedPostcodeTable(PostcodeTable):
+    """Default layout postcode table attached to arrays published by another process.
+
+    The arrays, which may be read-only memory maps, are used without copying:
+    postcodes are held as sorted ASCII bytes with the row each one belongs to,
+    and looked up by binary search rather than a hash table. Rows keep the order
+    of the published `PostcodeTable`, so values aligned to it stay valid.
+    """
+
+    def __init__(self, keys, order, lat_long):
+        """
+        Parameters
+        ----------
+        keys : numpy.ndarray of bytes
+            Sorted normalised postcodes.
+        order : numpy.ndarray of ints
+            Row position of each key.
+        lat_long : numpy.ndarray of floats
+            Nx2 (latitude, longitude) pairs in row order.
+        """
+        self.keys = keys
+        self.order = order
+        self._lat_long = lat_long
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def postcodes(self):
+        """numpy.ndarray of strs: Postcodes in row order."""
+        postcodes = np.empty(len(self.keys), dtype='U%d' % max(self.keys.dtype.itemsize, 1))
+        postcodes[self.order] = self.keys.astype(str)
+        return postcodes
+
+    @property
+    def nbytes(self):
+        """int: Memory held by the table, in bytes, shared with other processes."""
+        return int(self.keys.nbytes + self.order.nbytes + self._lat_long.nbytes)
+
+    def get_indexer(self, postcodes):
+        """Get row positions of normalised postcodes, with -1 for postcodes not in the table."""
+        found = _search_sorted(self.keys, postcodes)
+        positions = np.full(len(found), -1, dtype=np.intp)
+        positions[found >= 0] = self.order[found[found >= 0]]
+        return positions
+
+    def to_frame(self):
+        """Get the table as a DataFrame indexed by postcode, in the default layout."""
+        return pd.DataFrame({'Latitude': self._lat_long[:, 0], 'Longitude': self._lat_long[:, 1]},
+                            index=pd.Index(self.postcodes, name='Postcode'))
+
+    def to_arrays(self):
+        """Get the table as a dict of numpy arrays, to be published with `store.save_arrays`."""
+        return {'keys': self.keys, 'order': self.order, 'lat_long': self._lat_long}
@@ -0,0 +1,80 @@
+"""Test batched flood warnings, against a local server."""
+
+import http.server
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import flood_tool.api_functions as api_functions
+import flood_tool.geo as geo
+
+# stations near Deal (CT14) and Dartford (DA2), one with no readings, and one far away
+STATIONS = [('DEAL', 51.21, 1.395), ('DART', 51.437, 0.26), ('GONE', 51.44, 0.28), ('YORK', 53.96, -1.08)]
+RAINFALL = {'DEAL': [0.1, 0.5], 'DART': [0.2, 0.1], 'YORK': [5.0]}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Stand-in for the stations and readings endpoints of the flood monitoring API."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        if self.path.startswith('/id/stations.csv'):
+            body = 'stationReference,lat,long\n' + ''.join('%s,%s,%s\n' % s for s in STATIONS)
+            status = 200
+        else:
+            reference = self.path.split('/')[3]
+            status = 200 if reference in RAINFALL else 404
+            body = 'dateTime,value\n' + ''.join('2020-01-01T00:00:00Z,%s\n' % v
+                                               for v in RAINFALL.get(reference, []))
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    """Run the stand-in server on a free local port."""
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.url = 'http://127.0.0.1:%d/id/stations' % httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_flood_warning(server):
+    """Check rainfall and warnings of postcodes, fetching each nearby station once."""
+    latitude = np.array([51.200131, 51.201, 51.437398, 51.444248])
+    longitude = np.array([1.395154, 1.396, 0.250708, 0.275078])
+    easting, northing = geo.get_easting_northing_from_lat_long(latitude, longitude)
+    data = pd.DataFrame({'Postcode': ['CT147NW', 'CT147NX', 'DA2 6LL', 'DA9 9TY'],
+                         'Easting': easting, 'Northing': northing,
+                         'Probability': ['High', 'Low', 'Medium', 'High']})
+
+    result = api_functions.get_flood_warning(data, retries=0, url=server.url)
+    np.testing.assert_allclose(result.Rainfall, [0.5, 0.5, 0.2, 0.2])
+    assert list(result.Flood_warning) == [1, 0, 0, 0]
+    assert 'Rainfall' not in data
+
+    readings = sorted(path for path in server.requests if 'readings' in path)
+    assert readings == ['/id/stations/DART/readings.csv', '/id/stations/DEAL/readings.csv',
+                        '/id/stations/GONE/readings.csv']
+
+    # locations from latitude and longitude, with a lower threshold and no stations nearby
+    data = data.drop(columns=['Easting', 'Northing']).assign(Latitude=latitude, Longitude=longitude)
+    data.loc[3, ['Latitude', 'Longitude']] = [50.0, -5.0]
+    result = api_functions.get_flood_warning(data, threshold=0.15, retries=0, url=server.url)
+    np.testing.assert_allclose(result.Rainfall, [0.5, 0.5, 0.2, 0.0])
+    assert list(result.Flood_warning) == [1, 0, 1, 0]
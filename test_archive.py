@@ -0,0 +1,99 @@
+"""Test the local archive of daily readings."""
+
+import functools
+import http.server
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import flood_tool.archive as archive
+import flood_tool.fetch as fetch
+
+HEADER = 'dateTime,date,measure,station,label,stationReference,parameter,qualifier,datumType,period,unitName,valueType,value\n'
+
+
+def readings_file(date, rows):
+    """Contents of a readings-full file, from (time, station, parameter, value) rows."""
+    lines = ['%sT%s,%s,m,s,l,%s,%s,q,,900,mm,instantaneous,%s\n' % (date, time, date, station, parameter, value)
+             for time, station, parameter, value in rows]
+    return HEADER + ''.join(lines)
+
+
+ROWS = [('00:00:00Z', 'B', 'rainfall', '0.2'),
+        ('00:15:00Z', 'A', 'level', '1.5'),
+        ('00:15:00Z', 'A', 'rainfall', '0.4'),
+        ('12:30:00Z', 'C', 'rainfall', '0.2|0.4'),
+        ('23:45:00Z', 'B', 'rainfall', '1.0')]
+
+
+def test_ingest(tmp_path):
+    """Check a day is read in chunks into compact columns."""
+    source = tmp_path / 'readings-full-2020-01-01.csv'
+    source.write_text(readings_file('2020-01-01', ROWS))
+    store = archive.ReadingsArchive(str(tmp_path / 'archive'), parameters=['rainfall', 'level'])
+
+    assert store.ingest('2020-01-01', str(source), chunk_size=2) == {'rainfall': 4, 'level': 1}
+    assert store.has('2020-01-01') and not store.has('2020-01-02')
+    assert store.dates('level') == [pd.Timestamp('2020-01-01').date()]
+
+    arrays = store.partition('2020-01-01')
+    assert list(arrays['stations']) == ['A', 'B', 'C']
+    assert arrays['station'].dtype == np.int32 and arrays['value'].dtype == np.float32
+    assert list(arrays['station']) == [1, 0, 2, 1]
+    assert list(arrays['time']) == [0, 900, 45000, 85500]
+
+    frame = store.read('2020-01-01', fetch=False)
+    assert list(frame.stationReference) == ['B', 'A', 'C', 'B']
+    assert frame.dateTime.iloc[3] == pd.Timestamp('2020-01-01T23:45:00Z')
+    np.testing.assert_allclose(frame.value, [0.2, 0.4, np.nan, 1.0], rtol=1e-6)
+
+
+def test_ingest_missing_station(tmp_path):
+    """Check readings without a station reference are dropped, not filed under another station."""
+    source = tmp_path / 'readings-full-2020-01-01.csv'
+    source.write_text(readings_file('2020-01-01', ROWS[:3] + [('06:00:00Z', '', 'rainfall', '9.9')] + ROWS[3:]))
+    store = archive.ReadingsArchive(str(tmp_path / 'archive'), parameters=['rainfall', 'level'])
+
+    assert store.ingest('2020-01-01', str(source), chunk_size=2) == {'rainfall': 4, 'level': 1}
+    frame = store.read('2020-01-01', fetch=False)
+    assert list(frame.stationReference) == ['B', 'A', 'C', 'B']
+    assert 9.9 not in frame.value.round(1).tolist()
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve a directory of archive files on a free local port."""
+    directory = tmp_path / 'remote'
+    directory.mkdir()
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(directory))
+    handler.log_message = lambda *args: None
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    httpd.directory = directory
+    httpd.url = 'http://127.0.0.1:%d/' % httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_backfill_resumes(server, tmp_path):
+    """Check a backfill reports failed days, and a later one adds only the missing days."""
+    for day in ['2020-01-01', '2020-01-03']:
+        (server.directory / ('readings-full-%s.csv' % day)).write_text(readings_file(day, ROWS))
+    store = archive.ReadingsArchive(str(tmp_path / 'archive'), url=server.url)
+
+    results = store.backfill('2020-01-01', '2020-01-03', retries=0)
+    assert results[pd.Timestamp('2020-01-01').date()] == {'rainfall': 4}
+    assert isinstance(results[pd.Timestamp('2020-01-02').date()], fetch.FetchError)
+    assert len(store.dates()) == 2
+
+    (server.directory / 'readings-full-2020-01-02.csv').write_text(readings_file('2020-01-02', ROWS[:2]))
+    results = store.backfill('2020-01-01', '2020-01-03', retries=0)
+    assert list(results) == [pd.Timestamp('2020-01-02').date()]
+    assert len(store.read('2020-01-02')) == 1
+    assert [date for date, _ in store.partitions('2019-12-31', '2020-01-02')] == store.dates()[:2]
+    assert not [name for name in os.listdir(store.directory) if name.endswith('.csv')]
@@ -0,0 +1,65 @@
+"""Test streaming batch scoring module."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import flood_tool.geo as geo
+import flood_tool.tool as tool
+import flood_tool.batch as batch
+
+
+def make_input(path, tool_, n, seed=0):
+    """Write a postcode file mixing valid, dirty, invalid and repeated postcodes."""
+    rng = np.random.default_rng(seed)
+    postcodes = rng.choice(np.asarray(tool_.postcode_data.index, dtype=str), n)
+    postcodes = np.char.lower(postcodes)
+    postcodes[::7] = 'invalid'
+    postcodes[::11] = ''
+    pd.DataFrame({'Id': np.arange(n), 'Postcode': postcodes}).to_csv(str(path), index=False)
+    return postcodes
+
+def test_score_postcode_file_sorted(tmp_path):
+    """Test sorted streaming output matches get_sorted_annual_flood_risk."""
+    tool_ = tool.Tool()
+    postcodes = make_input(tmp_path/'input.csv', tool_, 5000)
+
+    rows = batch.score_postcode_file(tool_, str(tmp_path/'input.csv'), str(tmp_path/'output.csv'),
+                                     chunk_size=600, temp_directory=str(tmp_path))
+    result = pd.read_csv(str(tmp_path/'output.csv'), keep_default_na=False).set_index('Postcode')
+    expected = tool_.get_sorted_annual_flood_risk(postcodes)
+    bands = tool_.get_sorted_flood_probability(postcodes)
+
+    assert rows == len(expected)
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(result['Flood Risk'].values, expected['Flood Risk'].values)
+    np.testing.assert_array_equal(result['Probability Band'].values,
+                                  bands.loc[expected.index, 'Probability Band'].values)
+    # sorted runs are removed
+    assert sorted(os.listdir(str(tmp_path))) == ['input.csv', 'output.csv']
+
+def test_score_postcode_file_unsorted(tmp_path):
+    """Test unsorted streaming output keeps input order and duplicates."""
+    tool_ = tool.Tool()
+    postcodes = make_input(tmp_path/'input.csv', tool_, 1000, seed=1)
+
+    batch.score_postcode_file(tool_, str(tmp_path/'input.csv'), str(tmp_path/'output.csv'),
+                              sort=False, chunk_size=128)
+    result = pd.read_csv(str(tmp_path/'output.csv'), keep_default_na=False)
+
+    normalised, positions = tool_.lookup_postcodes(postcodes)
+    valid = positions >= 0
+    np.testing.assert_array_equal(result['Postcode'].values, normalised[valid])
+    lat_long = tool_.get_lat_long(postcodes[valid])
+    bands = tool_.get_easting_northing_flood_probability(
+        *geo.get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1]))
+    np.testing.assert_array_equal(result['Probability Band'].values, bands)
+    np.testing.assert_allclose(result['Flood Risk'].values,
+                               tool_.get_annual_flood_risk(postcodes[valid], bands))
+
+def test_score_postcode_file_empty(tmp_path):
+    """Test a file with no rows gives just a header."""
+    (tmp_path/'input.csv').write_text('Postcode\n')
+    tool_ = tool.Tool()
+    assert batch.score_postcode_file(tool_, str(tmp_path/'input.csv'), str(tmp_path/'output.csv')) == 0
+    assert (tmp_path/'output.csv').read_text().strip() == ','.join(batch.OUTPUT_COLUMNS)
@@ -0,0 +1,114 @@
+"""Test coalescing of concurrent queries into batches."""
+
+import asyncio
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import flood_tool.tool as tool
+import flood_tool.batching as batching
+
+
+@pytest.fixture(scope='module')
+def flood_tool():
+    return tool.Tool().warm()
+
+
+def queries(flood_tool, n):
+    rng = np.random.default_rng(0)
+    postcodes = rng.choice(np.asarray(flood_tool.postcode_data.index, dtype=str), (n, 3))
+    postcodes[::4, 1] = 'invalid'
+    return postcodes
+
+
+def test_threads_match_tool(flood_tool):
+    """Check queries from many threads, answered in shared batches, match direct ones."""
+    postcodes = queries(flood_tool, 24)
+    results = [None] * len(postcodes)
+    barrier = threading.Barrier(len(postcodes))
+
+    with batching.BatchingTool(flood_tool, max_delay=0.05) as batcher:
+        def query(i):
+            barrier.wait()
+            results[i] = (batcher.get_lat_long(postcodes[i]),
+                          batcher.get_sorted_annual_flood_risk(postcodes[i]),
+                          batcher.get_sorted_flood_probability(postcodes[i]))
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(len(postcodes))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert batcher.requests == 3 * len(postcodes)
+        assert batcher.batches < batcher.requests
+
+    for i, (lat_long, risk, probability) in enumerate(results):
+        np.testing.assert_array_equal(lat_long, flood_tool.get_lat_long(postcodes[i]))
+        pd.testing.assert_frame_equal(risk, flood_tool.get_sorted_annual_flood_risk(postcodes[i]))
+        pd.testing.assert_frame_equal(probability, flood_tool.get_sorted_flood_probability(postcodes[i]))
+
+
+def test_async_match_tool(flood_tool):
+    """Check queries from coroutines match direct ones, and batch size is bounded."""
+    postcodes = queries(flood_tool, 10)
+    bands = np.array(tool.PROBABILITY_BANDS)[np.arange(3) % 5]
+    easting, northing = np.array([550000., 560000.]), np.array([150000., 120000.])
+
+    async def run(batcher):
+        return await asyncio.gather(
+            *[batcher.get_flood_cost_async(p) for p in postcodes],
+            *[batcher.get_annual_flood_risk_async(p, bands) for p in postcodes],
+            batcher.get_easting_northing_flood_probability_async(easting, northing))
+
+    with batching.BatchingTool(flood_tool, max_batch=6, max_delay=0.05) as batcher:
+        results = asyncio.run(run(batcher))
+        # two queries of three postcodes fit in each batch
+        assert batcher.batches >= 10
+
+    for p, cost, risk in zip(postcodes, results[:10], results[10:20]):
+        np.testing.assert_array_equal(cost, flood_tool.get_flood_cost(p))
+        np.testing.assert_array_equal(risk, flood_tool.get_annual_flood_risk(p, bands))
+    np.testing.assert_array_equal(results[-1],
+                                  flood_tool.get_easting_northing_flood_probability(easting, northing))
+
+
+def test_async_size_mismatch(flood_tool):
+    """Check mismatched inputs fail only their own caller, not others in the batch."""
+    postcodes = queries(flood_tool, 2)
+    bands = np.array(tool.PROBABILITY_BANDS)[:3]
+    easting, northing = np.array([550000., 560000.]), np.array([150000., 120000.])
+
+    async def run(batcher):
+        return await asyncio.gather(
+            batcher.get_annual_flood_risk_async(postcodes[0], bands[:2]),
+            batcher.get_annual_flood_risk_async(postcodes[1][:2], bands),
+            batcher.get_annual_flood_risk_async(postcodes[1], bands),
+            batcher.get_easting_northing_flood_probability_async(easting, northing[:1]),
+            batcher.get_easting_northing_flood_probability_async(easting, northing),
+            return_exceptions=True)
+
+    with batching.BatchingTool(flood_tool, max_delay=0.05) as batcher:
+        results = asyncio.run(run(batcher))
+
+    for i in (0, 1, 3):
+        assert isinstance(results[i], ValueError)
+    np.testing.assert_array_equal(results[2], flood_tool.get_annual_flood_risk(postcodes[1], bands))
+    np.testing.assert_array_equal(results[4],
+                                  flood_tool.get_easting_northing_flood_probability(easting, northing))
+
+
+def test_errors_and_close(flood_tool):
+    """Check errors reach each caller in the batch, and closed batchers refuse queries."""
+    class Broken(object):
+        def get_flood_cost(self, postcodes):
+            raise KeyError('broken')
+
+    batcher = batching.BatchingTool(Broken(), max_delay=0)
+    with pytest.raises(KeyError):
+        batcher.get_flood_cost(['CT147NW'])
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.get_flood_cost(['CT147NW'])
+
+    with batching.BatchingTool(flood_tool, max_delay=0) as batcher:
+        assert batcher.get_sorted_annual_flood_risk(['invalid']).empty
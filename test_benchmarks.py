@@ -0,0 +1,48 @@
+"""Test the synthetic data generator and benchmark suite, at small scale."""
+
+import json
+
+import numpy as np
+import pandas as pd
+import flood_tool.tool as tool
+from flood_tool.benchmarks import suite, synthetic
+
+
+def test_synthetic_files(tmp_path):
+    """Check generated files load into a tool, with distinct postcodes and some risk."""
+    postcodes = synthetic.synthetic_postcodes(5000)
+    assert len(np.unique(tool.normalise_postcodes(postcodes))) == 5000
+    assert all(len(postcode) == 7 for postcode in postcodes)
+
+    paths = synthetic.generate(str(tmp_path), 3000, towns=5, spread=2000.)
+    flood_tool = tool.Tool(cache=False, **paths)
+    queried = pd.read_csv(paths['postcode_file']).Postcode
+    assert not np.isnan(flood_tool.get_lat_long(queried)).any()
+    cost = flood_tool.get_flood_cost(queried)
+    assert 0.8 < (cost > 0).mean() < 0.95
+    assert (flood_tool.get_sorted_flood_probability(queried)['Probability Band'] != 'Zero').any()
+    # the same arguments give the same files
+    again = synthetic.generate(str(tmp_path / 'again'), 3000, towns=5, spread=2000.)
+    assert open(again['risk_file']).read() == open(paths['risk_file']).read()
+
+
+def test_run_and_compare(tmp_path):
+    """Check results are recorded for each benchmark and size, as JSON, and compared."""
+    paths = synthetic.generate(str(tmp_path), 2000)
+    results = suite.run(paths, sizes=(10, 100), repeat=2, budget=0.1,
+                        benchmarks=['load_cached', 'get_sorted_annual_flood_risk',
+                                    'get_easting_northing_from_lat_long'])
+    results = json.loads(json.dumps(results))
+    assert [(r['benchmark'], r['size']) for r in results['results']] == [
+        ('load_cached', 2000), ('get_sorted_annual_flood_risk', 10), ('get_easting_northing_from_lat_long', 10),
+        ('get_sorted_annual_flood_risk', 100), ('get_easting_northing_from_lat_long', 100)]
+    for result in results['results']:
+        assert 1 <= result['repeats'] <= 2
+        assert result['min'] <= result['p50'] <= result['p99'] <= result['max']
+        assert result['peak_bytes'] >= 0
+    assert results['metadata']['sizes'] == [10, 100]
+
+    slower = json.loads(json.dumps(results))
+    slower['results'][1]['p50'] *= 2
+    comparison = suite.compare(results, slower)
+    assert [c['regression'] for c in comparison] == [False, True, False, False, False]
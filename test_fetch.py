@@ -0,0 +1,230 @@
+"""Test concurrent HTTP fetching module, against a local server."""
+
+import asyncio
+import gzip
+import http.server
+import threading
+import time
+
+import pandas as pd
+import pytest
+import flood_tool.fetch as fetch
+import flood_tool.httpcache as httpcache
+import flood_tool.live as live
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Stand-in for the flood monitoring API, with some misbehaving endpoints."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay)
+            if self.path.startswith('/id/stations.csv'):
+                self.send(200, b'stationReference,lat,long\nA,51.2,1.3\nB,51.3,1.4\n')
+            elif self.path.startswith('/id/stations/') and self.path.endswith('/readings.csv'):
+                reference = self.path.split('/')[3]
+                body = ('dateTime,value\n2020-01-01T00:00:00Z,%d\n' % (ord(reference[0]) - 64)).encode()
+                self.send(200, gzip.compress(body), [('Content-Encoding', 'gzip')])
+            elif self.path == '/flaky':
+                with server.lock:
+                    server.failures -= 1
+                    failing = server.failures >= 0
+                self.send(503) if failing else self.send(200, b'ok')
+            elif self.path.startswith('/archive/'):
+                etag = '"%d"' % server.version
+                if self.headers.get('If-None-Match') == etag:
+                    self.send(304, headers=[('ETag', etag)])
+                else:
+                    body = ('version\n%d\n' % server.version).encode() + b' '*100
+                    self.send(200, body, [('ETag', etag)])
+            elif self.path == '/moved':
+                self.send(302, headers=[('Location', '/flaky')])
+            elif self.path == '/slow':
+                time.sleep(1.0)
+                self.send(200, b'late')
+            else:
+                self.send(404)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def server():
+    """Run the stand-in server on a free local port."""
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests, httpd.connections = [], set()
+    httpd.active = httpd.peak = 0
+    httpd.delay = 0.0
+    httpd.failures = 0
+    httpd.version = 1
+    httpd.url = 'http://127.0.0.1:%d' % httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_live_station_readings(server):
+    """Test fetching stations and their readings concurrently."""
+    async def run():
+        async with fetch.Fetcher(concurrency=4) as fetcher:
+            stations = await live.get_stations(fetcher, url=server.url + '/id/stations',
+                                               parameter='rainfall', lat=51.2, long=1.3, dist=10)
+            readings = await live.get_station_readings(fetcher, list(stations.stationReference) + ['C'],
+                                                       url=server.url + '/id/stations')
+        return stations, readings
+
+    stations, readings = asyncio.run(run())
+    assert list(stations.stationReference) == ['A', 'B']
+    assert [frame.value[0] for frame in readings] == [1, 2, 3]
+    assert 'parameter=rainfall' in server.requests[0] and 'dist=10' in server.requests[0]
+
+def test_bounded_concurrency_and_reuse(server):
+    """Test requests in flight are bounded and connections are reused."""
+    server.delay = 0.05
+    urls = [server.url + '/id/stations/%s/readings.csv' % chr(65 + i % 26) for i in range(24)]
+    bodies = fetch.fetch_all(urls, concurrency=3)
+
+    assert len(bodies) == 24 and bodies[2].endswith(b',3\n')
+    assert server.peak <= 3
+    assert len(server.connections) <= 3
+
+def test_exit_does_not_block_loop(server):
+    """Test leaving the context waits for requests in flight without blocking the event loop."""
+    server.delay = 0.3
+
+    async def run():
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        async with fetch.Fetcher() as fetcher:
+            request = asyncio.create_task(fetcher.fetch(server.url + '/id/stations/A/readings.csv'))
+            await asyncio.sleep(0.05)
+            request.cancel()
+            before = len(ticks)
+        after = len(ticks)
+        ticker.cancel()
+        return after - before
+
+    assert asyncio.run(run()) >= 5
+
+def test_retries_and_redirects(server):
+    """Test failed requests are retried, redirects followed and errors raised."""
+    server.failures = 2
+    async def run(url, **options):
+        async with fetch.Fetcher(backoff=0.01, **options) as fetcher:
+            body = await fetcher.fetch(url)
+        return body, fetcher
+
+    body, fetcher = asyncio.run(run(server.url + '/moved'))
+    assert body == b'ok' and fetcher.retried == 2
+
+    server.failures = 5
+    with pytest.raises(fetch.FetchError) as error:
+        asyncio.run(run(server.url + '/flaky', retries=1))
+    assert error.value.status == 503
+
+    # not found isn't retried
+    with pytest.raises(fetch.FetchError) as error:
+        asyncio.run(run(server.url + '/missing'))
+    assert error.value.status == 404 and server.requests.count('/missing') == 1
+
+def test_timeout(server):
+    """Test a slow response times out, after retries."""
+    async def run():
+        async with fetch.Fetcher(timeout=0.2, retries=1, backoff=0.01) as fetcher:
+            return await fetcher.fetch(server.url + '/slow')
+
+    with pytest.raises(fetch.FetchError):
+        asyncio.run(run())
+    assert server.requests.count('/slow') == 2
+
+
+def test_cache_revalidation(server, tmp_path):
+    """Check fresh responses are served from the cache, and stale ones revalidated."""
+    url = server.url + '/archive/readings.csv'
+    cache = httpcache.HTTPCache(str(tmp_path), ttls=[('/archive/', 3600)])
+
+    assert fetch.read_csv(url, cache=cache).version[0] == 1
+    assert fetch.read_csv(url, cache=cache).version[0] == 1
+    assert len(server.requests) == 1
+
+    # a new cache over the same directory picks up the stored response
+    cache = httpcache.HTTPCache(str(tmp_path), ttls=[('/archive/', 0)])
+    assert fetch.read_csv(url, cache=cache).version[0] == 1
+    server.version = 2
+    assert fetch.read_csv(url, cache=cache).version[0] == 2
+    assert len(server.requests) == 3
+    assert cache.stats()['hits'] == 0
+    assert cache.stats()['revalidated'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_eviction(server, tmp_path):
+    """Check the least recently used responses are evicted to stay within the size bound."""
+    cache = httpcache.HTTPCache(str(tmp_path), max_bytes=250, ttls=[('/archive/', 3600)])
+    urls = [server.url + '/archive/%s.csv' % name for name in 'abc']
+
+    async def run(urls):
+        async with fetch.Fetcher(concurrency=1, cache=cache) as fetcher:
+            return await fetcher.fetch_all(urls)
+
+    asyncio.run(run(urls[:2]))
+    asyncio.run(run(urls[:1]))
+    asyncio.run(run(urls[2:]))
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+    assert stats['entries'] == 2 and stats['bytes'] <= 250
+
+    # 'b' was evicted as least recently used, so is downloaded again
+    asyncio.run(run(urls[1:2]))
+    assert len(server.requests) == 4
+    assert cache.stats()['evictions'] == 2
+
+
+def test_cache_access_times(server, tmp_path, monkeypatch):
+    """Check cache hits keep access times in memory until flushed, for eviction in later runs."""
+    urls = [server.url + '/archive/%s.csv' % name for name in 'ab']
+    cache = httpcache.HTTPCache(str(tmp_path), ttls=[('/archive/', 3600)])
+    for url in urls:
+        fetch.read_csv(url, cache=cache)
+
+    writes = []
+    monkeypatch.setattr(httpcache, '_write', lambda path, data: writes.append(path))
+    for _ in range(3):
+        fetch.read_csv(urls[0], cache=cache)
+    assert cache.stats()['hits'] == 3 and writes == []
+    monkeypatch.undo()
+
+    cache.close()
+    # 'b' is now the least recently used, in a new cache over the same directory too
+    cache = httpcache.HTTPCache(str(tmp_path), max_bytes=250, ttls=[('/archive/', 3600)])
+    fetch.read_csv(server.url + '/archive/c.csv', cache=cache)
+    assert cache.lookup(urls[0])[0] is not None and cache.lookup(urls[1])[0] is None
@@ -3,7 +3,7 @@
 import copy
 
 import numpy as np
-from pytest import approx, mark
+from pytest import approx, mark, raises
 import flood_tool.geo as geo
 
 def test_rad():
@@ -82,3 +82,122 @@ def test_get_easting_northing_from_lat_long():
                                                rel=1.0e-5)
 
 
+
+def reference_easting_northing(latitude, longitude):
+    """Unfused easting and northing, computed term by term from WGS84toOSGB36."""
+    latitude_os, longitude_os = geo.WGS84toOSGB36(latitude, longitude)
+    datum = geo.osgb36
+    nu = datum.a*datum.F_0/np.sqrt(1-datum.e2*np.sin(latitude_os)**2)
+    rho = nu*(1-datum.e2)/(1-datum.e2*np.sin(latitude_os)**2)
+    eta2 = nu/rho-1
+    tan2 = np.tan(latitude_os)**2
+    s, c = np.sin(latitude_os), np.cos(latitude_os)
+    dlam = longitude_os-datum.lam_0
+
+    northing = (geo._meridional_arc(latitude_os, datum) + datum.N_0
+                + nu/2*s*c*dlam**2
+                + nu/24*s*c**3*(5-tan2+9*eta2)*dlam**4
+                + nu/720*s*c**5*(61-58*tan2+tan2**2)*dlam**6)
+    easting = (datum.E_0 + nu*c*dlam
+               + nu/6*c**3*(nu/rho-tan2)*dlam**3
+               + nu/120*c**5*(5-18*tan2+tan2**2+14*eta2-58*tan2*eta2)*dlam**5)
+    return easting, northing
+
+def test_get_easting_northing_matches_reference():
+    """Test the fused transform against the unfused one, across chunks."""
+    rng = np.random.default_rng(0)
+    latitude = rng.uniform(49.9, 58.7, 1000)
+    longitude = rng.uniform(-6.4, 1.8, 1000)
+
+    easting, northing = geo.get_easting_northing_from_lat_long(latitude, longitude,
+                                                               chunk_size=300)
+    expected = reference_easting_northing(latitude, longitude)
+    assert easting == approx(expected[0], abs=1.0e-6)
+    assert northing == approx(expected[1], abs=1.0e-6)
+
+def test_get_easting_northing_out_and_dtype():
+    """Test writing into preallocated arrays, and single precision."""
+    latitude = np.array([51.5, 52.2, 55.9])
+    longitude = np.array([-0.1, 0.12, -3.2])
+    expected = geo.get_easting_northing_from_lat_long(latitude, longitude)
+
+    out = (np.empty(3), np.empty(3))
+    result = geo.get_easting_northing_from_lat_long(latitude, longitude, out=out)
+    assert result[0] is out[0] and result[1] is out[1]
+    assert np.array(out) == approx(np.array(expected), abs=1.0e-6)
+
+    single = geo.get_easting_northing_from_lat_long(latitude, longitude, dtype=np.float32)
+    assert single[0].dtype == np.float32
+    assert np.array(single, dtype=float) == approx(np.array(expected), abs=5.0)
+
+    empty = geo.get_easting_northing_from_lat_long([], [])
+    assert len(empty[0]) == 0 and len(empty[1]) == 0
+
+    scalar = geo.get_easting_northing_from_lat_long(51.5, -0.1)
+    assert scalar[0].shape == scalar[1].shape == (1,)
+    assert np.array(scalar) == approx(np.array(expected)[:, :1], abs=1.0e-6)
+    assert geo.get_lat_long_from_easting_northing(*np.array(expected)[:, 0])[0].shape == (1,)
+
+    # arrays the chunk loop can't write through are refused rather than left unfilled
+    strided = np.empty((3, 2))[:, 0]
+    for bad in ((strided, np.empty(3)), (np.empty(4), np.empty(4)), (np.empty(3, np.float32), np.empty(3))):
+        with raises(ValueError):
+            geo.get_easting_northing_from_lat_long(latitude, longitude, out=bad)
+        with raises(ValueError):
+            geo.get_lat_long_from_easting_northing(*expected, out=bad)
+
+def test_newton_latitude_matches_baseline():
+    """Test the fused transform's latitude iteration against the baseline loop, across GB."""
+    rng = np.random.default_rng(0)
+    latitude = np.radians(rng.uniform(49.9, 60.9, 2000))
+    longitude = np.radians(rng.uniform(-8.2, 1.8, 2000))
+    x, y, z = geo.lat_long_to_xyz(latitude, longitude, radians=True)
+    p = np.sqrt(x**2 + y**2)
+
+    fused = geo._newton_latitude(z, p, geo.osgb36)
+    baseline, _ = geo.xyz_to_lat_long(x, y, z, radians=True)
+    assert np.abs(fused - latitude).max() < 1.0e-12
+    assert np.abs(fused - baseline).max() < 1.0e-12
+    # the residual of the solved equation vanishes too
+    nu = geo.osgb36.a*geo.osgb36.F_0/np.sqrt(1 - geo.osgb36.e2*np.sin(fused)**2)
+    residual = (z + geo.osgb36.e2*nu*np.sin(fused))/p - np.tan(fused)
+    assert np.abs(residual).max() < 1.0e-12
+
+def test_OSGB36toWGS84():
+    """Test OSGB36toWGS84 inverts WGS84toOSGB36."""
+    lat_long_wgs = np.array([[geo.rad(52, 39, 28.71), geo.rad(57, 8, 40.0)],
+                             [geo.rad(1, 42, 57.79), geo.rad(-2, 5, 53.0)]])
+    lat_long_os = geo.WGS84toOSGB36(*lat_long_wgs, True)
+
+    assert geo.OSGB36toWGS84(*lat_long_os, True) == approx(lat_long_wgs, abs=1.0e-12)
+
+def test_get_lat_long_from_easting_northing():
+    """Test get_lat_long_from_easting_northing."""
+    latitude, longitude = geo.get_lat_long_from_easting_northing(np.array([651409.903]),
+                                                                 np.array([313177.270]),
+                                                                 radians=True)
+    lat_long_os = geo.WGS84toOSGB36(latitude, longitude, True)
+
+    assert lat_long_os == approx(np.array([[geo.rad(52, 39, 27.2531)],
+                                           [geo.rad(1, 43, 4.5177)]]), abs=1.0e-8)
+
+def test_lat_long_round_trip():
+    """Test the inverse transform against the forward one, across chunks."""
+    rng = np.random.default_rng(1)
+    latitude = rng.uniform(49.9, 58.7, 1000)
+    longitude = rng.uniform(-6.4, 1.8, 1000)
+    easting, northing = geo.get_easting_northing_from_lat_long(latitude, longitude)
+
+    out = (np.empty(1000), np.empty(1000))
+    result = geo.get_lat_long_from_easting_northing(easting, northing, out=out, chunk_size=300)
+    assert result[0] is out[0] and result[1] is out[1]
+    assert out[0] == approx(latitude, abs=1.0e-8)
+    assert out[1] == approx(longitude, abs=1.0e-8)
+
+    round_trip = geo.get_easting_northing_from_lat_long(*out)
+    assert round_trip[0] == approx(easting, abs=1.0e-3)
+    assert round_trip[1] == approx(northing, abs=1.0e-3)
+
+    single = geo.get_lat_long_from_easting_northing(easting, northing, dtype=np.float32)
+    assert single[0].dtype == np.float32
+    assert np.array(single, dtype=float) == approx(np.array((latitude, longitude)), abs=1.0e-4)
@@ -0,0 +1,46 @@
+"""Test recording of the stages of tool queries."""
+
+import json
+import logging
+
+import numpy as np
+import flood_tool.tool as tool
+import flood_tool.instrument as instrument
+
+POSTCODES = ['CT147NW', 'da99ty', 'not a postcode', 'CT147NW']
+
+
+def test_stages(caplog):
+    """Check stages are recorded with their rows only while enabled, and logged as JSON."""
+    flood_tool = tool.Tool()
+    instrument.reset()
+    flood_tool.get_lat_long(POSTCODES)
+    assert instrument.stats() == {}
+
+    instrument.enable()
+    try:
+        flood_tool.get_sorted_annual_flood_risk(POSTCODES)
+        flood_tool.get_sorted_annual_flood_risk(POSTCODES[:1])
+        stats = instrument.stats()
+        assert stats['tool.get_sorted_annual_flood_risk']['calls'] == 2
+        assert stats['tool.get_sorted_annual_flood_risk']['rows'] == 5
+        assert stats['tool.get_sorted_annual_flood_risk']['max_rows'] == 4
+        assert stats['tool.band_search']['rows'] == 2 + 1
+        tool.Tool().get_lat_long(POSTCODES)
+        assert instrument.stats()['tool.load.postcodes']['rows'] == len(flood_tool.postcode_data)
+        for name in ('tool.normalise', 'tool.lookup', 'tool.sorted_frame',
+                     'geo.get_easting_northing_from_lat_long'):
+            assert stats[name]['calls'] > 0 and stats[name]['seconds'] > 0
+
+        instrument.enable(log=True)
+        with caplog.at_level(logging.INFO, logger='flood_tool.stats'):
+            flood_tool.get_flood_cost(POSTCODES)
+        logged = [json.loads(record.getMessage()) for record in caplog.records]
+        assert logged[-1]['stage'] == 'tool.get_flood_cost' and logged[-1]['rows'] == 4
+        assert {'tool.normalise', 'tool.lookup'} <= {entry['stage'] for entry in logged}
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    np.testing.assert_array_equal(flood_tool.get_lat_long(POSTCODES[:1]), flood_tool.get_lat_long(['CT14 7NW']))
+    assert instrument.stats() == {}
@@ -0,0 +1,38 @@
+"""Test parallel execution module."""
+
+import numpy as np
+import pandas as pd
+import flood_tool.tool as tool
+import flood_tool.parallel as parallel
+
+
+def test_tool_pool_matches_tool():
+    """Test ToolPool answers match Tool, merged in input order."""
+    tool_ = tool.Tool()
+    rng = np.random.default_rng(0)
+    postcodes = rng.choice(np.asarray(tool_.postcode_data.index, dtype=str), 3000)
+    postcodes[::9] = 'invalid'
+    bands = rng.choice(tool.PROBABILITY_BANDS, 3000)
+    easting = rng.uniform(500000, 650000, 3000)
+    northing = rng.uniform(100000, 200000, 3000)
+
+    with parallel.ToolPool(tool_, processes=2, chunk_size=400) as pool:
+        np.testing.assert_array_equal(pool.get_lat_long(postcodes), tool_.get_lat_long(postcodes))
+        np.testing.assert_array_equal(pool.get_flood_cost(postcodes), tool_.get_flood_cost(postcodes))
+        np.testing.assert_array_equal(pool.get_annual_flood_risk(postcodes, bands),
+                                      tool_.get_annual_flood_risk(postcodes, bands))
+        np.testing.assert_array_equal(pool.get_easting_northing_flood_probability(easting, northing),
+                                      tool_.get_easting_northing_flood_probability(easting, northing))
+        pd.testing.assert_frame_equal(pool.get_sorted_flood_probability(postcodes),
+                                      tool_.get_sorted_flood_probability(postcodes))
+        pd.testing.assert_frame_equal(pool.get_sorted_annual_flood_risk(postcodes),
+                                      tool_.get_sorted_annual_flood_risk(postcodes))
+        # small batches are answered without the workers
+        assert pool.get_flood_cost([]).shape == (0,)
+
+def test_tool_pool_spawn():
+    """Test ToolPool workers started without fork load the tool themselves."""
+    tool_ = tool.Tool()
+    postcodes = np.asarray(tool_.postcode_data.index, dtype=str)[:500]
+    with parallel.ToolPool(tool.Tool(), processes=2, chunk_size=100, start_method='spawn') as pool:
+        np.testing.assert_array_equal(pool.get_lat_long(postcodes), tool_.get_lat_long(postcodes))
@@ -0,0 +1,84 @@
+"""Test rainfall statistics over ranges of days."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import flood_tool.archive as archive
+import flood_tool.rainfall as rainfall
+from flood_tool.store import save_arrays
+
+
+@pytest.fixture
+def readings(tmp_path):
+    """An archive of three days of random readings, with the readings as one DataFrame."""
+    store = archive.ReadingsArchive(str(tmp_path))
+    rng = np.random.default_rng(1)
+    frames = []
+    for date in ['2020-01-01', '2020-01-02', '2020-01-04']:
+        n = 500
+        stations = np.array(['S%d' % i for i in range(8)])
+        if date == '2020-01-02':
+            stations = stations[2:]
+        station = rng.integers(0, len(stations), n)
+        arrays = {'stations': stations, 'station': station.astype(np.int32),
+                  'time': np.sort(rng.integers(0, 96, n)*900).astype(np.int32),
+                  'value': np.where(rng.random(n) < 0.05, np.nan, rng.random(n).round(1)).astype(np.float32)}
+        save_arrays(arrays, store.path(date))
+        frames.append(pd.DataFrame({'stationReference': stations[station],
+                                    'dateTime': pd.Timestamp(date) + pd.to_timedelta(arrays['time'], unit='s'),
+                                    'value': arrays['value'].astype(np.float64)}))
+    return store, pd.concat(frames, ignore_index=True)
+
+
+def test_aggregate_rainfall(readings):
+    """Check the statistics match those of the readings all loaded at once."""
+    store, frame = readings
+    result = rainfall.aggregate_rainfall(store, '2020-01-01', '2020-01-04', windows=['1h', '24h'])
+    grouped = frame.groupby('stationReference').value
+
+    assert list(result.index) == sorted(frame.stationReference.unique())
+    assert list(result.readings) == list(grouped.count())
+    np.testing.assert_allclose(result.total, grouped.sum())
+    np.testing.assert_allclose(result['max'], grouped.max())
+    np.testing.assert_allclose(result['mean'], grouped.mean())
+
+    for window, column in [('1h', 'max_1h_total'), ('24h', 'max_24h_total')]:
+        expected = (frame.fillna({'value': 0.0}).set_index('dateTime').sort_index(kind='stable')
+                    .groupby('stationReference').value.rolling(window).sum().groupby(level=0).max())
+        np.testing.assert_allclose(result[column], expected)
+
+
+def test_aggregator_order(readings):
+    """Check days added out of order are refused."""
+    store, _ = readings
+    aggregator = rainfall.RainfallAggregator()
+    aggregator.update('2020-01-02', store.partition('2020-01-02'))
+    with pytest.raises(ValueError):
+        aggregator.update('2020-01-01', store.partition('2020-01-01'))
+
+
+def test_summarise_rainfall(readings):
+    """Check the summary matches sorting all the readings."""
+    _, frame = readings
+    summary = rainfall.summarise_rainfall(frame, k=3)
+
+    means = frame.groupby('stationReference').value.mean().sort_values(ascending=False, kind='stable')
+    assert summary['highest_mean_station'] == means.index[0]
+    assert list(summary['top_means'].index) == list(means.index[:3])
+    np.testing.assert_allclose(summary['top_means'], means[:3])
+
+    expected = frame.sort_values('value', ascending=False, kind='stable')[:3]
+    assert list(summary['top_readings'].index) == list(expected.index)
+    assert summary['highest_station'] == expected.stationReference.iloc[0]
+    assert summary['highest_time'] == expected.dateTime.iloc[0]
+    assert summary['highest_value'] == expected.value.iloc[0]
+    assert summary['peak_time'] == frame.groupby('dateTime').value.mean().idxmax()
+
+
+def test_summarise_no_readings():
+    """Check an empty summary."""
+    frame = pd.DataFrame({'stationReference': ['A'], 'dateTime': [pd.Timestamp('2020-01-01')],
+                          'value': [np.nan]})
+    summary = rainfall.summarise_rainfall(frame)
+    assert summary['highest_mean_station'] is None and summary['peak_time'] is None
+    assert len(summary['top_readings']) == 0
@@ -0,0 +1,104 @@
+"""Test the HTTP scoring service, on a local port."""
+
+import http.client
+import io
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import flood_tool.service as service
+import flood_tool.tool as tool
+
+POSTCODES = ['CT147NW', 'da99ty', 'not a postcode']
+
+
+@pytest.fixture(scope='module')
+def scoring():
+    """A service on a free local port, with a connection to it."""
+    scoring = service.ScoringService(tool.Tool(), heavy_size=2)
+    server = scoring.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+    yield scoring, connection
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def request(connection, method, path, body=None, headers={}):
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def test_json_queries(scoring):
+    """Check each endpoint answers as the tool does."""
+    scoring, connection = scoring
+    flood_tool = scoring.tool
+    normalised = list(tool.normalise_postcodes(POSTCODES))
+
+    status, body = request(connection, 'GET', '/lat_long?postcode=CT147NW')
+    assert status == 200
+    result = json.loads(body)
+    np.testing.assert_allclose([result['Latitude'][0], result['Longitude'][0]],
+                               flood_tool.get_lat_long(['CT147NW'])[0])
+
+    status, body = request(connection, 'POST', '/annual_risk', json.dumps({'postcodes': POSTCODES}))
+    result = json.loads(body)
+    assert status == 200 and result['Postcode'] == normalised
+    lat_long = flood_tool.get_lat_long(POSTCODES[:2])
+    easting, northing = service.get_easting_northing_from_lat_long(lat_long[:, 0], lat_long[:, 1])
+    bands = list(flood_tool.get_easting_northing_flood_probability(easting, northing))
+    assert result['Probability Band'] == bands + [None]
+    np.testing.assert_allclose(result['Flood Risk'][:2], flood_tool.get_annual_flood_risk(POSTCODES[:2], bands))
+    assert result['Flood Risk'][2] is None
+
+    status, body = request(connection, 'POST', '/sorted_risk', json.dumps(POSTCODES))
+    expected = flood_tool.get_sorted_annual_flood_risk(POSTCODES)
+    assert json.loads(body)['Postcode'] == list(expected.index)
+
+    status, body = request(connection, 'POST', '/probability', json.dumps({'easting': [easting[0]],
+                                                                           'northing': [northing[0]]}))
+    assert json.loads(body)['Probability Band'] == bands[:1]
+
+
+def test_csv_queries(scoring):
+    """Check .csv bodies are read and written."""
+    scoring, connection = scoring
+    body = pd.DataFrame({'Postcode': POSTCODES}).to_csv(index=False)
+    status, body = request(connection, 'POST', '/flood_cost', body,
+                           {'Content-Type': 'text/csv', 'Accept': 'text/csv'})
+    assert status == 200
+    result = pd.read_csv(io.BytesIO(body))
+    assert list(result.columns) == ['Postcode', 'Flood Cost']
+    np.testing.assert_allclose(result['Flood Cost'], scoring.tool.get_flood_cost(POSTCODES))
+
+
+def test_errors(scoring):
+    """Check bad requests get error statuses, and the connection stays usable."""
+    _, connection = scoring
+    assert request(connection, 'GET', '/nowhere?postcode=CT147NW')[0] == 404
+    assert request(connection, 'POST', '/lat_long', b'{not json')[0] == 400
+    assert request(connection, 'GET', '/lat_long')[0] == 400
+    assert request(connection, 'POST', '/probability', json.dumps({'easting': [1.0]}))[0] == 400
+    assert request(connection, 'GET', '/health') == (200, b'{"status": "ok"}')
+
+    for length in ('ten', '-1'):
+        bad = http.client.HTTPConnection(connection.host, connection.port)
+        status, body = request(bad, 'POST', '/lat_long', b'[]', {'Content-Length': length})
+        bad.close()
+        assert status == 400 and json.loads(body) == {'error': 'Bad Content-Length'}
+
+
+def test_batched_scoring(scoring):
+    """Check small batches answered through a BatchingTool match the tool's answers."""
+    from flood_tool.batching import BatchingTool
+    scoring, _ = scoring
+    with BatchingTool(scoring.tool) as batcher:
+        batched = service.ScoringService(scoring.tool, heavy_size=1000, batching=batcher)
+        for endpoint in service.ScoringService.ENDPOINTS:
+            pd.testing.assert_frame_equal(batched.score(endpoint, POSTCODES), scoring.score(endpoint, POSTCODES))
+        assert batcher.requests > 0
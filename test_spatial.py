@@ -0,0 +1,82 @@
+"""Test spatial indexing module."""
+
+import numpy as np
+import flood_tool.spatial as spatial
+
+
+def brute_force_max(x, y, cx, cy, radius, value):
+    """Reference highest circle value per point, by checking every circle."""
+    result = np.zeros(len(x), dtype=value.dtype)
+    for j in range(len(x)):
+        inside = np.sqrt((cx-x[j])**2 + (cy-y[j])**2) <= radius
+        if inside.any():
+            result[j] = value[inside].max()
+    return result
+
+def test_circle_index_matches_brute_force():
+    """Test CircleIndex.query_max against an exhaustive search."""
+    rng = np.random.default_rng(42)
+    cx = rng.uniform(0, 10000, 500).round()
+    cy = rng.uniform(0, 10000, 500).round()
+    radius = rng.choice([10., 50., 200., 1500.], 500)
+    value = rng.integers(1, 5, 500).astype(np.uint8)
+
+    # random points, plus points exactly on circle edges
+    x = np.concatenate([rng.uniform(-500, 10500, 2000), cx + radius])
+    y = np.concatenate([rng.uniform(-500, 10500, 2000), cy])
+
+    index = spatial.CircleIndex(cx, cy, radius, value, chunk_size=256)
+    np.testing.assert_array_equal(index.query_max(x, y),
+                                  brute_force_max(x, y, cx, cy, radius, value))
+
+def test_circle_index_empty():
+    """Test CircleIndex with no circles or no points."""
+    index = spatial.CircleIndex([], [], [], np.array([], dtype=np.uint8))
+    np.testing.assert_array_equal(index.query_max([1., 2.], [3., 4.]), [0, 0])
+
+    index = spatial.CircleIndex([0.], [0.], [5.], np.array([3], dtype=np.uint8))
+    assert len(index.query_max([], [])) == 0
+    np.testing.assert_array_equal(index.query_max([3., 4.], [4., 4.]), [3, 0])
+
+def test_band_raster_matches_circle_index():
+    """Test BandRaster.query against CircleIndex.query_max."""
+    rng = np.random.default_rng(7)
+    cx = rng.uniform(0, 5000, 300).round()
+    cy = rng.uniform(0, 5000, 300).round()
+    radius = rng.choice([10., 35., 120., 800.], 300)
+    value = rng.integers(1, 5, 300).astype(np.uint8)
+    index = spatial.CircleIndex(cx, cy, radius, value)
+
+    angle = rng.uniform(0, 2*np.pi, 300)
+    x = np.concatenate([rng.uniform(-100, 5100, 5000), cx + radius*np.cos(angle), cx - radius])
+    y = np.concatenate([rng.uniform(-100, 5100, 5000), cy + radius*np.sin(angle), cy])
+
+    for cell_size in (10., 50.):
+        raster = spatial.BandRaster.from_circles(index, cell_size, block_cells=1000)
+        np.testing.assert_array_equal(raster.query(x, y, index.query_max), index.query_max(x, y))
+
+def test_point_index_matches_brute_force():
+    """Test PointIndex within-radius and nearest queries against an exhaustive search."""
+    rng = np.random.default_rng(7)
+    px = rng.uniform(0, 10000, 300)
+    py = rng.uniform(0, 20000, 300)
+    x = np.concatenate([rng.uniform(-3000, 13000, 1000), [np.nan]])
+    y = np.concatenate([rng.uniform(-3000, 23000, 1000), [0.]])
+    distance = np.hypot(px[None, :] - x[:, None], py[None, :] - y[:, None])
+
+    index = spatial.PointIndex(px, py, chunk_size=256)
+    points, members, d = index.within(x, y, 1500.)
+    expected_points, expected_members = np.nonzero(distance <= 1500.)
+    assert set(zip(points, members)) == set(zip(expected_points, expected_members))
+    np.testing.assert_allclose(d, distance[points, members])
+    assert (np.diff(points) >= 0).all()
+    assert (np.diff(d)[np.diff(points) == 0] >= 0).all()
+
+    members, d = index.nearest(x, y, k=4)
+    expected = np.sort(distance[:-1], axis=1)[:, :4]
+    np.testing.assert_allclose(d[:-1], expected)
+    np.testing.assert_allclose(distance[np.arange(len(x) - 1)[:, None], members[:-1]], expected)
+    assert (members[-1] == -1).all() and np.isinf(d[-1]).all()
+
+    members, d = spatial.PointIndex(px[:2], py[:2]).nearest(x[:3], y[:3], k=3)
+    assert (members[:, 2] == -1).all() and np.isfinite(d[:, :2]).all()
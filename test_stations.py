@@ -0,0 +1,43 @@
+"""Test the local catalogue of monitoring stations."""
+
+import numpy as np
+import pandas as pd
+import flood_tool.geo as geo
+import flood_tool.stations as stations
+import flood_tool.tool as tool
+
+
+def test_catalogue_positions():
+    """Check stations are located from eastings and northings, or latitude and longitude."""
+    frame = pd.DataFrame({'stationReference': ['A', 'B', 'C', 'D'],
+                          'lat': [51.2, 51.4, '51.3|51.31', np.nan],
+                          'long': [1.3, 0.3, 1.1, np.nan],
+                          'easting': [np.nan, 560000., np.nan, np.nan],
+                          'northing': [np.nan, 170000., np.nan, np.nan]})
+    catalogue = stations.StationCatalogue(frame)
+
+    assert list(catalogue.references) == ['A', 'B', 'C']
+    easting, northing = geo.get_easting_northing_from_lat_long([51.2, 51.3], [1.3, 1.1])
+    np.testing.assert_allclose(catalogue.stations.easting.values[[0, 2]], easting)
+    np.testing.assert_allclose(catalogue.stations.northing.values[[0, 2]], northing)
+    assert catalogue.stations.easting[1] == 560000.
+
+
+def test_postcode_queries():
+    """Check the stations near postcodes are found by distance from each postcode."""
+    flood_tool = tool.Tool()
+    postcodes = ['CT147NW', 'DA9 9TY', 'not a postcode']
+    lat_long = flood_tool.get_lat_long(postcodes)
+    frame = pd.DataFrame({'stationReference': ['near1', 'near2', 'far'],
+                          'lat': [lat_long[0, 0] + 0.01, lat_long[1, 0], 55.],
+                          'long': [lat_long[0, 1], lat_long[1, 1] - 0.02, -2.]})
+    catalogue = stations.StationCatalogue(frame)
+
+    location, station, distance = catalogue.postcodes_within(flood_tool, postcodes, 10000.)
+    assert list(location) == [0, 1]
+    assert list(catalogue.references[station]) == ['near1', 'near2']
+    assert (distance < 2000.).all()
+
+    station, distance = catalogue.postcodes_nearest(flood_tool, postcodes, k=2)
+    assert list(catalogue.references[station[:2, 0]]) == ['near1', 'near2']
+    assert (station[2] == -1).all()
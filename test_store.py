@@ -0,0 +1,40 @@
+"""Test binary table storage module."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import flood_tool.store as store
+
+
+def test_save_load_table(tmp_path):
+    """Test a table survives a save and load round trip."""
+    frame = pd.DataFrame({'Postcode': ['DA1 1PT', 'CT147PF'],
+                          'Latitude': [51.430755, 51.197065],
+                          'Total_value': [1406250.17, 0.0]}).set_index('Postcode')
+    store.save_table(frame, str(tmp_path/'table'))
+    loaded = store.load_table(str(tmp_path/'table'))
+
+    assert isinstance(loaded.Latitude.values, np.memmap)
+    pd.testing.assert_frame_equal(loaded, frame, check_index_type=False)
+
+def test_cached_table_rebuilds_on_change(tmp_path):
+    """Test cached_table only rebuilds when a source file changes."""
+    source = tmp_path/'values.csv'
+    source.write_text('Postcode,Total Value\nDA1 1PT,1406250.17\n')
+    calls = []
+
+    def build():
+        calls.append(1)
+        return pd.read_csv(str(source)).set_index('Postcode')
+
+    first = store.cached_table('values', [str(source)], build)
+    second = store.cached_table('values', [str(source)], build)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, second, check_index_type=False)
+    assert os.path.isdir(str(tmp_path/store.CACHE_DIRECTORY))
+
+    source.write_text('Postcode,Total Value\nDA1 1PT,1406250.17\nDA2 6LL,10284387.0\n')
+    third = store.cached_table('values', [str(source)], build)
+    assert len(calls) == 2
+    assert len(third) == 2
@@ -4,6 +4,7 @@ import flood_tool.tool as tool
 import numpy as np
 import pandas as pd
 import os
+import pickle
 
 
 """Unit test suite to validate methods in tool file"""
@@ -94,6 +95,139 @@ class TestTool(unittest.TestCase):
         """Test to validate get_sorted_annual_flood_risk method """
         pd.testing.assert_frame_equal(self.actual_sorted_annual_flood_risk_df, self.desired_sorted_annual_flood_risk_df)
 
+    def test_normalise_postcodes(self):
+        """Test to validate normalise_postcodes function """
+        np.testing.assert_array_equal(tool.normalise_postcodes(['cT14 7nW', 'da99ty', 'a11aa', 'DA1  1PT', 'tosin w']),
+                                      ['CT147NW', 'DA9 9TY', 'A1  1AA', 'DA1 1PT', 'TOS INW'])
+        np.testing.assert_array_equal(tool.normalise_postcodes(['invalid postcode', 'ab']), ['INVALIDPOSTCODE', 'AB'])
+
+    def test_compact_layout(self):
+        """Test to validate the compact postcode table gives the same results """
+        compact_tool = tool.Tool(compact=True)
+        np.testing.assert_allclose(compact_tool.get_lat_long(self.valid_invalid_dirty_postcodes),
+                                   self.desired_lat_long_from_valid_invalid_postcodes, atol=1e-5, equal_nan=True)
+        np.testing.assert_allclose(compact_tool.get_flood_cost(self.valid_invalid_duplicate_postcodes),
+                                   self.desired_flood_costs, equal_nan=True)
+        pd.testing.assert_frame_equal(compact_tool.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes),
+                                      self.desired_sorted_annual_flood_risk_df)
+
+    def test_precomputed_bands(self):
+        """Test to validate precomputed postcode bands give the same results """
+        precomputed_tool = tool.Tool(precompute=True)
+        pd.testing.assert_frame_equal(precomputed_tool.get_sorted_flood_probability(self.valid_invalid_duplicate_postcodes),
+                                      self.desired_sorted_flood_brobability_df)
+        pd.testing.assert_frame_equal(precomputed_tool.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes),
+                                      self.desired_sorted_annual_flood_risk_df)
+
+    def test_raster_bands(self):
+        """Test to validate rasterised risk bands give the same results """
+        raster_tool = tool.Tool(raster_cell_size=25)
+        np.testing.assert_array_equal(raster_tool.get_easting_northing_flood_probability(self.easting_array, self.northing_array),
+                                      self.desired_probabilty_from_easting_northing)
+        pd.testing.assert_frame_equal(raster_tool.get_sorted_flood_probability(self.valid_invalid_duplicate_postcodes),
+                                      self.desired_sorted_flood_brobability_df)
+
+    def test_lazy_loading(self):
+        """Test to validate data sources are only loaded when first needed """
+        lazy_tool = tool.Tool()
+        self.assertEqual(lazy_tool._loaded, {})
+        lazy_tool.get_lat_long(self.valid_clean_postcodes)
+        self.assertNotIn('property_values', lazy_tool._loaded)
+        self.assertNotIn('risk_data', lazy_tool._loaded)
+        lazy_tool.warm()
+        self.assertIn('property_values', lazy_tool._loaded)
+        self.assertIn('risk_index', lazy_tool._loaded)
+
+    def test_lookup_postcodes(self):
+        """Test to validate lookup_postcodes method """
+        postcodes, positions = self.tool.lookup_postcodes(self.valid_invalid_dirty_postcodes)
+        np.testing.assert_array_equal(postcodes, ['TO  SIN', 'DA9 9TY', 'INVALIDPOSTCODE', 'CT3 3EL', 'CT147NW'])
+        np.testing.assert_array_equal(positions < 0, [True, False, True, False, False])
+        np.testing.assert_array_equal(self.tool.postcode_data.index[positions[positions >= 0]], ['DA9 9TY', 'CT3 3EL', 'CT147NW'])
+
+    def test_publish_attach(self):
+        """Test to validate tools attached to published tables share them and give the same results """
+        for options in ({}, {'compact': True, 'precompute': True, 'raster_cell_size': 25}):
+            owner = tool.Tool(**options)
+            directory = owner.publish()
+            attached = tool.Tool.attach(directory)
+            self.assertIsInstance(attached._loaded['total_value'], np.memmap)
+            self.assertNotIn('postcodes', attached.warm()._loaded)
+
+            for shared in (attached, pickle.loads(pickle.dumps(owner))):
+                np.testing.assert_array_equal(shared.get_lat_long(self.valid_invalid_dirty_postcodes),
+                                              owner.get_lat_long(self.valid_invalid_dirty_postcodes))
+                np.testing.assert_array_equal(shared.get_easting_northing_flood_probability(self.easting_array, self.northing_array),
+                                              self.desired_probabilty_from_easting_northing)
+                pd.testing.assert_frame_equal(shared.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes),
+                                              self.desired_sorted_annual_flood_risk_df)
+                pd.testing.assert_frame_equal(shared.postcode_data, owner.postcode_data, check_index_type=False)
+
+            owner.unpublish()
+            self.assertFalse(os.path.exists(directory))
+            # attached tools keep working from their maps
+            np.testing.assert_allclose(attached.get_flood_cost(self.valid_invalid_duplicate_postcodes),
+                                       self.desired_flood_costs, equal_nan=True)
+
+    def test_result_cache(self):
+        """Test to validate cached results match, count hits and misses, and are dropped on reload """
+        cached_tool = tool.Tool(result_cache_size=4)
+        for _ in range(2):
+            pd.testing.assert_frame_equal(cached_tool.get_sorted_flood_probability(self.valid_invalid_duplicate_postcodes),
+                                          self.desired_sorted_flood_brobability_df)
+            pd.testing.assert_frame_equal(cached_tool.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes),
+                                          self.desired_sorted_annual_flood_risk_df)
+            np.testing.assert_allclose(cached_tool.get_flood_cost(self.valid_invalid_duplicate_postcodes),
+                                       self.desired_flood_costs, equal_nan=True)
+            np.testing.assert_allclose(cached_tool.get_lat_long(self.valid_invalid_dirty_postcodes),
+                                       self.desired_lat_long_from_valid_invalid_postcodes, equal_nan=True)
+        # four distinct postcodes computed once, then evicted by four others
+        counting_tool = tool.Tool(result_cache_size=4)
+        counting_tool.get_flood_cost(self.valid_invalid_duplicate_postcodes)
+        counting_tool.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes)
+        counting_tool.get_lat_long(self.valid_clean_postcodes)
+        self.assertEqual(counting_tool.result_cache_stats(),
+                         {'hits': 4, 'misses': 8, 'evictions': 4, 'entries': 4, 'max_size': 4})
+        self.assertIsNone(self.tool.result_cache_stats())
+
+        # locations and costs are cached without the risk circle search, which is done once needed
+        unscored_tool = tool.Tool(result_cache_size=10)
+        def no_search(positions):
+            raise AssertionError('scored a location or cost query')
+        unscored_tool._band_ranks = no_search
+        unscored_tool.get_lat_long(self.valid_invalid_duplicate_postcodes)
+        unscored_tool.get_flood_cost(self.valid_invalid_duplicate_postcodes)
+        del unscored_tool._band_ranks
+        pd.testing.assert_frame_equal(unscored_tool.get_sorted_annual_flood_risk(self.valid_invalid_duplicate_postcodes),
+                                      self.desired_sorted_annual_flood_risk_df)
+
+        cached_tool.reload()
+        self.assertEqual(cached_tool._loaded, {})
+        self.assertEqual(cached_tool.result_cache_stats()['entries'], 0)
+        np.testing.assert_allclose(cached_tool.get_flood_cost(self.valid_invalid_duplicate_postcodes),
+                                   self.desired_flood_costs, equal_nan=True)
+        self.assertIsNotNone(pickle.loads(pickle.dumps(cached_tool)).result_cache_stats())
+
+    def test_assess(self):
+        """Test to validate the fused assessment matches the separate query methods """
+        for assess_tool in (self.tool, tool.Tool(precompute=True, result_cache_size=10)):
+            assessment = assess_tool.assess(self.valid_invalid_duplicate_postcodes)
+            self.assertEqual(len(assessment), len(self.valid_invalid_duplicate_postcodes))
+            np.testing.assert_allclose(assessment['Flood Cost'], self.desired_flood_costs, equal_nan=True)
+            np.testing.assert_array_equal(np.column_stack([assessment['Latitude'], assessment['Longitude']]),
+                                          self.tool.get_lat_long(self.valid_invalid_duplicate_postcodes))
+            self.assertEqual(list(assessment['Probability Band']),
+                             [None, 'Zero', 'Medium', None, 'Low', 'Zero', 'Medium'])
+            np.testing.assert_allclose(assessment['Flood Risk'],
+                                       [np.nan, 0.0, 1406.25017, np.nan, 0.0, 0.0, 1406.25017], equal_nan=True)
+            pd.testing.assert_frame_equal(assessment.sorted_flood_probability(),
+                                          self.desired_sorted_flood_brobability_df)
+            pd.testing.assert_frame_equal(assessment.sorted_annual_flood_risk(),
+                                          self.desired_sorted_annual_flood_risk_df)
+            frame = assessment.to_frame()
+            self.assertEqual(list(frame.columns), list(tool.Assessment.COLUMNS))
+            self.assertEqual(frame.Postcode[1], 'CT147PF')
+
 
 if __name__ == '__main__':
     unittest.main()
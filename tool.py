@@ -1,16 +1,176 @@
 import pandas as pd
 import numpy as np
 from .geo import *
+from .instrument import stage, timed
+from .resultcache import ResultCache
+from .spatial import CircleIndex, BandRaster
+from .store import cached_arrays, cached_table, save_arrays, load_arrays, read_metadata
+from .tables import PostcodeTable, CompactPostcodeTable
 import os
+import shutil
+import tempfile
+import threading
+import weakref
 
 """Locator functions to interact with geographic data"""
 
-__all__ = ['Tool']
+__all__ = ['Tool', 'Assessment', 'normalise_postcodes']
+
+# Probability bands in increasing order, so a band's position is its rank
+PROBABILITY_BANDS = ['Zero', 'Very Low', 'Low', 'Medium', 'High']
+# Annual probability of a flood event in each band
+BAND_PROBABILITIES = {'Zero': 0.0, 'Very Low': 0.001, 'Low': 0.01, 'Medium': 0.02, 'High': 0.1}
+
+# Fields kept for each postcode in the result cache; invalid postcodes are cached as not valid.
+# Band ranks and flood risks are only filled in, and `scored`, once a query needs them.
+RESULT_FIELDS = {'valid': np.bool_, 'position': np.int64, 'latitude': np.float64, 'longitude': np.float64,
+                 'flood_cost': np.float64, 'scored': np.bool_, 'band_rank': np.uint8,
+                 'flood_risk': np.float64}
+
+@timed('tool.normalise')
+def normalise_postcodes(postcodes):
+    """Normalise a sequence of postcodes to the fixed width form used in the postcode file.
+
+    Postcodes are upper cased, stripped of whitespace, then the outward code is padded
+    with spaces to four characters, e.g. `'da11pt'` becomes `'DA1 1PT'` and `'a11aa'`
+    becomes `'A1  1AA'`. Strings that are too short or too long to be postcodes are
+    returned upper cased and stripped of whitespace.
+
+    Parameters
+    ----------
+
+    postcodes: sequence of strs
+        Ordered sequence of N postcode strings
+
+    Returns
+    -------
+
+    numpy.ndarray of strs
+        Array of N normalised postcodes.
+    """
+    # Work on the UTF-32 code points of a fixed width string array, one row per postcode
+    postcodes = np.ascontiguousarray(postcodes, dtype=str).reshape(-1)
+    width = max(postcodes.dtype.itemsize//4, 1)
+    chars = postcodes.view(np.uint32).reshape(-1, width)
+    chars = np.where((chars >= ord('a')) & (chars <= ord('z')), chars - 32, chars)
+
+    # Position of each kept character once whitespace is squeezed out, shifting the
+    # inward code to the end of a 7 character postcode
+    keep = (chars != 0) & (chars != ord(' ')) & ((chars < ord('\t')) | (chars > ord('\r')))
+    rank = np.cumsum(keep, axis=1, dtype=np.intp) - 1
+    length = rank[:, -1:] + 1
+    fixed = (length >= 5) & (length <= 7)
+    rank += np.where(fixed & (rank >= length - 3), 7 - length, 0)
+
+    normalised = np.zeros((len(chars), max(width, 7)), dtype=np.uint32)
+    normalised[fixed[:, 0], :7] = ord(' ')
+    rank += np.arange(0, normalised.size, normalised.shape[1], dtype=np.intp)[:, None]
+    normalised.reshape(-1)[rank[keep]] = chars[keep]
+    return normalised.view('U%d' % normalised.shape[1]).reshape(-1)
+
+@timed('tool.sorted_frame')
+def _sorted_probability_frame(postcodes, ranks):
+    """Build the `Tool.get_sorted_flood_probability` frame from unique postcodes and band ranks."""
+    # sorted with numpy, as pandas sorting and categoricals cost far more for small batches
+    postcodes = np.asarray(postcodes, dtype=str)
+    ranks = np.asarray(ranks)
+    order = np.lexsort((postcodes, -ranks.astype(np.int64)))
+    bands = np.array(PROBABILITY_BANDS, dtype=object)[ranks[order]]
+    return pd.DataFrame({'Probability Band': pd.array(bands, dtype=str)},
+                        index=pd.Index(postcodes[order], dtype=str, name='Postcode'))
+
+@timed('tool.sorted_frame')
+def _sorted_risk_frame(postcodes, risk):
+    """Build the `Tool.get_sorted_annual_flood_risk` frame from unique postcodes and flood risks."""
+    postcodes = np.asarray(postcodes, dtype=str)
+    risk = np.asarray(risk, dtype=np.float64)
+    # negated for descending risk; NaN sorts last either way
+    order = np.lexsort((postcodes, -risk))
+    return pd.DataFrame({'Flood Risk': risk[order]},
+                        index=pd.Index(postcodes[order], dtype=str, name='Postcode'))
+
+class Assessment(object):
+    """Results of `Tool.assess` for a sequence of postcodes, held as columns.
+
+    Index by column name for a numpy array in input order:
+
+    - `Postcode`: normalised postcodes
+    - `Latitude`, `Longitude`: WGS84 location, `numpy.nan` for invalid postcodes
+    - `Probability Band`: name of the band, `None` for invalid postcodes
+    - `Flood Cost`, `Flood Risk`: as `Tool.get_flood_cost`, and the annual flood
+      risk of the postcode's own band, `numpy.nan` for invalid postcodes
+
+    Results are kept once per distinct postcode, so the sorted views and
+    the columns are derived without scoring again.
+    """
+
+    COLUMNS = ('Postcode', 'Latitude', 'Longitude', 'Probability Band', 'Flood Cost', 'Flood Risk')
+
+    def __init__(self, postcodes, inverse, results):
+        """
+        Parameters
+        ----------
+        postcodes : numpy.ndarray of strs
+            Sorted distinct normalised postcodes.
+        inverse : numpy.ndarray of ints
+            Position in `postcodes` of each input postcode.
+        results : dict
+            `RESULT_FIELDS` of `postcodes`.
+        """
+        self.postcodes = postcodes
+        self.inverse = inverse
+        self.results = results
+
+    def __len__(self):
+        return len(self.inverse)
+
+    def _distinct(self, column):
+        """Get a column for the distinct postcodes."""
+        if column == 'Postcode':
+            return self.postcodes
+        if column == 'Probability Band':
+            bands = np.array(PROBABILITY_BANDS, dtype=object)[self.results['band_rank']]
+            bands[~self.results['valid']] = None
+            return bands
+        return self.results[{'Latitude': 'latitude', 'Longitude': 'longitude',
+                             'Flood Cost': 'flood_cost', 'Flood Risk': 'flood_risk'}[column]]
+
+    def __getitem__(self, column):
+        if column not in self.COLUMNS:
+            raise KeyError(column)
+        return self._distinct(column)[self.inverse]
+
+    def to_frame(self):
+        """Get every column as a DataFrame, one row per input postcode."""
+        return pd.DataFrame({column: self[column] for column in self.COLUMNS})
+
+    def sorted_flood_probability(self):
+        """Get the distinct valid postcodes' bands, as `Tool.get_sorted_flood_probability`."""
+        valid = self.results['valid']
+        return _sorted_probability_frame(self.postcodes[valid], self.results['band_rank'][valid])
+
+    def sorted_annual_flood_risk(self):
+        """Get the distinct valid postcodes' annual flood risks, as `Tool.get_sorted_annual_flood_risk`."""
+        valid = self.results['valid']
+        return _sorted_risk_frame(self.postcodes[valid], self.results['flood_risk'][valid])
+
+
+def _remove_published(directory, names, pid):
+    """Remove the arrays a tool published, from the process that published them."""
+    if os.getpid() != pid:
+        return
+    for name in names:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
 
 class Tool(object):
     """Class to interact with a postcode database file."""
 
-    def __init__(self, postcode_file=None, risk_file=None, values_file=None):
+    def __init__(self, postcode_file=None, risk_file=None, values_file=None, cache=True, compact=False,
+                 precompute=False, raster_cell_size=None, result_cache_size=0):
         """
         Reads postcode and flood risk files and provides a postcode locator service.
         Parameters
@@ -21,43 +181,526 @@ class Tool(object):
             Filename of a .csv file containing flood risk data.
         values_file : str, optional
             Filename of a .csv file containing property value data for postcodes.
+
+        Files are read on first use, so each method only pays for the files it needs;
+        call `warm` to load everything up front.
+
+        cache : bool, optional
+            Keep the parsed files in a binary cache next to them, so later `Tool`
+            instances load them without parsing. The cache is rebuilt when a file changes.
+        compact : bool, optional
+            Hold postcode data in the `tables.CompactPostcodeTable` layout, which uses
+            about a sixth of the memory, with coordinates rounded to float32.
+        precompute : bool, optional
+            Compute the probability band and annual flood risk of every postcode once,
+            keeping them in the cache, so postcode queries become lookups. The table is
+            recomputed when any of the files changes.
+        raster_cell_size : float, optional
+            Rasterise the risk circles onto a grid of this cell size in metres (10 to 50
+            is sensible), kept memory mapped in the cache. Easting and northing queries
+            then read the grid, with exact circle tests only in cells crossed by a
+            circle boundary.
+        result_cache_size : int, optional
+            Keep the location, probability band, flood cost and annual flood risk of up to
+            this many recently queried postcodes, so repeated postcodes are answered without
+            looking them up again. Each postcode takes about 200 bytes. 0 disables the cache;
+            see `result_cache_stats` and `reload`.
         """
-        
-        # Import postcode data
-        if postcode_file == None:
-            postcodes = pd.read_csv(os.getcwd()+'/flood_tool/resources/postcodes.csv')
-        else:
-            postcodes = pd.read_csv(postcode_file)
-            
-        # Import property values data
-        if values_file == None:
-            property_values = pd.read_csv(os.getcwd()+'/flood_tool/resources/property_value.csv')
-        else:
-            property_values = pd.read_csv(values_file)
-        
-        # Fill nan and set postcode type in property_values
-        property_values = property_values[pd.notnull(property_values.Postcode)]
-        property_values['Postcode_length'] = property_values['Postcode'].apply(len)
-        correct = pd.DataFrame(property_values.loc[property_values.Postcode_length > 7].Postcode.map(lambda s: s.replace(' ','')))
-        property_values.loc[property_values.Postcode_length > 7, 'Postcode'] = correct
-        del property_values['Postcode_length']
-        property_values.rename(columns={'Total Value': 'Total_value'}, inplace=True)
-        
-        # Import risk data
-        if risk_file == None:
-            self.risk_data = pd.read_csv(os.getcwd()+'/flood_tool/resources/flood_probability.csv')
+        resources = os.getcwd()+'/flood_tool/resources/'
+        self.postcode_file = resources+'postcodes.csv' if postcode_file is None else postcode_file
+        self.risk_file = resources+'flood_probability.csv' if risk_file is None else risk_file
+        self.values_file = resources+'property_value.csv' if values_file is None else values_file
+        self.cache = cache
+        self.compact = compact
+        self.precompute = precompute
+        self.raster_cell_size = raster_cell_size
+        self.result_cache_size = result_cache_size
+
+        # Files and indexes are loaded on first use, see _lazy
+        self._loaded = {}
+        self._lock = threading.RLock()
+        self._results = ResultCache(result_cache_size, RESULT_FIELDS) if result_cache_size else None
+        # Directory of tables shared with other processes, see publish and attach
+        self.shared_directory = None
+
+
+    def __getstate__(self):
+        # Pickle the configuration only: an unpickled tool attaches to published tables,
+        # or loads its data on first use, rather than copying it between processes
+        state = self.__dict__.copy()
+        del state['_loaded'], state['_lock'], state['_results']
+        state.pop('_unpublish', None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._loaded = {}
+        self._lock = threading.RLock()
+        self._results = ResultCache(self.result_cache_size, RESULT_FIELDS) if self.result_cache_size else None
+        if self.shared_directory is not None:
+            try:
+                self._attach()
+            except (OSError, ValueError, KeyError):
+                self.shared_directory = None
+
+
+    def _config(self):
+        """Get the arguments to create a `Tool` with the same files and options as this one."""
+        return {'postcode_file': self.postcode_file, 'risk_file': self.risk_file,
+                'values_file': self.values_file, 'cache': self.cache, 'compact': self.compact,
+                'precompute': self.precompute, 'raster_cell_size': self.raster_cell_size,
+                'result_cache_size': self.result_cache_size}
+
+
+    def _lazy(self, name):
+        """Get a data source or derived index, loading it with `_load_<name>` on first use."""
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._loaded:
+                with stage('tool.load.' + name) as loading:
+                    self._loaded[name] = getattr(self, '_load_' + name)()
+                    try:
+                        loading.rows = len(self._loaded[name])
+                    except TypeError:
+                        pass
+            return self._loaded[name]
+
+
+    def warm(self):
+        """Load every data source and index now, rather than on first use.
+
+        Useful in long-lived processes to keep loading time out of the first queries.
+
+        Returns
+        -------
+
+        Tool
+            This tool.
+        """
+        # Tools attached to published tables don't need the files they were built from
+        if self.shared_directory is None:
+            for name in ('postcodes', 'property_values', 'risk_data'):
+                self._lazy(name)
+        for name in ('postcode_table', 'total_value', 'risk_index'):
+            self._lazy(name)
+        if self.precompute:
+            self._lazy('postcode_bands')
+        if self.raster_cell_size:
+            self._lazy('risk_raster')
+        return self
+
+
+    def reload(self):
+        """Drop the loaded files and indexes and any cached results, to read the files again.
+
+        Call after the files change, so later queries answer from the new data. A
+        tool publishing its tables stops publishing them, as they are out of date,
+        and a tool attached to published tables maps them again, or else falls back
+        to the files.
+
+        Returns
+        -------
+
+        Tool
+            This tool.
+        """
+        with self._lock:
+            publishing = getattr(self, '_unpublish', None) is not None
+            self.unpublish()
+            self._loaded = {}
+            if self._results is not None:
+                self._results.clear()
+            if self.shared_directory is not None and not publishing:
+                try:
+                    self._attach()
+                except (OSError, ValueError, KeyError):
+                    self.shared_directory = None
+        return self
+
+
+    def result_cache_stats(self):
+        """Get the result cache counters.
+
+        Returns
+        -------
+
+        dict
+            Numbers of postcode `hits`, `misses` and `evictions` since the tool was
+            created, with the number of postcodes cached (`entries`) and `max_size`.
+            `None` if the cache is disabled.
+        """
+        return None if self._results is None else self._results.stats()
+
+
+    def publish(self, directory=None):
+        """Publish the loaded tables and indexes for tools in other processes to share.
+
+        The tool is warmed, then its postcode table, aligned property values, risk
+        circle index and, if enabled, precomputed bands and risk raster are saved as
+        uncompressed arrays. Tools created with `Tool.attach` memory map them
+        read-only, so one copy is held in memory however many processes attach.
+        Pickled tools, as sent to `parallel.ToolPool` workers, attach too.
+
+        The arrays are removed when this tool is garbage collected, `unpublish` is
+        called or the process exits. Tools already attached keep their maps.
+
+        Parameters
+        ----------
+
+        directory: str, optional
+            Directory to publish to. By default a new directory is made in shared
+            memory (`/dev/shm`) where available, otherwise in the temporary directory.
+
+        Returns
+        -------
+
+        str
+            The directory to pass to `Tool.attach`.
+        """
+        with self._lock:
+            if self.shared_directory is not None:
+                return self.shared_directory
+            self.warm()
+            if directory is None:
+                shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+                directory = tempfile.mkdtemp(prefix='flood_tool-', dir=shm)
+            arrays = self._shared_arrays()
+            self._unpublish = weakref.finalize(self, _remove_published, directory,
+                                               list(arrays) + ['tool'], os.getpid())
+            for name, values in arrays.items():
+                save_arrays(values, os.path.join(directory, name))
+            # written last, so attaching tools see complete tables
+            save_arrays({}, os.path.join(directory, 'tool'), {'config': self._config()})
+            self.shared_directory = directory
+        return directory
+
+
+    def unpublish(self):
+        """Remove tables published by `publish`. Tools already attached keep their maps."""
+        with self._lock:
+            if getattr(self, '_unpublish', None) is not None:
+                self._unpublish()
+                self._unpublish = None
+                self.shared_directory = None
+
+
+    @classmethod
+    def attach(cls, directory):
+        """Create a tool sharing the tables published by another tool's `publish`.
+
+        The tables are memory mapped read-only, without copying. Lookups in the
+        default layout use binary search over the shared postcodes instead of a
+        per-process hash table. `risk_data` and `postcode_data` are still loaded
+        from the files, or the binary cache, on first use.
+
+        Parameters
+        ----------
+
+        directory: str
+            Directory returned by `publish`.
+
+        Returns
+        -------
+
+        Tool
+            Tool with the publishing tool's files and options.
+        """
+        meta = read_metadata(os.path.join(directory, 'tool'))
+        if meta is None:
+            raise OSError('No tool published in ' + directory)
+        tool = cls(**meta['metadata']['config'])
+        tool.shared_directory = directory
+        tool._attach()
+        return tool
+
+
+    def _shared_arrays(self):
+        """Get the tables and indexes to publish, as dicts of arrays by name."""
+        arrays = {'postcode_table': self._lazy('postcode_table').to_arrays(),
+                  'total_value': {'total_value': self._lazy('total_value')},
+                  'risk_index': self._lazy('risk_index').to_arrays()}
+        if self.precompute:
+            bands = self._lazy('postcode_bands')
+            arrays['postcode_bands'] = {'Band_rank': bands.Band_rank.to_numpy(),
+                                        'Flood_risk': bands.Flood_risk.to_numpy()}
+        if self.raster_cell_size:
+            arrays['risk_raster'] = self._lazy('risk_raster').to_arrays()
+        return arrays
+
+
+    def _attach(self):
+        """Load the tables and indexes published in `shared_directory`, memory mapped."""
+        def load(name):
+            return load_arrays(os.path.join(self.shared_directory, name))
+
+        table = CompactPostcodeTable if self.compact else PostcodeTable
+        loaded = {'postcode_table': table.from_arrays(load('postcode_table')),
+                  'total_value': load('total_value')['total_value'],
+                  'risk_index': CircleIndex.from_arrays(load('risk_index'))}
+        if self.precompute:
+            # indexed by table row rather than postcode, which is all the queries need
+            loaded['postcode_bands'] = pd.DataFrame(load('postcode_bands'), copy=False)
+        if self.raster_cell_size:
+            loaded['risk_raster'] = BandRaster.from_arrays(load('risk_raster'))
+        with self._lock:
+            self._loaded.update(loaded)
+
+
+    @property
+    def risk_data(self):
+        """pandas.DataFrame: Flood risk circles, with `X`, `Y`, `prob_4band` and `radius` columns."""
+        return self._lazy('risk_data')
+
+
+    @property
+    def postcode_data(self):
+        """pandas.DataFrame: Postcode locations and property values, indexed by postcode."""
+        return self._lazy('postcode_data')
+
+
+    def _cached(self, name, sources, read):
+        """Load a table derived from source files through the resource cache, if enabled."""
+        if self.cache:
+            return cached_table(name, sources, read)
+        return read()
+
+
+    def _load_risk_data(self):
+        """Parse the flood risk file."""
+        def read():
+            risk_data = pd.read_csv(self.risk_file)
+            del risk_data['Unnamed: 0']
+            return risk_data
+
+        risk_data = self._cached('risk_data', [self.risk_file], read)
+        if self.compact:
+            risk_data['prob_4band'] = pd.Categorical(risk_data.prob_4band, PROBABILITY_BANDS)
+        return risk_data
+
+
+    def _load_postcodes(self):
+        """Parse the postcode file, indexed by normalised postcode."""
+        def read():
+            postcodes = pd.read_csv(self.postcode_file)
+            postcodes['Postcode'] = normalise_postcodes(postcodes.Postcode)
+            return postcodes.drop_duplicates('Postcode').set_index('Postcode').fillna(0)
+
+        return self._cached('postcodes', [self.postcode_file], read)
+
+
+    def _load_property_values(self):
+        """Parse the property values file, indexed by normalised postcode."""
+        def read():
+            property_values = pd.read_csv(self.values_file)
+            property_values = property_values[pd.notnull(property_values.Postcode)]
+            property_values['Postcode'] = normalise_postcodes(property_values.Postcode)
+            property_values = property_values.drop_duplicates('Postcode').set_index('Postcode')
+            property_values.rename(columns={'Total Value': 'Total_value'}, inplace=True)
+            del property_values['Lat']
+            del property_values['Long']
+            return property_values
+
+        return self._cached('property_values', [self.values_file], read)
+
+
+    def _load_postcode_table(self):
+        """Build the postcode lookup table in the configured layout."""
+        if self.compact:
+            return CompactPostcodeTable(self._lazy('postcodes'))
+        return PostcodeTable(self._lazy('postcodes'))
+
+
+    def _load_total_value(self):
+        """Align property values to the postcode table rows."""
+        return self._lazy('postcode_table').align_values(self._lazy('property_values').Total_value.fillna(0))
+
+
+    def _load_risk_index(self):
+        """Index risk circles by location, valued by probability band rank."""
+        risk_data = self._lazy('risk_data')
+        ranks = pd.Categorical(risk_data.prob_4band, PROBABILITY_BANDS).codes
+        return CircleIndex(risk_data.X.values, risk_data.Y.values,
+                           risk_data.radius.values, np.maximum(ranks, 0).astype(np.uint8))
+
+
+    def _load_risk_raster(self):
+        """Rasterise the risk circles, valued by probability band rank."""
+        def build():
+            return BandRaster.from_circles(self._lazy('risk_index'), self.raster_cell_size).to_arrays()
+
+        if self.cache:
+            arrays = cached_arrays('risk_raster_%gm' % self.raster_cell_size, [self.risk_file], build)
         else:
-            self.risk_data = pd.read_csv(risk_file)
-        del self.risk_data['Unnamed: 0']
-        
-        # Merge postcode and property values 
-        self.postcode_data = postcodes.set_index('Postcode').join(property_values.set_index('Postcode'))
-        del self.postcode_data['Lat']
-        del self.postcode_data['Long']
-        self.postcode_data = self.postcode_data.fillna(0)
-        pass
+            arrays = build()
+        return BandRaster.from_arrays(arrays)
+
+
+    def _load_postcode_bands(self):
+        """Compute the probability band rank and annual flood risk of every postcode, in table row order."""
+        def compute():
+            table = self._lazy('postcode_table')
+            positions = np.arange(len(table))
+            ranks = self._compute_band_ranks(positions)
+            probabilities = np.array([BAND_PROBABILITIES[band] for band in PROBABILITY_BANDS])
+            risk = 0.05*probabilities[ranks]*table.gather_values(self._lazy('total_value'), positions)
+            return pd.DataFrame({'Band_rank': ranks, 'Flood_risk': risk},
+                                index=pd.Index(table.postcodes, name='Postcode'))
+
+        name = 'postcode_bands_compact' if self.compact else 'postcode_bands'
+        return self._cached(name, [self.postcode_file, self.risk_file, self.values_file], compute)
+
+
+    def _load_postcode_data(self):
+        """Merge the postcode and property values tables by postcode."""
+        postcode_data = self._lazy('postcode_table').to_frame()
+        return postcode_data.join(self._lazy('property_values')).fillna(0)
+
+
+    def lookup_postcodes(self, postcodes):
+        """Find the rows of the postcode table matching a sequence of postcodes.
+
+        Parameters
+        ----------
+
+        postcodes: sequence of strs
+            Ordered sequence of N postcode strings
+
+        Returns
+        -------
+
+        postcodes: numpy.ndarray of strs
+            Array of N normalised postcodes.
+        positions: numpy.ndarray of ints
+            Array of N row positions in the postcode table. Invalid postcodes return -1.
+        """
+        postcodes = normalise_postcodes(postcodes)
+        table = self._lazy('postcode_table')
+        with stage('tool.lookup', len(postcodes)):
+            return postcodes, table.get_indexer(postcodes)
     
 
+    def _unique_valid_postcodes(self, postcodes):
+        """Normalise and look up postcodes, dropping invalid postcodes and duplicates."""
+        postcodes, positions = self.lookup_postcodes(postcodes)
+        postcodes, first = np.unique(postcodes, return_index=True)
+        valid = positions[first] >= 0
+        return postcodes[valid], positions[first][valid]
+
+
+    def _lookup_results(self, postcodes):
+        """Look up distinct normalised postcodes, giving their `RESULT_FIELDS` without scoring them."""
+        table = self._lazy('postcode_table')
+        with stage('tool.lookup', len(postcodes)):
+            positions = table.get_indexer(postcodes)
+        valid = positions >= 0
+        lat_long = table.lat_long(positions)
+        return {'valid': valid, 'position': positions, 'latitude': lat_long[:, 0], 'longitude': lat_long[:, 1],
+                'flood_cost': table.gather_values(self._lazy('total_value'), positions),
+                # invalid postcodes have nothing to score
+                'scored': ~valid, 'band_rank': np.zeros(len(postcodes), np.uint8),
+                'flood_risk': np.full(len(postcodes), np.nan)}
+
+
+    def _score_results(self, results):
+        """Fill in the band ranks and flood risks of looked up results not yet scored, returning which were."""
+        todo = ~results['scored']
+        if todo.any():
+            positions = results['position'][todo]
+            ranks = self._band_ranks(positions)
+            results['band_rank'][todo] = ranks
+            results['flood_risk'][todo] = self._flood_risk(positions, ranks)
+            results['scored'][todo] = True
+        return todo
+
+
+    def _postcode_results(self, postcodes, scored=True):
+        """Get the `RESULT_FIELDS` of distinct normalised postcodes, computing only what isn't cached.
+
+        Band ranks and flood risks are computed only with `scored`, so location
+        and cost queries don't pay for the risk circle search.
+        """
+        if self._results is None:
+            results = self._lookup_results(postcodes)
+            if scored:
+                self._score_results(results)
+            return results
+        found, cached = self._results.get(postcodes)
+        if found.all() and not (scored and not cached['scored'].all()):
+            return cached
+
+        if found.all():
+            results = cached
+        else:
+            looked_up = self._lookup_results(postcodes[~found])
+            results = {}
+            for name, dtype in RESULT_FIELDS.items():
+                results[name] = np.empty(len(postcodes), dtype)
+                results[name][found] = cached[name]
+                results[name][~found] = looked_up[name]
+        changed = ~found
+        if scored:
+            changed |= self._score_results(results)
+        self._results.put(postcodes[changed], {name: values[changed] for name, values in results.items()})
+        return results
+
+
+    def _cached_results(self, postcodes, scored=True):
+        """Normalise postcodes and get their `RESULT_FIELDS` through the result cache, in input order."""
+        unique, inverse = np.unique(normalise_postcodes(postcodes), return_inverse=True)
+        results = self._postcode_results(unique, scored)
+        return {name: values[inverse] for name, values in results.items()}
+
+
+    def _score_postcodes(self, postcodes):
+        """Get the distinct valid postcodes of a sequence, sorted, with their band ranks and annual flood risks."""
+        if self._results is None:
+            postcodes, positions = self._unique_valid_postcodes(postcodes)
+            ranks = self._band_ranks(positions)
+            return postcodes, ranks, self._flood_risk(positions, ranks)
+        postcodes = np.unique(normalise_postcodes(postcodes))
+        results = self._postcode_results(postcodes)
+        valid = results['valid']
+        return postcodes[valid], results['band_rank'][valid], results['flood_risk'][valid]
+
+
+    def _compute_band_ranks(self, positions):
+        """Compute probability band ranks of postcodes at postcode table positions."""
+        lat_long = self._lazy('postcode_table').lat_long(positions)
+        easting, northing = get_easting_northing_from_lat_long(lat_long[:,0], lat_long[:,1])
+        return self._query_band_ranks(easting, northing)
+
+
+    def _query_band_ranks(self, easting, northing):
+        """Get the highest probability band rank of the risk circles containing each location."""
+        index = self._lazy('risk_index')
+        raster = self._lazy('risk_raster') if self.raster_cell_size else None
+        with stage('tool.band_search', len(easting)):
+            if raster is not None:
+                return raster.query(easting, northing, index.query_max)
+            return index.query_max(easting, northing)
+
+
+    def _band_ranks(self, positions):
+        """Get probability band ranks of postcodes at postcode table positions."""
+        if self.precompute:
+            return self._lazy('postcode_bands').Band_rank.to_numpy()[positions]
+        return self._compute_band_ranks(positions)
+
+
+    def _flood_risk(self, positions, ranks):
+        """Get annual flood risks of postcodes at postcode table positions, given their band ranks."""
+        if self.precompute:
+            return self._lazy('postcode_bands').Flood_risk.to_numpy()[positions]
+        probabilities = np.array([BAND_PROBABILITIES[band] for band in PROBABILITY_BANDS])[ranks]
+        values = self._lazy('postcode_table').gather_values(self._lazy('total_value'), positions)
+        return 0.05*probabilities*values
+
+
+    @timed('tool.get_lat_long', 1)
     def get_lat_long(self, postcodes):
         """Get an array of WGS84 (latitude, longitude) pairs from a list of postcodes.
 
@@ -74,21 +717,14 @@ class Tool(object):
             Array of Nx2 (latitude, longitude) pairs for the input postcodes.
             Invalid postcodes return [`numpy.nan`, `numpy.nan`].
         """
-        
-        # Check postcodes syntax is correct
-        postcodes = [pc.upper() for pc in postcodes]
-        postcodes = [pc.replace(' ', '') if len(pc)>7 else pc for pc in postcodes]
-        postcodes = [ pc[0:2]+'  '+pc[2:] if len(pc)==5 else pc for pc in postcodes]
-        postcodes = [ pc[0:3]+' '+pc[3:] if (len(pc)==6) and (pc[2]!=' ') else pc for pc in postcodes]
-
-        try:  
-            # Fetch latitude and longitude values
-            lat_long = self.postcode_data.loc[postcodes,['Latitude','Longitude']]
-            return lat_long.values
-        except KeyError:
-            return np.full((len(postcodes),2), np.nan)
+        if self._results is not None:
+            results = self._cached_results(postcodes, scored=False)
+            return np.column_stack([results['latitude'], results['longitude']])
+        postcodes, positions = self.lookup_postcodes(postcodes)
+        return self._lazy('postcode_table').lat_long(positions)
 
     
+    @timed('tool.get_easting_northing_flood_probability', 1)
     def get_easting_northing_flood_probability(self, easting, northing):
         """Get an array of flood risk probabilities from arrays of eastings and northings.
 
@@ -114,41 +750,12 @@ class Tool(object):
         if len(easting) != len(northing):
             print('Size of input mismatch')
             return None
-        
-        length_locations = len(easting)
-        pb_result = []
-        
-        for j in range(length_locations):
-            selected_area = self.risk_data.loc[(self.risk_data.X <= (easting[j] + self.risk_data.radius.max()))
-                & (self.risk_data.X >= (easting[j]-self.risk_data.radius.max()))]
-            selected_area = self.risk_data.loc[(self.risk_data.Y <= (northing[j]+self.risk_data.radius.max())) 
-            & (self.risk_data.Y >= (northing[j]-self.risk_data.radius.max()))]
-            count = np.array(selected_area.X.count())
-            index_vals = selected_area.index[0:].values
-            
-            distance = np.sqrt((selected_area.X[index_vals]-easting[j])**2 + (selected_area.Y[index_vals]-northing[j])**2)
-            condition = distance.le(selected_area.radius[index_vals]).values
-            valid_index_values = index_vals[condition]
-            ls = (selected_area.prob_4band[valid_index_values].values)
-            if np.any(ls == 'High'):
-                pb_result.append('High')  
-        
-            elif np.any(ls == 'Medium'):
-                pb_result.append('Medium')
-        
-            elif np.any(ls == 'Low'):
-                pb_result.append('Low')
-        
-            elif np.any(ls == 'Very Low'):
-                pb_result.append('Very Low')
-        
-            else:
-                pb_result.append('Zero')
 
-        pb_result = np.asarray(pb_result)
-        return pb_result
+        ranks = self._query_band_ranks(np.asarray(easting, dtype=float), np.asarray(northing, dtype=float))
+        return np.array(PROBABILITY_BANDS)[ranks]
     
 
+    @timed('tool.get_sorted_flood_probability', 1)
     def get_sorted_flood_probability(self, postcodes):
         """Get an array of flood risk probabilities from a sequence of postcodes.
 
@@ -170,33 +777,14 @@ class Tool(object):
             data column is named `Probability Band`. Invalid postcodes and duplicates
             are removed.
         """  
-        # Check postcodes syntax is correct
-        postcodes = [pc.upper() for pc in postcodes]
-        postcodes = [pc.replace(' ', '') if len(pc)>7 else pc for pc in postcodes]
-        postcodes = [ pc[0:2]+' '+pc[2:] if len(pc)==5 else pc for pc in postcodes]
-        postcodes = [ pc[0:3]+' '+pc[3:] if (len(pc)==6) and (pc[2]!=' ') else pc for pc in postcodes]
-
-        lat_long = self.get_lat_long(postcodes)
-        
-        #get index with nan lat_long
-        nan_index = np.argwhere(np.isnan(lat_long))
-        nan_index = np.unique(nan_index[:,0])
-        
-        #remove postcodes with nan lat_long(invalied postcodes)
-        postcodes = np.delete(postcodes, tuple(nan_index))
-        
-        #remove nan lat_long values
-        lat_long = lat_long[~np.isnan(lat_long).any(axis=1)]
-       
-        easting,northing = get_easting_northing_from_lat_long(lat_long[:,0], lat_long[:,1])
-        p_bands = self.get_easting_northing_flood_probability(easting, northing)
-        flood_prob_df = pd.DataFrame({'Postcode': postcodes, 'Probability Band': p_bands }).drop_duplicates()
-        flood_prob_df['Probability Band'] = pd.Categorical(flood_prob_df['Probability Band'],['High','Medium','Low','Very Low', 'Zero'])
-        flood_prob_df = flood_prob_df.set_index("Postcode").sort_values(by=['Probability Band', 'Postcode'])
-        flood_prob_df['Probability Band'] = flood_prob_df['Probability Band'].astype(str)
-        return flood_prob_df 
+        if self._results is not None:
+            postcodes, ranks, _ = self._score_postcodes(postcodes)
+            return _sorted_probability_frame(postcodes, ranks)
+        postcodes, positions = self._unique_valid_postcodes(postcodes)
+        return _sorted_probability_frame(postcodes, self._band_ranks(positions))
         
 
+    @timed('tool.get_flood_cost', 1)
     def get_flood_cost(self, postcodes):
         """Get an array of estimated cost of a flood event from a sequence of postcodes.
         Parameters
@@ -212,20 +800,13 @@ class Tool(object):
             array of floats for the pound sterling cost for the input postcodes.
             Invalid postcodes return `numpy.nan`.
         """
-        # Check postcodes syntax is correct
-        postcodes = [pc.upper() for pc in postcodes]
-        postcodes = [pc.replace(' ', '') if len(pc)>7 else pc for pc in postcodes]
-        postcodes = [ pc[0:2]+' '+pc[2:] if len(pc)==5 else pc for pc in postcodes]
-        postcodes = [ pc[0:3]+' '+pc[3:] if (len(pc)==6) and (pc[2]!=' ') else pc for pc in postcodes]       
-
-        try:
-            flood_cost = self.postcode_data.loc[postcodes,['Total_value']]
-            n,i = flood_cost.values.shape
-            return flood_cost.values.reshape((n,))
-        except KeyError:
-            return np.full((len(postcodes),), np.nan)
+        if self._results is not None:
+            return self._cached_results(postcodes, scored=False)['flood_cost']
+        postcodes, positions = self.lookup_postcodes(postcodes)
+        return self._lazy('postcode_table').gather_values(self._lazy('total_value'), positions)
 
 
+    @timed('tool.get_annual_flood_risk', 1)
     def get_annual_flood_risk(self, postcodes, probability_bands):
         """Get an array of estimated annual flood risk in pounds sterling per year of a flood
         event from a sequence of postcodes and flood probabilities.
@@ -246,12 +827,12 @@ class Tool(object):
             Invalid postcodes return `numpy.nan`.
         """ 
 
-        prob_dict = {'High': 0.1, 'Medium': 0.02, 'Low': 0.01, 'Very Low': 0.001, 'Zero': 0.0}
         total_values = self.get_flood_cost(postcodes)
-        prob_values = np.vectorize(prob_dict.get)(probability_bands)
+        prob_values = np.vectorize(BAND_PROBABILITIES.get, otypes=[float])(probability_bands)
         return np.array(0.05* prob_values *total_values)
 
          
+    @timed('tool.get_sorted_annual_flood_risk', 1)
     def get_sorted_annual_flood_risk(self, postcodes):
         """Get a sorted pandas DataFrame of flood risks.
 
@@ -270,19 +851,34 @@ class Tool(object):
             `Postcode` and the data column `Flood Risk`.
             Invalid postcodes and duplicates are removed.
         """
-        # Calculate probability of poscodes
-        #function(get_sorted_flood_probability) can remove invalid postcodes and duplicates 
-        flood_probability_df = self.get_sorted_flood_probability(postcodes)
-        new_postcodes = flood_probability_df.index.values
-        
-        # Calculate annual_flood_risk of poscodes
-        risk = self.get_annual_flood_risk(new_postcodes, flood_probability_df.values.reshape((-1)))
-        
-        annual_flood_risk = pd.DataFrame({'Postcode': new_postcodes, 'Flood Risk': risk})
-        annual_flood_risk = annual_flood_risk.sort_values(by=['Flood Risk', 'Postcode'], ascending=[False, True])
-        annual_flood_risk.set_index('Postcode', inplace=True)
+        # normalised, looked up and scored once, with invalid postcodes and duplicates removed
+        new_postcodes, _, risk = self._score_postcodes(postcodes)
+        return _sorted_risk_frame(new_postcodes, risk)
+
+
+    @timed('tool.assess', 1)
+    def assess(self, postcodes):
+        """Get the location, probability band, flood cost and annual flood risk of postcodes at once.
+
+        Postcodes are normalised once and each distinct postcode is looked up
+        and scored once, rather than once for each of the query methods, and
+        through the result cache if enabled.
+
+        Parameters
+        ----------
 
-        return annual_flood_risk
+        postcodes: sequence of strs
+            Ordered sequence of N postcodes
+
+        Returns
+        -------
+
+        Assessment
+            Columns of N results in input order, with the sorted views of
+            `get_sorted_flood_probability` and `get_sorted_annual_flood_risk`.
+        """
+        unique, inverse = np.unique(normalise_postcodes(postcodes), return_inverse=True)
+        return Assessment(unique, inverse.reshape(-1), self._postcode_results(unique))
         
         
 